@@ -8,8 +8,12 @@ Agriculture Organization of the United Nations, Rome, 333 p.
 
 """
 
+import copy
+
 import numpy as np
 
+from crop_coefficients_fao56_date import calculate_kcb_max
+
 def adjust_depletion_fraction_p(depletion_fraction: float, reference_et_mm: float):
     """Adjust the depletion fraction based on the value of the reference et.
 
@@ -41,7 +45,7 @@ def update_evaporable_water_storage(evaporable_water_storage: float,
     """
 
     evaporable_water_storage = np.clip(evaporable_water_storage + infiltration, a_min=0.0, a_max=total_evaporable_water_tew)
-    evaporable_water_deficit = np.max(0.0, total_evaporable_water_tew - evaporable_water_storage)
+    evaporable_water_deficit = np.maximum(0.0, total_evaporable_water_tew - evaporable_water_storage)
 
     return evaporable_water_storage, evaporable_water_deficit
 
@@ -87,16 +91,17 @@ def calculate_fraction_exposed_and_wetted_soil_fc(kcb_min: float,
         float: fraction of exposed and wetted soil
     """
 
-    numerator = np.max(kcb - kcb_min, 0.0)
+    numerator = np.maximum(kcb - kcb_min, 0.0)
     denominator = kcb_mid - kcb_min
-    exponent = 1.0 + 0.5 * current_plant_height
+    exponent = 1.0 + 0.5 * current_plant_height_m
 
-    fc = np.where(denominator > 0,
-                 (numerator / denominator)^exponent,
-                 1.0
-                 )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fc = np.where(denominator > 0,
+                     (numerator / denominator)**exponent,
+                     1.0
+                     )
    
-    fc = np.max(fc, minimum_fraction_covered_soil)
+    fc = np.maximum(fc, minimum_fraction_covered_soil)
     fraction_exposed_and_wetted_soil_few = np.clip(1.0 - fc, a_min=0.05, a_max=1.0)
 
     return fraction_exposed_and_wetted_soil_few
@@ -119,10 +124,10 @@ def calculate_surface_evap_coefficient_ke(kcb_max: float,
         float: evaporation coefficient ke
     """
    
-    maximum_value = np.min(1.0, fraction_exposed_and_wetted_soil_few * kcb_max)
-    evaporation_coefficient_ke = np.min(evaporation_reduction_coefficient_kr 
-                                         * (kcb_max - kcb_min),
-                                       maximum_value)
+    maximum_value = np.minimum(1.0, fraction_exposed_and_wetted_soil_few * kcb_max)
+    evaporation_coefficient_ke = np.minimum(evaporation_reduction_coefficient_kr 
+                                             * np.maximum(kcb_max - kcb, 0.0),
+                                           maximum_value)
     return evaporation_coefficient_ke
 
 
@@ -168,9 +173,10 @@ def update_plant_height(kcb_min: float,
     numerator = kcb - kcb_min
     denominator = kcb_mid - kcb_min
 
-    current_plant_height = np.where(kcb > kcb_min,
-                           np.clip(numerator / denominator * mean_plant_height_m, a_min=plant_height_minimum_m, a_max=mean_plant_height_m),
-                           plant_height_minimum_m)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current_plant_height = np.where(kcb > kcb_min,
+                               np.clip(numerator / denominator * mean_plant_height_m, a_min=plant_height_minimum_m, a_max=mean_plant_height_m),
+                               plant_height_minimum_m)
     
     return current_plant_height
 
@@ -201,3 +207,172 @@ def calculate_water_stress_coefficient_ks(total_available_water_taw: float,
                           0.0)
     )
     return ks
+
+
+def calc_actual_et__fao56_two_stage(rainfall, snowmelt, pet, soil_storage, soil_storage_max, fao56):
+    """Return (p_minus_pet, aet) from the FAO-56 dual crop coefficient method, for use alongside the
+       Thornthwaite-Mather methods.
+
+    Args:
+        rainfall: daily rainfall amount (mm)
+        snowmelt: daily snowmelt amount (mm)
+        pet: reference evapotranspiration, ET0 (mm)
+        soil_storage: soil storage at the start of the day (mm)
+        soil_storage_max: soil storage at field capacity, i.e. the total available water (mm)
+        fao56 (FAO56TwoStage): crop and evaporable water state of each cell; updated in place
+
+    Returns:
+        tuple: P - PET and actual ET (mm)
+    """
+    infiltration = rainfall + snowmelt
+    aet = fao56.calculate(infiltration, pet, soil_storage, soil_storage_max)
+    return infiltration - pet, aet
+
+
+class FAO56TwoStage:
+    """Crop parameters and evaporable water state for the FAO-56 two-stage (dual crop coefficient) method.
+
+       Actual ET is the sum of bare-soil evaporation, Ke * ET0, and crop transpiration, Ks * Kcb * ET0
+       (FAO-56 equation 69). Evaporation draws on the evaporable surface layer, tracked here as
+       evaporable_water_storage (TEW minus the evaporation deficit De); transpiration draws on the root zone,
+       whose deficit Dr is soil_storage_max - soil_storage. Every parameter is held as an array with one
+       element per cell, and calculate() advances all cells by one day.
+
+    Args:
+        shape (tuple): grid shape; () for a single cell
+        kcb: current basal crop coefficient; update it each day (e.g. from a Kcb curve) before calculate()
+        kcb_min, kcb_mid, kcb_max: minimum, mid-season and maximum basal crop coefficients
+        total_evaporable_water_tew: TEW (mm)
+        readily_evaporable_water_rew: REW (mm)
+        depletion_fraction_p: soil water depletion fraction for no stress (FAO-56 table 22)
+        mean_plant_height_m: mean maximum plant height (m)
+        minimum_fraction_covered_soil: lower limit for the fraction of soil covered by vegetation
+        evaporable_water_storage: initial evaporable water storage (mm); defaults to TEW (wet surface)
+
+    Scalar arguments are broadcast to the grid shape.
+    """
+
+    def __init__(self, shape=(), kcb=1.0, kcb_min=0.15, kcb_mid=1.0, kcb_max=1.2,
+                 total_evaporable_water_tew=25.0, readily_evaporable_water_rew=9.0, depletion_fraction_p=0.5,
+                 mean_plant_height_m=1.0, minimum_fraction_covered_soil=0.05, evaporable_water_storage=None):
+        self.shape = tuple(shape)
+        self.kcb = self._array(kcb)
+        self.kcb_min = self._array(kcb_min)
+        self.kcb_mid = self._array(kcb_mid)
+        self.kcb_max = self._array(kcb_max)
+        self.total_evaporable_water_tew = self._array(total_evaporable_water_tew)
+        self.readily_evaporable_water_rew = self._array(readily_evaporable_water_rew)
+        self.depletion_fraction_p = self._array(depletion_fraction_p)
+        self.mean_plant_height_m = self._array(mean_plant_height_m)
+        self.minimum_fraction_covered_soil = minimum_fraction_covered_soil
+        self.evaporable_water_storage = self._array(self.total_evaporable_water_tew
+                                                    if evaporable_water_storage is None
+                                                    else evaporable_water_storage)
+
+        # daily values, kept for output
+        self.current_plant_height_m = self._array(0.0)
+        self.fraction_exposed_and_wetted_soil_few = self._array(0.0)
+        self.evaporation_reduction_coefficient_kr = self._array(0.0)
+        self.surface_evap_coefficient_ke = self._array(0.0)
+        self.water_stress_coefficient_ks = self._array(0.0)
+        self.readily_available_water_raw = self._array(0.0)
+        self.bare_soil_evaporation = self._array(0.0)
+        self.crop_transpiration = self._array(0.0)
+
+    def _array(self, values):
+        array = np.empty(self.shape, dtype=np.float64)
+        array[...] = values
+        return array
+
+    def select_rows(self, rows):
+        """Return a copy holding the parameters and state of the cells in grid rows `rows` (a slice), for
+           swb_parallel.run_sharded.
+        """
+        selected = copy.copy(self)
+        for name, values in vars(self).items():
+            if isinstance(values, np.ndarray) and values.shape == self.shape:
+                setattr(selected, name, values[rows].copy())
+        selected.shape = selected.kcb.shape
+        return selected
+
+    @classmethod
+    def from_lookup_table(cls, lookup_table, lu_grid, hsg_grid, active=None, mm_per_table_unit=25.4,
+                          wind_speed_meters_per_sec=2.0, relative_humidity_min_pct=45.0, **kwargs):
+        """Build the parameter arrays by gathering kcb_*, mean_plant_height, tew_n, rew_n and depletion_fraction
+           from a CompiledLookupTable (the IRRIGATION_LOOKUP_TABLE of an SWB2 run).
+
+        Args:
+            lookup_table (CompiledLookupTable): compiled irrigation lookup table
+            lu_grid, hsg_grid: land-use and hydrologic soil group grids
+            active: cells to validate and fill (default: cells with data in both grids); others are NaN
+            mm_per_table_unit (float): conversion of the table's TEW and REW to mm (SWB2 tables are in inches)
+            wind_speed_meters_per_sec, relative_humidity_min_pct: climate used to compute kcb_max from the
+                larger of kcb_mid and kcb_end (FAO-56 equation 72); the defaults are the FAO-56 standard
+                climate (u2 = 2 m/s, RHmin = 45%), for which kcb_max = max(1.2, kcb + 0.05)
+            **kwargs: passed on to FAO56TwoStage
+        """
+        names = ['kcb_min', 'kcb_mid', 'kcb_end', 'mean_plant_height', 'tew', 'rew', 'depletion_fraction']
+        parameters = lookup_table.assign(names, lu_grid, hsg_grid, active=active)
+        kcb_max = calculate_kcb_max(wind_speed_meters_per_sec, relative_humidity_min_pct,
+                                    np.maximum(parameters['kcb_mid'], parameters['kcb_end']),
+                                    parameters['mean_plant_height'])
+        return cls(np.shape(lu_grid),
+                   kcb=parameters['kcb_min'],
+                   kcb_min=parameters['kcb_min'],
+                   kcb_mid=parameters['kcb_mid'],
+                   kcb_max=kcb_max,
+                   total_evaporable_water_tew=parameters['tew'] * mm_per_table_unit,
+                   readily_evaporable_water_rew=parameters['rew'] * mm_per_table_unit,
+                   depletion_fraction_p=parameters['depletion_fraction'],
+                   mean_plant_height_m=parameters['mean_plant_height'],
+                   **kwargs)
+
+    def calculate(self, infiltration, pet, soil_storage, soil_storage_max):
+        """Advance the evaporable water storage by one day and return actual ET (mm) for every cell.
+
+        Args:
+            infiltration: water entering the soil today (mm)
+            pet: reference evapotranspiration, ET0 (mm)
+            soil_storage: root-zone soil storage at the start of the day (mm)
+            soil_storage_max: root-zone storage at field capacity, TAW (mm)
+
+        Returns:
+            array: actual ET (mm), never more than the water available in the root zone
+        """
+        tew = self.total_evaporable_water_tew
+        (storage, deficit) = update_evaporable_water_storage(self.evaporable_water_storage, None,
+                                                             infiltration, tew)
+
+        self.current_plant_height_m[...] = update_plant_height(self.kcb_min, self.kcb_mid, self.kcb,
+                                                               self.mean_plant_height_m)
+        few = calculate_fraction_exposed_and_wetted_soil_fc(self.kcb_min, self.kcb_mid, self.kcb,
+                                                            self.current_plant_height_m,
+                                                            self.minimum_fraction_covered_soil)
+        kr = calculate_evaporation_reduction_coefficient_kr(tew, self.readily_evaporable_water_rew, deficit)
+        ke = calculate_surface_evap_coefficient_ke(self.kcb_max, self.kcb, kr, few)
+
+        p = np.clip(adjust_depletion_fraction_p(self.depletion_fraction_p, pet), 0.1, 0.8)
+        # soil_storage_max already is rooting depth times available water capacity
+        (taw, raw) = (soil_storage_max, p * soil_storage_max)
+        soil_moisture_deficit = np.maximum(soil_storage_max - soil_storage, 0.0)
+        ks = calculate_water_stress_coefficient_ks(taw, raw, soil_moisture_deficit)
+
+        # evaporation cannot exceed the evaporable water; the surface layer loses E / few (FAO-56 equation 77)
+        evaporation = np.minimum(ke * pet, storage * few)
+        transpiration = ks * self.kcb * pet
+        demand = evaporation + transpiration
+        aet = np.minimum(demand, np.maximum(soil_storage + infiltration, 0.0))
+        # where the available water limits ET, both components are reduced in proportion
+        scale = np.where(demand > aet, aet / np.where(demand > 0.0, demand, 1.0), 1.0)
+        evaporation = evaporation * scale
+        transpiration = transpiration * scale
+
+        self.evaporable_water_storage[...] = np.maximum(storage - evaporation / few, 0.0)
+        self.fraction_exposed_and_wetted_soil_few[...] = few
+        self.evaporation_reduction_coefficient_kr[...] = kr
+        self.surface_evap_coefficient_ke[...] = ke
+        self.water_stress_coefficient_ks[...] = ks
+        self.readily_available_water_raw[...] = raw
+        self.bare_soil_evaporation[...] = evaporation
+        self.crop_transpiration[...] = transpiration
+        return aet
@@ -10,6 +10,8 @@ def calc_actual_et(rainfall, snowmelt, pet, soil_storage, soil_storage_max):
     pet                     Potential evapotranspiration (mm).
     soil_storage   
     soil_storage_max        Maximum moisture content of a soil at field capacity.
+
+    Arguments are scalars (one cell); see calc_actual_et_grid for arrays.
     """
 
     p_minus_pet = rainfall + snowmelt - pet
@@ -26,6 +28,25 @@ def calc_actual_et(rainfall, snowmelt, pet, soil_storage, soil_storage_max):
     return(p_minus_pet, aet)
 
 
+def calc_actual_et_grid(rainfall, snowmelt, pet, soil_storage, soil_storage_max):
+    """
+    Array form of calc_actual_et, used by SWBGrid: both branches are evaluated for every cell and each cell
+    keeps the one selected by the sign of P - PET. Arguments are NumPy arrays of matching (or broadcastable)
+    shape.
+    """
+
+    p_minus_pet = rainfall + snowmelt - pet
+
+    # see Alley, 1984, eqn 2.
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        temp_soil_storage = soil_storage * np.exp( p_minus_pet / soil_storage_max )
+
+    # see Alley, 1984, eqn. 1 (P - PET >= 0); otherwise eqn. 2
+    aet = np.where(p_minus_pet >= 0, pet, soil_storage - temp_soil_storage)
+
+    return(p_minus_pet, aet)
+
+
 def actual_et_references():
     """
     Alley, W.M., 1984, On the Treatment of Evapotranspiration, Soil Moisture Accounting, and Aquifer Recharge in Monthly
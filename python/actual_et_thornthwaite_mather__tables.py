@@ -11,6 +11,195 @@ def init__tm_tables(table_path):
     tm = pd.read_csv(table_path)
     return tm
 
+
+class TMTableIndex:
+    """
+    Prebuilt nearest-row lookup index for a Thornthwaite-Mather soil-moisture retention table.
+
+    Each lookup direction (soil storage -> APWL and APWL -> soil storage) keeps its key column as a
+    sorted NumPy array, so finding the nearest table row is a binary search (np.searchsorted) rather
+    than a sort of the entire table. Lookups accept scalars or arrays; scalar queries return scalars.
+    The row returned is the one whose key is nearest the query value; when several rows are equally near
+    (an APWL query of exactly x.5 mm, or a key repeated in the table), it is the first of them in table
+    order, i.e. the first entry of (tm_df[col] - value).abs().argsort(kind='stable'). The former lookup
+    used the default (quicksort) argsort, which at such ties may return a different row, so results can
+    differ from it there.
+
+    tm_df                   Thornthwaite-Mather soil moisture retention table (Pandas dataframe).
+    soil_storage_column     Name of the soil storage column to index (default: 'sz_300_calc').
+    apwl_column             Name of the accumulated potential water loss column (default: 'apwl_mm').
+    """
+
+    def __init__(self, tm_df, soil_storage_column='sz_300_calc', apwl_column='apwl_mm'):
+        table = tm_df[[apwl_column, soil_storage_column]].dropna()
+        self.apwl = table[apwl_column].to_numpy(dtype=np.float64)
+        self.soil_storage = table[soil_storage_column].to_numpy(dtype=np.float64)
+
+        (self._apwl_sorted, self._apwl_order, self._apwl_run_start) = self._sorted_keys(self.apwl)
+        (self._soil_storage_sorted, self._soil_storage_order,
+         self._soil_storage_run_start) = self._sorted_keys(self.soil_storage)
+
+    @staticmethod
+    def _sorted_keys(keys):
+        # a stable sort keeps repeated keys in table order; run_start maps each sorted position to the
+        # first position holding the same key, so the first of the repeated rows is returned
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        run_start = np.searchsorted(sorted_keys, sorted_keys)
+        return sorted_keys, order, run_start
+
+    @staticmethod
+    def _nearest_row(sorted_keys, order, run_start, values):
+        values = np.asarray(values, dtype=np.float64)
+        upper = np.clip(np.searchsorted(sorted_keys, values), 1, sorted_keys.size - 1)
+        lower = run_start[upper - 1]
+        distance_lower = np.abs(values - sorted_keys[lower])
+        distance_upper = np.abs(sorted_keys[upper] - values)
+        row = np.where(distance_lower < distance_upper, order[lower],
+                       np.where(distance_upper < distance_lower, order[upper],
+                                np.minimum(order[lower], order[upper])))
+        return row
+
+    def apwl_from_soil_storage(self, soil_storage):
+        """Return the APWL value from the table row whose soil storage is nearest `soil_storage`."""
+        row = self._nearest_row(self._soil_storage_sorted, self._soil_storage_order,
+                               self._soil_storage_run_start, soil_storage)
+        return self.apwl[row][()]
+
+    def soil_storage_from_apwl(self, apwl):
+        """Return the soil storage value from the table row whose APWL is nearest `apwl`."""
+        row = self._nearest_row(self._apwl_sorted, self._apwl_order, self._apwl_run_start, apwl)
+        return self.soil_storage[row][()]
+
+class TMRetentionCurves:
+    """
+    Cache of dense Thornthwaite-Mather soil-moisture retention curves, one per distinct soil_storage_max.
+
+    Every tabulated column of the form 'sz_<capacity>' (sz_25, sz_50, ... sz_300) is normalized by its
+    capacity, so that the retained fraction (soil storage / capacity) is expressed as a function of the
+    normalized APWL (APWL / capacity). Because the published tables are rounded to whole millimeters, each
+    run of repeated values is collapsed to a single knot at the center of the run; beyond the last
+    tabulated value the curve continues with the exponential decay of Alley (1984).
+
+    The curve for an arbitrary soil_storage_max is interpolated (linearly in capacity) between the two
+    bracketing table columns; capacities outside the tabulated range use the nearest column. Each curve is
+    stored on a uniform grid in both directions (APWL -> soil storage and soil storage -> APWL), so that
+    evaluating the curves for any number of cells is a direct index plus linear interpolation.
+
+    Curves are computed once per capacity and shared by every cell with that capacity; cells refer to them
+    through integer curve ids returned by curve_ids().
+
+    tm_df                   Thornthwaite-Mather soil moisture retention table (Pandas dataframe).
+    apwl_column             Name of the accumulated potential water loss column (default: 'apwl_mm').
+    capacity_resolution     Capacities are rounded to this increment (mm) before lookup in the cache.
+    normalized_apwl_max     Largest normalized APWL (APWL / capacity) represented on the dense grid.
+    number_of_points        Number of points on each dense curve.
+    """
+
+    def __init__(self, tm_df, apwl_column='apwl_mm', capacity_resolution=0.01,
+                 normalized_apwl_max=20., number_of_points=8001):
+        self.capacity_resolution = capacity_resolution
+        self.normalized_apwl = np.linspace(0., normalized_apwl_max, number_of_points)
+        self._apwl_step = self.normalized_apwl[1]
+
+        columns = sorted((int(col[3:]), col) for col in tm_df.columns
+                         if col.startswith('sz_') and col[3:].isdigit())
+        self.table_capacities = np.array([capacity for capacity, _ in columns], dtype=np.float64)
+        self._table_fractions = np.vstack([self._normalized_table_curve(tm_df[apwl_column].to_numpy(dtype=np.float64),
+                                                                        tm_df[col].to_numpy(dtype=np.float64),
+                                                                        capacity)
+                                           for capacity, col in columns])
+
+        # -ln(fraction) is very nearly linear in normalized APWL, so a uniform grid in that
+        # variable resolves the inverse lookup evenly from saturated to nearly dry soils
+        max_loss = -np.log(self._table_fractions[:, -1]).max()
+        self.log_loss = np.linspace(0., max_loss, number_of_points)
+        self._log_loss_step = self.log_loss[1]
+
+        self.capacities = np.zeros(0, dtype=np.float64)
+        self._fractions = np.zeros((0, number_of_points), dtype=np.float64)
+        self._inverse = np.zeros((0, number_of_points), dtype=np.float64)
+        self._curve_id_by_capacity = {}
+
+    def _normalized_table_curve(self, apwl, soil_storage, capacity):
+        valid = ~np.isnan(soil_storage)
+        apwl = apwl[valid]
+        soil_storage = soil_storage[valid]
+
+        # collapse runs of repeated (rounded) values to a knot at the center of each run; the first
+        # run is anchored at its start (APWL = 0) and the last at its start, since the table is truncated
+        run_starts = np.flatnonzero(np.r_[True, np.diff(soil_storage) != 0])
+        run_ends = np.r_[run_starts[1:], soil_storage.size] - 1
+        knot_apwl = (apwl[run_starts] + apwl[run_ends]) / 2.
+        knot_apwl[0] = apwl[run_starts[0]]
+        knot_apwl[-1] = apwl[run_starts[-1]]
+        knot_fraction = soil_storage[run_starts] / capacity
+        knot_x = knot_apwl / capacity
+
+        fraction = np.interp(self.normalized_apwl, knot_x, knot_fraction)
+        tail = self.normalized_apwl > knot_x[-1]
+        fraction[tail] = knot_fraction[-1] * np.exp(-(self.normalized_apwl[tail] - knot_x[-1]))
+        return fraction
+
+    def _add_curve(self, capacity):
+        upper = np.clip(np.searchsorted(self.table_capacities, capacity), 1, self.table_capacities.size - 1)
+        lower = upper - 1
+        weight = np.clip((capacity - self.table_capacities[lower])
+                         / (self.table_capacities[upper] - self.table_capacities[lower]), 0., 1.)
+        fraction = (1. - weight) * self._table_fractions[lower] + weight * self._table_fractions[upper]
+        inverse = np.interp(self.log_loss, -np.log(fraction), self.normalized_apwl)
+
+        self.capacities = np.append(self.capacities, capacity)
+        self._fractions = np.vstack((self._fractions, fraction))
+        self._inverse = np.vstack((self._inverse, inverse))
+        self._curve_id_by_capacity[capacity] = self.capacities.size - 1
+
+    def curve_ids(self, soil_storage_max):
+        """
+        Return the curve id (an integer array, or an integer for scalar input) for each value of
+        soil_storage_max, computing and caching a curve for any capacity not seen before.
+        """
+        rounded = np.round(np.asarray(soil_storage_max, dtype=np.float64) / self.capacity_resolution) \
+                  * self.capacity_resolution
+        unique_capacities, inverse = np.unique(rounded.ravel(), return_inverse=True)
+        ids = np.empty(unique_capacities.size, dtype=np.intp)
+        for i, capacity in enumerate(unique_capacities):
+            capacity = float(capacity)
+            if capacity not in self._curve_id_by_capacity:
+                self._add_curve(capacity)
+            ids[i] = self._curve_id_by_capacity[capacity]
+        return ids[inverse].reshape(rounded.shape)[()]
+
+    @staticmethod
+    def _interpolate(table, curve_ids, position):
+        index = np.clip(np.floor(position), 0, table.shape[1] - 2).astype(np.intp)
+        weight = np.clip(position - index, 0., 1.)
+        return table[curve_ids, index] * (1. - weight) + table[curve_ids, index + 1] * weight
+
+    def soil_storage_from_apwl(self, curve_ids, apwl):
+        """Return soil storage (mm) for the given APWL (mm) on each cell's retention curve."""
+        capacity = self.capacities[curve_ids]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            position = np.where(capacity > 0., np.asarray(apwl) / capacity, 0.) / self._apwl_step
+        fraction = self._interpolate(self._fractions, curve_ids, position)
+        return np.where(capacity > 0., capacity * fraction, 0.)[()]
+
+    def apwl_from_soil_storage(self, curve_ids, soil_storage):
+        """Return APWL (mm) for the given soil storage (mm) on each cell's retention curve."""
+        capacity = self.capacities[curve_ids]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.clip(np.where(capacity > 0., np.asarray(soil_storage) / capacity, 1.), 1.0e-300, 1.)
+        position = -np.log(fraction) / self._log_loss_step
+        normalized_apwl = self._interpolate(self._inverse, curve_ids, position)
+        return np.where(capacity > 0., capacity * normalized_apwl, 0.)[()]
+
+    def retention_curve(self, soil_storage_max):
+        """Return (apwl, soil_storage) arrays describing the dense curve for one soil_storage_max."""
+        curve_id = self.curve_ids(soil_storage_max)
+        capacity = self.capacities[curve_id]
+        return self.normalized_apwl * capacity, self._fractions[curve_id] * capacity
+
+
 def thornthwaite_mather_soil_moisture_millimeters(max_soil_moisture, apwl):
     """
     Return the current soil moisture (in millimeters) given the current soil moisture maximum (in millimeters),
@@ -65,8 +254,8 @@ def calc_actual_et__tm_eqns(rainfall, snowmelt, pet, previous_apwl, soil_storage
     pet                     Potential evapotranspiration (mm).
     previous_apwl           Previous timestep's accumulated potential water loss (mm).
     soil_storage            Amount of moisture in soil storage reservoir (mm)   
-    tm_df                   Thornthwaite-Mather soil moisture retention values from Table 10, 
-                            Thornthwaite and Mather (1957). Pandas dataframe.
+
+    Arguments are scalars (one cell); see calc_actual_et__tm_eqns_grid for arrays.
     """
 
     p_minus_pet = rainfall + snowmelt - pet
@@ -101,6 +290,33 @@ def calc_actual_et__tm_eqns(rainfall, snowmelt, pet, previous_apwl, soil_storage
     return(p_minus_pet, apwl, aet)
 
 
+def calc_actual_et__tm_eqns_grid(rainfall, snowmelt, pet, previous_apwl, soil_storage):
+    """
+    Array form of calc_actual_et__tm_eqns, used by SWBGrid: both branches are evaluated for every cell and
+    each cell keeps the one selected by the sign of P - PET. Arguments are NumPy arrays of matching (or
+    broadcastable) shape.
+    """
+
+    p_minus_pet = rainfall + snowmelt - pet
+    is_surplus = p_minus_pet >= 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # P - PET >= 0 (300mm soil moisture tables only, as above)
+        surplus_soil_storage = np.minimum(300., soil_storage + p_minus_pet)
+        surplus_apwl = thornthwaite_mather_accumulated_potential_water_loss_millimeters(300., surplus_soil_storage)
+
+        # P - PET < 0
+        apwl_temp = thornthwaite_mather_accumulated_potential_water_loss_millimeters(300., soil_storage)
+        deficit_apwl = apwl_temp + np.abs(p_minus_pet)
+        deficit_soil_storage = thornthwaite_mather_soil_moisture_millimeters(300., deficit_apwl)
+
+    apwl = np.where(is_surplus, surplus_apwl, deficit_apwl)
+    aet = np.where(is_surplus, pet, soil_storage - deficit_soil_storage)
+
+    return(p_minus_pet, apwl, aet)
+
+
 
 def calc_actual_et__tm_tables(rainfall, snowmelt, pet, previous_apwl, soil_storage, tm_df):
     """
@@ -118,37 +334,84 @@ def calc_actual_et__tm_tables(rainfall, snowmelt, pet, previous_apwl, soil_stora
     previous_apwl           Previous timestep's accumulated potential water loss (mm).
     soil_storage            Amount of moisture in soil storage reservoir (mm)   
     tm_df                   Thornthwaite-Mather soil moisture retention values from Table 10, 
-                            Thornthwaite and Mather (1957). Pandas dataframe.
+                            Thornthwaite and Mather (1957). Either a TMTableIndex or a Pandas dataframe;
+                            callers making repeated calls should build the TMTableIndex once and pass it in.
+
+    Arguments may be scalars or NumPy arrays of matching (or broadcastable) shape.
     """
 
+    tm_index = tm_df if isinstance(tm_df, TMTableIndex) else TMTableIndex(tm_df)
+
     p_minus_pet = rainfall + snowmelt - pet
+    is_surplus = p_minus_pet >= 0
 
-    if p_minus_pet >= 0:
+    # P - PET >= 0:
+    # update soil moisture amount with P - PET; back-calculate a new APWL value from the 
+    # updated soil moisture amount
 
-        # update soil moisture amount with P - PET; back-calculate a new APWL value from the 
-        # updated soil moisture amount
+    # alert!! this entire function is hardwired to work *only* with the 300mm soil moisture tables
+    surplus_soil_storage = np.minimum(300., soil_storage + p_minus_pet)
+    surplus_apwl = tm_index.apwl_from_soil_storage(surplus_soil_storage)
 
-        # alert!! this entire function is hardwired to work *only* with the 300mm soil moisture tables
-        temp_soil_storage = np.min((300., soil_storage + p_minus_pet))
-        apwl = tm_df.iloc[(tm_df['sz_300_calc']-temp_soil_storage).abs().argsort()[:1]]['apwl_mm'].values[0]
-        aet = pet
-    else:
+    # P - PET < 0:
+    # update apwl; look up resulting soil moisture value
+    # apwl terms are positive in the tables
 
-        # update apwl; look up resulting soil moisture value
-        # apwl terms are positive in the tables
+    # Thornthwaite notes that: "Since the values of P-PE are not accumulated as in the case of monthly
+    #                           calculations, it is necessary to accumulate them as the work is carried
+    #                           out by finding the value of the soil moisture storage in the body of the
+    #                           table and then counting ahead by a number equal to the value of P-PE to
+    #                           obtain the new value of soil moisture storage.
 
-        # Thornthwaite notes that: "Since the values of P-PE are not accumulated as in the case of monthly
-        #                           calculations, it is necessary to accumulate them as the work is carried
-        #                           out by finding the value of the soil moisture storage in the body of the
-        #                           table and then counting ahead by a number equal to the value of P-PE to
-        #                           obtain the new value of soil moisture storage.
+    apwl_temp = tm_index.apwl_from_soil_storage(soil_storage)
 
-        apwl_temp = tm_df.iloc[(tm_df['sz_300_calc']-soil_storage).abs().argsort()[:1]]['apwl_mm'].values[0]
+    deficit_apwl = apwl_temp + np.abs(p_minus_pet)
+    deficit_soil_storage = tm_index.soil_storage_from_apwl(deficit_apwl)
 
-        apwl = apwl_temp + np.abs(p_minus_pet)
-        temp_soil_storage = tm_df.iloc[(tm_df['apwl_mm']-apwl).abs().argsort()[:1]]['sz_300_calc'].values[0]
+    apwl = np.where(is_surplus, surplus_apwl, deficit_apwl)[()]
+    aet = np.where(is_surplus, pet, soil_storage - deficit_soil_storage)[()]
 
-        aet = soil_storage - temp_soil_storage
+    return(p_minus_pet, apwl, aet)
+
+
+def calc_actual_et__tm_curves(rainfall, snowmelt, pet, soil_storage, soil_storage_max, tm_curves, curve_ids=None):
+    """
+    Return P - PET, the updated APWL, and actual ET (all in mm) using the Thornthwaite-Mather
+    soil-moisture retention curve appropriate to each cell's soil_storage_max.
+
+    This generalizes calc_actual_et__tm_tables to arbitrary soil reservoir sizes: rather than the
+    single 300mm table column, each capacity is evaluated against a dense retention curve interpolated
+    from every 'sz_' column of the table and shared by all cells having the same capacity.
+
+    rainfall                Daily rainfall amount (mm).
+    snowmelt                Daily snowmelt amount (mm).
+    pet                     Potential evapotranspiration (mm).
+    soil_storage            Amount of moisture in soil storage reservoir (mm).
+    soil_storage_max        Maximum moisture content of the soil at field capacity (mm).
+    tm_curves               TMRetentionCurves object holding the cached retention curves.
+    curve_ids               Curve ids for soil_storage_max, as returned by tm_curves.curve_ids(). Callers
+                            making repeated calls for the same cells should compute these once.
+
+    Arguments may be scalars or NumPy arrays of matching (or broadcastable) shape.
+    """
+
+    if curve_ids is None:
+        curve_ids = tm_curves.curve_ids(soil_storage_max)
+
+    p_minus_pet = rainfall + snowmelt - pet
+    is_surplus = p_minus_pet >= 0
+
+    # P - PET >= 0: add the surplus to soil storage and back-calculate APWL from the result
+    surplus_soil_storage = np.minimum(soil_storage_max, soil_storage + p_minus_pet)
+    surplus_apwl = tm_curves.apwl_from_soil_storage(curve_ids, surplus_soil_storage)
+
+    # P - PET < 0: find the APWL corresponding to current soil storage, count ahead by P - PET,
+    # and look up the resulting soil moisture value
+    deficit_apwl = tm_curves.apwl_from_soil_storage(curve_ids, soil_storage) + np.abs(p_minus_pet)
+    deficit_soil_storage = tm_curves.soil_storage_from_apwl(curve_ids, deficit_apwl)
+
+    apwl = np.where(is_surplus, surplus_apwl, deficit_apwl)[()]
+    aet = np.where(is_surplus, pet, soil_storage - deficit_soil_storage)[()]
 
     return(p_minus_pet, apwl, aet)
 
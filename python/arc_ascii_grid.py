@@ -0,0 +1,183 @@
+"""
+Reader for Arc ASCII grids (.asc), the format of the SWB2 gridded inputs (HSG, land use, AWC, ...).
+
+The header gives ncols, nrows, xllcorner (or xllcenter), yllcorner (or yllcenter), cellsize and, optionally,
+NODATA_value; the values follow in rows, north to south. Parsing the text is slow, so grids are normally
+opened with cached_arc_ascii_grid, which converts each grid once to a compact binary file and memory-maps it.
+"""
+
+import json
+import os
+import pathlib as pl
+
+import numpy as np
+
+
+ARC_ASCII_HEADER_KEYS = ('ncols', 'nrows', 'xllcorner', 'yllcorner', 'xllcenter', 'yllcenter',
+                         'cellsize', 'nodata_value')
+
+
+class ArcASCIIGrid:
+    """
+    Values and georeferencing of an Arc ASCII grid. `values` has shape (nrows, ncols), with row 0 the
+    northern-most row; cells equal to nodata_value are left as they are.
+    """
+
+    def __init__(self, values, xllcorner, yllcorner, cellsize, nodata_value=None):
+        self.values = values
+        self.xllcorner = float(xllcorner)
+        self.yllcorner = float(yllcorner)
+        self.cellsize = float(cellsize)
+        self.nodata_value = nodata_value
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nrows(self):
+        return self.values.shape[0]
+
+    @property
+    def ncols(self):
+        return self.values.shape[1]
+
+    @property
+    def nodata_mask(self):
+        if self.nodata_value is None:
+            return np.zeros(self.shape, dtype=bool)
+        return self.values == self.nodata_value
+
+
+def read_arc_ascii_header(f):
+    """Read the header lines from an open file; return (header dict with lower-case keys, first data line)."""
+    header = {}
+    while True:
+        line = f.readline()
+        fields = line.split()
+        if not fields or fields[0].lower() not in ARC_ASCII_HEADER_KEYS:
+            return header, line
+        header[fields[0].lower()] = float(fields[1])
+
+
+def read_arc_ascii_grid(filename, dtype=np.float64):
+    """Read an Arc ASCII grid, returning an ArcASCIIGrid with values of the given dtype."""
+    with open(filename) as f:
+        (header, first_line) = read_arc_ascii_header(f)
+        text = first_line + f.read()
+
+    (nrows, ncols) = (int(header['nrows']), int(header['ncols']))
+    values = np.array(text.split(), dtype=np.float64)
+    if values.size != nrows * ncols:
+        raise ValueError(f"{filename}: expected {nrows * ncols} values ({nrows} rows x {ncols} columns), "
+                         f"found {values.size}")
+
+    cellsize = header['cellsize']
+    # grids may be registered by the center of the lower-left cell rather than its corner
+    xllcorner = header['xllcorner'] if 'xllcorner' in header else header['xllcenter'] - cellsize / 2.
+    yllcorner = header['yllcorner'] if 'yllcorner' in header else header['yllcenter'] - cellsize / 2.
+
+    nodata_value = header.get('nodata_value')
+    values = values.reshape(nrows, ncols).astype(dtype, copy=False)
+    if nodata_value is not None:
+        nodata_value = np.asarray(nodata_value).astype(dtype)[()]
+    return ArcASCIIGrid(values, xllcorner, yllcorner, cellsize, nodata_value)
+
+
+def smallest_dtype(values, nodata_value=None):
+    """
+    Return the smallest dtype that holds the valid (non-nodata) values exactly: an integer type for integral
+    grids (HSG, land use), keeping the type's largest value free for nodata, and float32 otherwise.
+    """
+    nodata = values == nodata_value if nodata_value is not None else np.zeros(values.shape, dtype=bool)
+    valid = values[~nodata]
+    if valid.size == 0:
+        return np.dtype(np.uint8)
+    if not np.all(np.mod(valid, 1.) == 0.):
+        return np.dtype(np.float32)
+
+    (low, high) = (valid.min(), valid.max())
+    reserve = 1 if nodata.any() else 0
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32):
+        info = np.iinfo(dtype)
+        if low >= info.min and high <= info.max - reserve:
+            return np.dtype(dtype)
+    return np.dtype(np.float64)
+
+
+def _cache_paths(filename, cache_directory):
+    filename = pl.Path(filename)
+    directory = pl.Path(cache_directory) if cache_directory is not None else filename.parent
+    return directory / f'{filename.name}.npy', directory / f'{filename.name}.json'
+
+
+def _source_signature(filename):
+    status = os.stat(filename)
+    return {'source': str(pl.Path(filename).resolve()), 'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+
+def write_arc_ascii_grid_cache(filename, dtype=None, cache_directory=None):
+    """
+    Parse an Arc ASCII grid and save its values as a native binary .npy file (of `dtype`, or the smallest
+    dtype that fits, see smallest_dtype) plus a .json file holding the georeferencing and the size and
+    modification time of the source. Returns the (npy, json) paths.
+    """
+    grid = read_arc_ascii_grid(filename)
+    requested_dtype = None if dtype is None else np.dtype(dtype).str
+    dtype = np.dtype(dtype) if dtype is not None else smallest_dtype(grid.values, grid.nodata_value)
+
+    values = grid.values
+    nodata_value = grid.nodata_value
+    if nodata_value is not None and np.issubdtype(dtype, np.integer):
+        # the nodata value rarely fits the small integer types; store it as the type's largest value
+        nodata = values == nodata_value
+        nodata_value = int(np.iinfo(dtype).max) if nodata.any() else None
+        values = np.where(nodata, nodata_value, values) if nodata.any() else values
+
+    (npy_path, json_path) = _cache_paths(filename, cache_directory)
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write to temporary names and rename, so concurrent readers never see a partial cache
+    temporary_npy = npy_path.with_name(f'{npy_path.name}.{os.getpid()}.tmp')
+    temporary_json = json_path.with_name(f'{json_path.name}.{os.getpid()}.tmp')
+    with open(temporary_npy, 'wb') as f:
+        np.save(f, values.astype(dtype))
+    with open(temporary_json, 'w') as f:
+        json.dump({**_source_signature(filename), 'requested_dtype': requested_dtype, 'dtype': dtype.str,
+                   'xllcorner': grid.xllcorner, 'yllcorner': grid.yllcorner, 'cellsize': grid.cellsize,
+                   'nodata_value': None if nodata_value is None else float(nodata_value)}, f, indent=2)
+    os.replace(temporary_npy, npy_path)
+    os.replace(temporary_json, json_path)
+    return npy_path, json_path
+
+
+def cached_arc_ascii_grid(filename, dtype=None, cache_directory=None):
+    """
+    Return an ArcASCIIGrid whose values are a read-only np.memmap of a binary cache of the grid.
+
+    The cache (<name>.asc.npy and <name>.asc.json, in cache_directory or beside the grid) is written on first
+    use and rewritten whenever the size or modification time of the .asc file changes, or a different dtype
+    is requested. Every process that opens the grid this way shares one copy of it in the page cache.
+    """
+    (npy_path, json_path) = _cache_paths(filename, cache_directory)
+    requested_dtype = None if dtype is None else np.dtype(dtype).str
+
+    metadata = None
+    if npy_path.exists() and json_path.exists():
+        with open(json_path) as f:
+            metadata = json.load(f)
+        signature = _source_signature(filename)
+        if any(metadata.get(key) != signature[key] for key in ('size', 'mtime_ns')) or \
+                metadata.get('requested_dtype') != requested_dtype:
+            metadata = None
+
+    if metadata is None:
+        write_arc_ascii_grid_cache(filename, dtype=dtype, cache_directory=cache_directory)
+        with open(json_path) as f:
+            metadata = json.load(f)
+
+    values = np.load(npy_path, mmap_mode='r')
+    nodata_value = metadata['nodata_value']
+    if nodata_value is not None:
+        nodata_value = np.asarray(nodata_value).astype(values.dtype)[()]
+    return ArcASCIIGrid(values, metadata['xllcorner'], metadata['yllcorner'], metadata['cellsize'], nodata_value)
@@ -0,0 +1,356 @@
+"""
+Benchmarks of the SWB water-budget engines and their process functions.
+
+Each benchmark runs a model component over a number of cell-days: the daily series of one of the bundled
+station records (Kenai Airport, the Minnesota PRISM cell) for the single-cell code, or a synthetic grid of
+--cells cells driven by the Kenai record for the grid code. The throughput (cell-days per second, from the
+fastest of --repeat timed runs) and the peak memory allocated by Python and NumPy during one further run
+(measured with tracemalloc) are printed and, with --output, saved as JSON together with the git commit, so
+results can be compared across commits:
+
+    python benchmark_swb.py --output before.json
+    ... change the code ...
+    python benchmark_swb.py --output after.json --compare before.json
+
+Benchmarks are registered with the @benchmark decorator. A benchmark function receives the BenchmarkInputs and
+returns (setup, number_of_cell_days); setup() does the untimed preparation (building cells, grids, tables) and
+returns the function that is timed.
+"""
+
+import argparse
+import datetime as dt
+import fnmatch
+import json
+import pathlib as pl
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from actual_et_thornthwaite_mather__tables import TMRetentionCurves, TMTableIndex
+from extraterrestrial_radiation_cache import ExtraterrestrialRadiationCache
+from growing_degree_day import update_growing_degree_day
+from partition_daily_precipitation import partition_daily_precip, partition_daily_precip_grid
+from pet_hargreaves_samani import calculate_et0_hargreaves_samani, calculate_et0_hargreaves_samani_grid
+from potential_snowmelt import calculate_potential_snowmelt, calculate_potential_snowmelt_grid
+from swb_cell import SWBCell
+from swb_grid import SWBGrid
+from weather_table import cached_weather_table
+
+
+TEST_DATA_DIRECTORY = pl.Path(__file__).resolve().parent.parent / 'test_data'
+
+STATION_RECORDS = {
+    'kenai': ('daily_weather_data__Kenai_Apt_thru_2014_w_Soldotna_thru_2023_corrected_date.txt', 60.57154),
+    'prism': ('Minnesota_PRISM_daily_weather__US-Ro6__col_358__row_519__x_232693__y_2415326.tsv', 44.7),
+}
+
+TM_TABLE_FILENAME = 'Thornthwaite_soil_moisture_retention_tables__millimeters.csv'
+
+CELL_METHODS = ('tm_exp', 'tm_eqns', 'tm_table', 'tm_curves')
+GRID_METHODS = ('tm_exp', 'tm_eqns', 'tm_curves')
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function under `name`, by convention <component>/<variant>/<input>."""
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class BenchmarkInputs:
+    """
+    Inputs shared by the benchmarks.
+
+    record_days     Days of each station record to use (0 for the whole record).
+    number_of_cells Cells of the synthetic grid.
+    grid_days       Days simulated on the synthetic grid.
+    """
+
+    def __init__(self, record_days=3650, number_of_cells=100_000, grid_days=60, test_data_directory=None,
+                 cache_directory=None):
+        directory = pl.Path(test_data_directory) if test_data_directory is not None else TEST_DATA_DIRECTORY
+        self.records = {}
+        self.latitudes = {}
+        for name, (filename, latitude) in STATION_RECORDS.items():
+            table = cached_weather_table(directory / filename, cache_directory=cache_directory)
+            if record_days:
+                table = next(table.windows(record_days))
+            self.records[name] = table
+            self.latitudes[name] = latitude
+        self.tm_df = pd.read_csv(directory / TM_TABLE_FILENAME)
+
+        self.number_of_cells = number_of_cells
+        self.grid_days = min(grid_days, len(self.records['kenai']))
+        rng = np.random.default_rng(0)
+        self.grid_latitude = rng.uniform(42., 62., number_of_cells)
+        # soil and land-use grids hold few distinct values, so these are drawn from short lists
+        self.grid_available_water_capacity = rng.choice(np.linspace(50., 300., 26), number_of_cells)
+        self.grid_rooting_depth = rng.choice(np.linspace(0.3, 2.0, 8), number_of_cells)
+        # spatial variation added to the station record: a temperature offset and a precipitation multiplier
+        self.grid_temperature_offset = rng.normal(0., 2., number_of_cells)
+        self.grid_precip_factor = rng.uniform(0.5, 1.5, number_of_cells)
+
+
+def _record_columns(table):
+    measures = table.date_measures
+    return (measures.year.tolist(), measures.month.tolist(), measures.day.tolist(),
+            *(np.asarray(values).tolist() for values in (table.tmin_c, table.tmax_c, table.tmean_c, table.precip_mm)))
+
+
+def _cell_benchmark(method, record):
+    def cell_water_budget(inputs):
+        table = inputs.records[record]
+        columns = _record_columns(table)
+
+        def setup():
+            cell = SWBCell(inputs.latitudes[record], 300., 1.0, method,
+                           thornthwaite_mather_df=inputs.tm_df if method in ('tm_table', 'tm_curves') else None)
+            cell.init_swb_cell()
+
+            def run():
+                for (year, month, day, tmin, tmax, tmean, precip) in zip(*columns):
+                    cell.calc_cell_water_budget(year, month, day, tmin, tmax, tmean, precip)
+            return run
+        return setup, len(table)
+    return cell_water_budget
+
+
+for _method in CELL_METHODS:
+    for _record in STATION_RECORDS:
+        benchmark(f'cell_water_budget/{_method}/{_record}')(_cell_benchmark(_method, _record))
+
+
+def _grid_benchmark(method):
+    def grid_water_budget(inputs):
+        table = inputs.records['kenai']
+        (year, month, day, tmin, tmax, tmean, precip) = _record_columns(table)
+
+        def setup():
+            grid = SWBGrid(inputs.grid_latitude, inputs.grid_available_water_capacity, inputs.grid_rooting_depth,
+                           method, thornthwaite_mather_df=inputs.tm_df if method == 'tm_curves' else None,
+                           radiation_cache=ExtraterrestrialRadiationCache(latitude_resolution=0.01))
+            grid.init_swb_grid()
+            (tmin_grid, tmax_grid, tmean_grid, precip_grid) = (np.empty(inputs.number_of_cells) for _ in range(4))
+
+            def run():
+                for k in range(inputs.grid_days):
+                    np.add(inputs.grid_temperature_offset, tmin[k], out=tmin_grid)
+                    np.add(inputs.grid_temperature_offset, tmax[k], out=tmax_grid)
+                    np.add(inputs.grid_temperature_offset, tmean[k], out=tmean_grid)
+                    np.multiply(inputs.grid_precip_factor, precip[k], out=precip_grid)
+                    grid.calc_grid_water_budget(year[k], month[k], day[k], tmin_grid, tmax_grid, tmean_grid,
+                                                precip_grid)
+            return run
+        return setup, inputs.number_of_cells * inputs.grid_days
+    return grid_water_budget
+
+
+for _method in GRID_METHODS:
+    benchmark(f'grid_water_budget/{_method}/synthetic')(_grid_benchmark(_method))
+
+
+def _scalar_benchmark(function, record):
+    # a process function called once per day with Python floats, as SWBCell calls it
+    def scalar_benchmark(inputs):
+        table = inputs.records[record]
+        measures = table.date_measures
+        columns = (measures.day_of_year.tolist(), measures.number_of_days_in_year.tolist(),
+                   np.asarray(table.tmin_c).tolist(), np.asarray(table.tmax_c).tolist(),
+                   np.asarray(table.tmean_c).tolist(), np.asarray(table.precip_mm).tolist())
+        latitude = inputs.latitudes[record]
+
+        def setup():
+            def run():
+                for day in zip(*columns):
+                    function(latitude, *day)
+            return run
+        return setup, len(table)
+    return scalar_benchmark
+
+
+SCALAR_FUNCTIONS = {
+    'calculate_et0_hargreaves_samani':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip:
+            calculate_et0_hargreaves_samani(doy, days, latitude, tmin, tmax, tmean),
+    'partition_daily_precip':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip: partition_daily_precip(precip, tmin, tmax, tmean),
+    'calculate_potential_snowmelt':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip: calculate_potential_snowmelt(tmean, tmax),
+    'update_growing_degree_day':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip: update_growing_degree_day(tmin, tmax),
+}
+
+for _name, _function in SCALAR_FUNCTIONS.items():
+    for _record in STATION_RECORDS:
+        benchmark(f'{_name}/scalar/{_record}')(_scalar_benchmark(_function, _record))
+
+
+def _grid_day_columns(inputs):
+    table = inputs.records['kenai']
+    measures = table.date_measures
+    return [(int(measures.day_of_year[k]), int(measures.number_of_days_in_year[k]), inputs.grid_temperature_offset
+             + table.tmin_c[k], inputs.grid_temperature_offset + table.tmax_c[k],
+             inputs.grid_temperature_offset + table.tmean_c[k], inputs.grid_precip_factor * table.precip_mm[k])
+            for k in range(inputs.grid_days)]
+
+
+GRID_FUNCTIONS = {
+    'calculate_et0_hargreaves_samani':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip:
+            calculate_et0_hargreaves_samani_grid(doy, days, latitude, tmin, tmax, tmean),
+    'partition_daily_precip':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip:
+            partition_daily_precip_grid(precip, tmin, tmax, tmean),
+    'calculate_potential_snowmelt':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip: calculate_potential_snowmelt_grid(tmean, tmax),
+    'update_growing_degree_day':
+        lambda latitude, doy, days, tmin, tmax, tmean, precip: update_growing_degree_day(tmin, tmax),
+}
+
+
+def _vector_benchmark(function):
+    # a process function called once per day with arrays of every cell of the synthetic grid
+    def vector_benchmark(inputs):
+        def setup():
+            days = _grid_day_columns(inputs)
+
+            def run():
+                for day in days:
+                    function(inputs.grid_latitude, *day)
+            return run
+        return setup, inputs.number_of_cells * inputs.grid_days
+    return vector_benchmark
+
+
+for _name, _function in GRID_FUNCTIONS.items():
+    benchmark(f'{_name}/grid/synthetic')(_vector_benchmark(_function))
+
+
+@benchmark('tm_table_index/scalar/kenai')
+def tm_table_index_scalar(inputs):
+    # the nearest-row lookups made by calc_actual_et__tm_tables, once per day for one cell
+    soil_storage = np.linspace(0., 300., len(inputs.records['kenai'])).tolist()
+
+    def setup():
+        index = TMTableIndex(inputs.tm_df)
+
+        def run():
+            for value in soil_storage:
+                index.soil_storage_from_apwl(index.apwl_from_soil_storage(value))
+        return run
+    return setup, len(soil_storage)
+
+
+@benchmark('tm_retention_curves/grid/synthetic')
+def tm_retention_curves_grid(inputs):
+    soil_storage_max = inputs.grid_available_water_capacity * inputs.grid_rooting_depth
+    fractions = np.linspace(0.05, 1., inputs.grid_days)
+
+    def setup():
+        curves = TMRetentionCurves(inputs.tm_df)
+        curve_ids = curves.curve_ids(soil_storage_max)
+
+        def run():
+            for fraction in fractions:
+                apwl = curves.apwl_from_soil_storage(curve_ids, soil_storage_max * fraction)
+                curves.soil_storage_from_apwl(curve_ids, apwl)
+        return run
+    return setup, inputs.number_of_cells * inputs.grid_days
+
+
+def run_benchmark(name, inputs, repeat=3):
+    """Run one benchmark; returns a dict of its timings, throughput and peak memory."""
+    (setup, number_of_cell_days) = BENCHMARKS[name](inputs)
+    seconds = []
+    for _ in range(repeat):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+
+    run = setup()
+    tracemalloc.start()
+    try:
+        run()
+        (_, peak_memory) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {'cell_days': number_of_cell_days, 'seconds_best': best, 'seconds_median': float(np.median(seconds)),
+            'cell_days_per_second': number_of_cell_days / best if best > 0. else float('inf'),
+            'peak_memory_bytes': peak_memory}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=pl.Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(inputs, patterns=('*',), repeat=3, report=print):
+    """Run every benchmark whose name matches one of `patterns`; returns the results document."""
+    results = {}
+    for name in BENCHMARKS:
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        results[name] = run_benchmark(name, inputs, repeat=repeat)
+        if report is not None:
+            report(f"{name:55s} {results[name]['cell_days_per_second']:14,.0f} cell-days/s"
+                   f"  {results[name]['peak_memory_bytes'] / 2**20:9.2f} MiB peak")
+    return {'commit': git_commit(), 'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(),
+            'settings': {'record_days': {name: len(table) for name, table in inputs.records.items()},
+                         'number_of_cells': inputs.number_of_cells, 'grid_days': inputs.grid_days,
+                         'repeat': repeat},
+            'benchmarks': results}
+
+
+def compare_results(baseline, results, report=print):
+    """Report the throughput of each benchmark relative to a baseline results document."""
+    for name, result in results['benchmarks'].items():
+        if name in baseline['benchmarks']:
+            ratio = result['cell_days_per_second'] / baseline['benchmarks'][name]['cell_days_per_second']
+            report(f"{name:55s} {ratio:6.2f} x  ({'faster' if ratio >= 1. else 'slower'} than "
+                   f"{(baseline.get('commit') or 'baseline')[:10]})")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('patterns', nargs='*', default=['*'], help="benchmarks to run (shell patterns)")
+    parser.add_argument('--output', help="save the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results to compare against")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--record-days', type=int, default=3650, help="days of each station record (0 = all)")
+    parser.add_argument('--cells', type=int, default=100_000, help="cells of the synthetic grid")
+    parser.add_argument('--grid-days', type=int, default=60, help="days simulated on the synthetic grid")
+    parser.add_argument('--list', action='store_true', help="list the benchmarks and exit")
+    options = parser.parse_args(arguments)
+
+    if options.list:
+        print('\n'.join(BENCHMARKS))
+        return None
+
+    inputs = BenchmarkInputs(options.record_days, options.cells, options.grid_days)
+    results = run_benchmarks(inputs, options.patterns, repeat=options.repeat)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare_results(json.load(f), results)
+    return results
+
+
+if __name__ == '__main__':
+    main()
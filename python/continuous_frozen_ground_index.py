@@ -0,0 +1,110 @@
+"""
+Continuous frozen ground index (CFGI) of Molnau and Bissell (1983).
+
+The index is a running, decaying sum of degree-days below freezing, damped by the insulating effect of snow
+cover. It is updated once per day for every cell of the grid:
+
+    CFGI = max(A * CFGI - T_mean * exp(-0.4 * K * snow_depth), 0)
+
+with A = 0.97, K = 0.5 per cm of snow depth, T_mean in degrees Celsius, and the snow depth (cm) estimated
+from the snow water equivalent. Where CFGI exceeds its lower limit (LOWER_LIMIT_CFGI) the ground is
+considered frozen, and the probability of enhanced runoff rises linearly to one at the upper limit
+(UPPER_LIMIT_CFGI); see runoff_curve_number.calculate_probability_of_enhanced_runoff.
+"""
+
+import copy
+
+import numpy as np
+
+from runoff_curve_number import CFGI_LIMITS, calculate_probability_of_enhanced_runoff
+
+
+CFGI_DECAY_COEFFICIENT_A = 0.97
+CFGI_SNOW_DEPTH_COEFFICIENT_K = 0.5
+
+# snow depth per unit of snow water equivalent (fresh snow with a relative density of 0.1)
+SNOW_DEPTH_TO_SWE_RATIO = 10.
+
+
+def update_continuous_frozen_ground_index(cfgi, tmean_c, snow_storage_mm, out=None,
+                                          snow_depth_to_swe_ratio=SNOW_DEPTH_TO_SWE_RATIO):
+    """
+    Return the continuous frozen ground index after one day.
+
+    cfgi                        Current CFGI (degree Celsius-days).
+    tmean_c                     Mean daily air temperature, in degrees Celsius.
+    snow_storage_mm             Snow water equivalent, in mm.
+    out                         Optional array to hold the result (may be cfgi itself).
+    snow_depth_to_swe_ratio     Snow depth per unit of snow water equivalent.
+
+    Arguments may be scalars or NumPy arrays of matching (or broadcastable) shape.
+    """
+    snow_depth_cm = np.multiply(snow_storage_mm, snow_depth_to_swe_ratio / 10.)
+    insulation = np.exp(-0.4 * CFGI_SNOW_DEPTH_COEFFICIENT_K * snow_depth_cm)
+    return np.maximum(CFGI_DECAY_COEFFICIENT_A * np.asarray(cfgi) - np.multiply(tmean_c, insulation), 0., out=out)
+
+
+class ContinuousFrozenGroundIndex:
+    """
+    CFGI state for a single cell or a whole grid.
+
+    shape           Shape of the grid; () for a single cell.
+    initial_cfgi    Initial index (INITIAL_CONTINUOUS_FROZEN_GROUND_INDEX); scalar or array.
+    lower_limit     LOWER_LIMIT_CFGI: the index above which the ground is frozen.
+    upper_limit     UPPER_LIMIT_CFGI: the index at which runoff enhancement is complete.
+
+    `cfgi` is updated in place by update(), so engines can hold a reference to it as part of their state.
+    """
+
+    def __init__(self, shape=(), initial_cfgi=0., lower_limit=CFGI_LIMITS[0], upper_limit=CFGI_LIMITS[1],
+                 snow_depth_to_swe_ratio=SNOW_DEPTH_TO_SWE_RATIO):
+        if upper_limit <= lower_limit:
+            raise ValueError(f"upper CFGI limit ({upper_limit}) must exceed the lower limit ({lower_limit})")
+        self.shape = tuple(shape)
+        self.cfgi = np.zeros(self.shape, dtype=np.float64)
+        self.cfgi[...] = initial_cfgi
+        self.lower_limit = float(lower_limit)
+        self.upper_limit = float(upper_limit)
+        self.snow_depth_to_swe_ratio = snow_depth_to_swe_ratio
+
+    @classmethod
+    def from_configuration(cls, configuration, shape=(), initial_cfgi=None):
+        """
+        Build the index from an SWBConfiguration, taking the limits from LOWER_LIMIT_CFGI and UPPER_LIMIT_CFGI
+        and, unless initial_cfgi is given, the initial value from INITIAL_CONTINUOUS_FROZEN_GROUND_INDEX.
+        """
+        if initial_cfgi is None:
+            initial = configuration.inputs.get('INITIAL_CONTINUOUS_FROZEN_GROUND_INDEX')
+            initial_cfgi = initial.load(shape) if initial is not None else 0.
+        lower_limit = configuration.lower_limit_cfgi
+        upper_limit = configuration.upper_limit_cfgi
+        return cls(shape, initial_cfgi,
+                   lower_limit=CFGI_LIMITS[0] if lower_limit is None else lower_limit,
+                   upper_limit=CFGI_LIMITS[1] if upper_limit is None else upper_limit)
+
+    def select_rows(self, rows):
+        """Return a copy holding the index of the cells in grid rows `rows` (a slice), for swb_parallel.run_sharded."""
+        selected = copy.copy(self)
+        selected.cfgi = self.cfgi[rows].copy()
+        selected.shape = selected.cfgi.shape
+        return selected
+
+    def update(self, tmean_c, snow_storage_mm):
+        update_continuous_frozen_ground_index(self.cfgi, tmean_c, snow_storage_mm, out=self.cfgi,
+                                              snow_depth_to_swe_ratio=self.snow_depth_to_swe_ratio)
+
+    @property
+    def is_frozen(self):
+        return self.cfgi > self.lower_limit
+
+    @property
+    def probability_of_enhanced_runoff(self):
+        return calculate_probability_of_enhanced_runoff(self.cfgi, self.lower_limit, self.upper_limit)
+
+
+def cfgi_references():
+    """
+    Molnau, M., and Bissell, V.C., 1983, A continuous frozen ground index for flood forecasting, in
+        Proceedings 51st Annual Meeting Western Snow Conference, Vancouver, Washington, p. 109-119.
+    """
+    pass
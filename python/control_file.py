@@ -0,0 +1,57 @@
+"""
+Reader for SWB2 control (.ctl) files.
+
+A control file is a list of directives, one per line: a keyword followed by whitespace-separated
+arguments, e.g. 'PRECIPITATION NETCDF gridmet_pr_2000_mn__14-day.nc' or 'TMAX_UNITS_KELVIN'. Keywords are
+case-insensitive, and some (OUTPUT, DUMP_VARIABLES, ...) may appear more than once.
+"""
+
+import pathlib as pl
+
+
+COMMENT_CHARACTERS = ('#', '!', '%', '-')
+
+
+def read_control_file(control_file):
+    """
+    Read a control file and return a dict mapping each (upper-case) keyword to a list with one entry per
+    occurrence; each entry is the list of that line's arguments. Blank lines and lines beginning with one
+    of COMMENT_CHARACTERS are skipped, as is anything following a '#' on a directive line.
+    """
+    directives = {}
+    with open(control_file) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line or line.startswith(COMMENT_CHARACTERS):
+                continue
+            (keyword, *arguments) = line.split()
+            directives.setdefault(keyword.upper(), []).append(arguments)
+    return directives
+
+
+def get_argument(directives, keyword, default=None, index=0):
+    """Return argument `index` of the last occurrence of `keyword`, or `default` if it is not present."""
+    occurrences = directives.get(keyword.upper())
+    if not occurrences or len(occurrences[-1]) <= index:
+        return default
+    return occurrences[-1][index]
+
+
+def get_text(directives, keyword, default=None):
+    """Return all arguments of the last occurrence of `keyword` joined by spaces (e.g. a PROJ4 string)."""
+    occurrences = directives.get(keyword.upper())
+    if not occurrences:
+        return default
+    return ' '.join(occurrences[-1])
+
+
+def has_keyword(directives, keyword):
+    return keyword.upper() in directives
+
+
+def resolve_path(filename, data_directory=None):
+    """Resolve a filename named in a control file against a data directory (cf. --weather_data_dir)."""
+    path = pl.Path(filename)
+    if data_directory is not None and not path.is_absolute():
+        path = pl.Path(data_directory) / path
+    return path
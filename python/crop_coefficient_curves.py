@@ -0,0 +1,184 @@
+"""
+Compiled FAO-56 crop coefficient (Kcb) curves.
+
+Each land use in the irrigation lookup table has a Kcb curve defined by its stage lengths and crop coefficients.
+KcbCurves evaluates every curve once, when the table is compiled:
+
+  - for curves defined by date, a table of Kcb for every day of the year, indexed [lu_code, day_of_year], for
+    each year length of the supported calendars (360, 365 and 366 days), since the planting day of year
+    depends on the length of the year. A season that runs past the end of the year continues into the
+    first days of the next;
+  - for curves defined by growing degree-days (land uses with gdd_plant .. gdd_fallow columns), a table of
+    piecewise-linear (gdd, kcb) breakpoints, indexed by lu_code.
+
+GridKcb binds the curves to a land-use grid, so the daily Kcb for the whole grid is one gather from the
+day-of-year table plus one np.interp per land use with a GDD curve:
+
+    kcb_curves = KcbCurves(configuration.compiled_lookup_table('IRRIGATION'))
+    grid_kcb = kcb_curves.for_grid(lu_grid)
+    grid_kcb.kcb(day_of_year, number_of_days_in_year, gdd, out=fao56.kcb)
+"""
+
+import copy
+import datetime as dt
+
+import numpy as np
+
+from crop_coefficients_fao56_date import calculate_kcb_for_day_of_year
+from crop_coefficients_fao56_gdd import gdd_kcb_breakpoints
+from lookup_tables import data_cells
+
+
+DAY_OF_YEAR_AXIS_LENGTH = 367    # column 0 is unused, so the table is indexed by day of year directly
+
+# number_of_days_in_year of the DateMeasures calendars: 360_day, noleap (and standard), all_leap (and standard)
+CALENDAR_YEAR_LENGTHS = (360, 365, 366)
+
+DATE_STAGE_COLUMNS = ('l_ini', 'l_dev', 'l_mid', 'l_late', 'l_fallow')
+GDD_STAGE_COLUMNS = ('gdd_plant', 'gdd_ini', 'gdd_dev', 'gdd_mid', 'gdd_late', 'gdd_fallow')
+KCB_COLUMNS = ('kcb_min', 'kcb_ini', 'kcb_mid', 'kcb_end')
+
+
+def day_of_year_from_mmdd(dates_mmdd, default_doy, number_of_days_in_year):
+    """
+    Return the day of year of each MM/DD date (e.g. a planting date of '4/15') in a year of
+    number_of_days_in_year days (one of CALENDAR_YEAR_LENGTHS), or default_doy where no date is given.
+    Years of 360 days have twelve 30-day months; there, the 31st of a month is taken as the 30th.
+    """
+    if number_of_days_in_year not in CALENDAR_YEAR_LENGTHS:
+        raise ValueError(f"years of {number_of_days_in_year} days are not supported; "
+                         f"use one of {CALENDAR_YEAR_LENGTHS}")
+    day_of_year = np.array(np.broadcast_to(default_doy, (len(dates_mmdd),)), dtype=np.float64)
+    year = 2000 if number_of_days_in_year == 366 else 2001
+    for index, mmdd in enumerate(dates_mmdd):
+        if mmdd is None or (isinstance(mmdd, float) and np.isnan(mmdd)):
+            continue
+        (month, day) = (int(value) for value in str(mmdd).split('/')[:2])
+        if number_of_days_in_year == 360:
+            # check the date against a real calendar before fitting it into 30-day months
+            dt.date(year, month, day)
+            day_of_year[index] = (month - 1) * 30 + min(day, 30)
+        else:
+            day_of_year[index] = dt.date(year, month, day).timetuple().tm_yday
+    return day_of_year
+
+
+class KcbCurves:
+    """
+    Kcb curves of every land use in a compiled irrigation lookup table.
+
+    lookup_table    CompiledLookupTable of the IRRIGATION_LOOKUP_TABLE.
+
+    kcb_by_day_of_year[n] is the (code_axis_length, 367) table for years of n days, for each n in
+    CALENDAR_YEAR_LENGTHS. Days before the planting day take their Kcb from the season planted the year
+    before (taken to have the same length), so a season that crosses 1 January carries on into the next
+    year. uses_gdd flags the land uses whose curve is defined by growing degree-days; for those,
+    gdd_breakpoints and gdd_kcb hold the np.interp breakpoints (one row per land-use code).
+    """
+
+    def __init__(self, lookup_table):
+        self.name = lookup_table.name
+        self.code_axis_length = lookup_table.code_axis_length
+        self.is_valid_code = lookup_table.is_valid_code
+        codes = lookup_table.codes
+
+        kcb = {name: lookup_table.table(name)[codes] for name in KCB_COLUMNS
+               if name in lookup_table.parameters}
+        if 'kcb_ini' not in kcb:
+            kcb['kcb_ini'] = kcb['kcb_min']
+        missing = [name for name in KCB_COLUMNS if name not in kcb]
+        if missing:
+            raise ValueError(f"{self.name} has no {', '.join(missing)} column(s)")
+
+        self.uses_gdd = np.zeros(self.code_axis_length, dtype=bool)
+        self.gdd_breakpoints = np.full((self.code_axis_length, 8), np.nan)
+        self.gdd_kcb = np.full((self.code_axis_length, 8), np.nan)
+        if all(name in lookup_table.parameters for name in GDD_STAGE_COLUMNS):
+            stages = [lookup_table.table(name)[codes] for name in GDD_STAGE_COLUMNS]
+            uses_gdd = np.all(np.isfinite(stages), axis=0)
+            (self.gdd_breakpoints[codes], self.gdd_kcb[codes]) = gdd_kcb_breakpoints(*stages, **kcb)
+            self.uses_gdd[codes] = uses_gdd
+
+        self.kcb_by_day_of_year = {}
+        has_date_curves = all(name in lookup_table.parameters for name in DATE_STAGE_COLUMNS)
+        if not has_date_curves and not self.uses_gdd[codes].all():
+            raise ValueError(f"{self.name} needs {', '.join(DATE_STAGE_COLUMNS)} columns for land uses "
+                             f"without growing degree-day stages")
+        for number_of_days_in_year in CALENDAR_YEAR_LENGTHS:
+            table = np.full((self.code_axis_length, DAY_OF_YEAR_AXIS_LENGTH), np.nan)
+            if has_date_curves:
+                planting_doy = day_of_year_from_mmdd(
+                    lookup_table.table('planting_date__mmdd')[codes] if 'planting_date__mmdd' in lookup_table.parameters
+                    else [None] * codes.size,
+                    lookup_table.table('planting_date')[codes], number_of_days_in_year)[:, np.newaxis]
+                stages = [lookup_table.table(name)[codes][:, np.newaxis] for name in DATE_STAGE_COLUMNS]
+                kcb_values = {name: values[:, np.newaxis] for name, values in kcb.items()}
+                day_of_year = np.arange(1, DAY_OF_YEAR_AXIS_LENGTH, dtype=np.float64)
+                this_season = calculate_kcb_for_day_of_year(day_of_year, planting_doy, *stages, **kcb_values)
+                last_season = calculate_kcb_for_day_of_year(day_of_year, planting_doy - number_of_days_in_year,
+                                                            *stages, **kcb_values)
+                table[codes, 1:] = np.where(day_of_year >= planting_doy, this_season, last_season)
+            self.kcb_by_day_of_year[number_of_days_in_year] = table
+
+    def for_grid(self, lu_grid, active=None):
+        return GridKcb(self, lu_grid, active=active)
+
+
+class GridKcb:
+    """
+    Kcb curves bound to a land-use grid. The flat index of every cell into the day-of-year tables and the
+    cells of each land use with a GDD curve are worked out once, here.
+
+    curves      KcbCurves.
+    lu_grid     Land-use code of every cell.
+    active      Cells to check against the table (default: the cells of lu_grid holding data, see
+                lookup_tables.data_cells). Their land-use codes must be in the table; other cells get the
+                Kcb of code 0.
+    """
+
+    def __init__(self, curves, lu_grid, active=None):
+        self.curves = curves
+        if active is None:
+            active = data_cells(lu_grid)
+        active = np.asarray(active, dtype=bool)
+        lu_grid = np.where(active, lu_grid, 0).astype(np.intp)
+        checked = lu_grid[active]
+        in_range = (checked >= 0) & (checked < curves.code_axis_length)
+        unknown = np.unique(np.concatenate([checked[~in_range],
+                                            checked[in_range][~curves.is_valid_code[checked[in_range]]]]))
+        if unknown.size:
+            raise ValueError(f"land-use codes {unknown.tolist()} in the grid are missing from {curves.name}")
+
+        self._bind(np.clip(lu_grid, 0, curves.code_axis_length - 1))
+
+    def _bind(self, lu_grid):
+        self.lu_grid = lu_grid
+        self.shape = lu_grid.shape
+        self.day_of_year_offset = lu_grid * DAY_OF_YEAR_AXIS_LENGTH
+        self.gdd_cells = []
+        for code in np.flatnonzero(self.curves.uses_gdd):
+            cells = np.flatnonzero(lu_grid == code)
+            if cells.size:
+                self.gdd_cells.append((cells, self.curves.gdd_breakpoints[code], self.curves.gdd_kcb[code]))
+
+    def select_rows(self, rows):
+        """Return the curves bound to the cells in grid rows `rows` (a slice), for swb_parallel.run_sharded."""
+        selected = copy.copy(self)
+        selected._bind(self.lu_grid[rows])
+        return selected
+
+    def kcb(self, day_of_year, number_of_days_in_year=365, gdd=None, out=None):
+        """Return Kcb for every cell of the grid for the given day of year (and, for GDD curves, gdd)."""
+        table = self.curves.kcb_by_day_of_year.get(int(number_of_days_in_year))
+        if table is None:
+            raise ValueError(f"years of {number_of_days_in_year} days are not supported; "
+                             f"use one of {CALENDAR_YEAR_LENGTHS}")
+        out = np.take(table.ravel(), self.day_of_year_offset + int(day_of_year), out=out)
+        if self.gdd_cells:
+            if gdd is None:
+                raise ValueError("growing degree-days are required for land uses with GDD Kcb curves")
+            gdd = np.broadcast_to(gdd, self.shape).ravel()
+            flat = out.reshape(-1)
+            for cells, breakpoints, kcb in self.gdd_cells:
+                flat[cells] = np.interp(gdd[cells], breakpoints, kcb)
+        return out
@@ -10,19 +10,22 @@ def update_crop_coefficient_date_as_threshold(planting_date: dt.datetime,
                                               kcb_min: float,
                                               kcb_mid: float,
                                               kcb_end: float,
-                                              current_date: int):
-    """Update crop coefficient given the current day of year.
+                                              current_date: dt.datetime,
+                                              kcb_ini: float = None):
+    """Update crop coefficient given the current date.
 
     Args:
-        planting_date (datetime): _description_
-        l_ini (int): _description_
-        l_dev (int): _description_
-        l_mid (int): _description_
-        l_late (int): 
-        kcb_min (float): _description_
-        kcb_mid (float): _description_
-        kcb_kcb_end (float): _description_
-        current_doy (int): _description_
+        planting_date (datetime): planting date; only the month and day are used
+        l_ini (int): length of the initial growth stage (days)
+        l_dev (int): length of the development stage (days)
+        l_mid (int): length of the mid-season stage (days)
+        l_late (int): length of the late-season stage (days)
+        l_fallow (int): length of the fallow period following the late-season stage (days)
+        kcb_min (float): minimum crop coefficient (outside of the growing season)
+        kcb_mid (float): mid-season crop coefficient
+        kcb_end (float): crop coefficient at the end of the late-season stage
+        current_date (datetime): current date
+        kcb_ini (float): crop coefficient during the initial stage; defaults to kcb_min
 
                                     kcb_mid
                             /----------------------\
@@ -39,36 +42,56 @@ def update_crop_coefficient_date_as_threshold(planting_date: dt.datetime,
         l_ini         l_dev           l_mid          l_late     l_fallow
 
     """
-    planting_month = planting_date.timetuple().tm_month
-    planting_day = planting_date.timetuple().tm_day
+    planting_month = planting_date.timetuple().tm_mon
+    planting_day = planting_date.timetuple().tm_mday
     current_year = current_date.timetuple().tm_year
     current_doy = current_date.timetuple().tm_yday
 
     planting_doy = dt.date(current_year, planting_month, planting_day).timetuple().tm_yday
 
-    doy_end_ini = current_doy + l_ini
+    kcb = calculate_kcb_for_day_of_year(current_doy, planting_doy, l_ini, l_dev, l_mid, l_late, l_fallow,
+                                        kcb_min, kcb_min if kcb_ini is None else kcb_ini, kcb_mid, kcb_end)
+    return kcb
+
+
+def calculate_kcb_for_day_of_year(day_of_year, planting_doy, l_ini, l_dev, l_mid, l_late, l_fallow,
+                                  kcb_min, kcb_ini, kcb_mid, kcb_end):
+    """Return the crop coefficient on a given day of year for a crop planted on planting_doy.
+
+    Arguments may be scalars or NumPy arrays of matching (or broadcastable) shape, so a whole season (or a
+    whole table of land uses) is evaluated at once; see crop_coefficient_curves.py.
+
+    Returns:
+        float: crop coefficient (unitless)
+    """
+    day_of_year = np.asarray(day_of_year, dtype=np.float64)
+    doy_end_ini = planting_doy + l_ini
     doy_end_dev = doy_end_ini + l_dev
     doy_end_mid = doy_end_dev + l_mid
     doy_end_late = doy_end_mid + l_late
     doy_end_fallow = doy_end_late + l_fallow
 
-    if current_doy > doy_end_fallow:
+    # a stage of zero length is never selected, so its division by zero is harmless
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac_dev = ( day_of_year - doy_end_ini ) / ( doy_end_dev - doy_end_ini )
+        frac_late = ( day_of_year - doy_end_mid ) / ( doy_end_late - doy_end_mid )
+
         # TODO: possibly interpolate between kcb_end and kcb_min during l_fallow period
-        kcb = kcb_min
-    elif current_doy > doy_end_late:
-        kcb = kcb_end
-    elif current_doy > doy_end_mid:
-        frac = ( current_doy - doy_end_mid ) / ( doy_end_late - doy_end_mid )
-        kcb = kcb_mid * (1.0 - frac) + kcb_end * frac
-    elif current_doy > doy_end_dev:
-       kcb = kcb_mid
-    elif current_doy > doy_end_ini:
-        frac = ( current_doy - doy_plant ) / ( doy_end_dev - doy_plant )
-        kcb = kcb_ini * (1.0 - frac) + kcb_mid * frac
-    else:
-       kcb = kcb_min
+        kcb = np.select([day_of_year > doy_end_fallow,
+                         day_of_year > doy_end_late,
+                         day_of_year > doy_end_mid,
+                         day_of_year > doy_end_dev,
+                         day_of_year > doy_end_ini,
+                         day_of_year >= planting_doy],
+                        [kcb_min,
+                         kcb_end,
+                         kcb_mid * (1.0 - frac_late) + kcb_end * frac_late,
+                         kcb_mid,
+                         kcb_ini * (1.0 - frac_dev) + kcb_mid * frac_dev,
+                         kcb_ini],
+                        default=kcb_min)
 
-    return kcb
+    return kcb[()]
 
 
 def calculate_kcb_max(wind_speed_meters_per_sec: float,
@@ -93,9 +116,9 @@ def calculate_kcb_max(wind_speed_meters_per_sec: float,
     plant_height = np.clip(plant_height_meters, a_min=[1.], a_max=[10.])
 
     # equation 72, FAO-56, p 199
-    kcb_max = np.max(1.2 + ( (0.04 * (u2 - 2.)
-                            - 0.004 * (rhmin - 45.) ) ) 
-                                    * (plant_height_meters/3.)**0.3, 
-                     kcb + 0.05 )
+    kcb_max = np.maximum(1.2 + ( (0.04 * (u2 - 2.)
+                                - 0.004 * (rhmin - 45.) ) ) 
+                                        * (plant_height/3.)**0.3, 
+                         kcb + 0.05 )
 
     return kcb_max
@@ -14,15 +14,17 @@ def update_crop_coefficient_by_gdd(gdd_plant: float,
     """Update crop coefficient given the current gdd.
 
     Args:
-        gdd_plant (float): _description_
-        gdd_ini (float): _description_
-        gdd__dev (float): _description_
-        gdd_mid float): _description_
-        gdd_late (float): 
-        kcb_min (float): _description_
-        kcb_mid (float): _description_
-        kcb_kcb_end (float): _description_
-        gdd (float): _description_
+        gdd_plant (float): growing degree-days at planting
+        gdd_ini (float): growing degree-days at the end of the initial stage
+        gdd_dev (float): growing degree-days at the end of the development stage
+        gdd_mid (float): growing degree-days at the end of the mid-season stage
+        gdd_late (float): growing degree-days at the end of the late-season stage
+        gdd_fallow (float): growing degree-days at the end of the fallow period
+        kcb_min (float): minimum crop coefficient (outside of the growing season)
+        kcb_ini (float): crop coefficient during the initial stage
+        kcb_mid (float): mid-season crop coefficient
+        kcb_end (float): crop coefficient at the end of the late-season stage
+        gdd (float): current growing degree-days
 
                                     kcb_mid
                             /----------------------\
@@ -71,9 +73,27 @@ def update_crop_coefficient_by_gdd(gdd_plant: float,
     elif gdd > gdd_dev:
        kcb = kcb_mid
     elif gdd > gdd_ini:
-        frac = ( gdd - gdd_plant ) / ( gdd_dev - gdd_plant )
+        frac = ( gdd - gdd_ini ) / ( gdd_dev - gdd_ini )
         kcb = kcb_ini * (1.0 - frac) + kcb_mid * frac
+    elif gdd >= gdd_plant:
+        kcb = kcb_ini
     else:
        kcb = kcb_min
 
     return kcb
+
+
+def gdd_kcb_breakpoints(gdd_plant, gdd_ini, gdd_dev, gdd_mid, gdd_late, gdd_fallow,
+                        kcb_min, kcb_ini, kcb_mid, kcb_end):
+    """Return (gdd, kcb) breakpoints of the piecewise-linear curve computed by update_crop_coefficient_by_gdd,
+       for use with np.interp.
+
+       The steps at gdd_plant (kcb_min to kcb_ini) and after gdd_fallow (kcb_end to kcb_min) are represented by
+       pairs of breakpoints one floating-point step apart. Arguments may be arrays (one element per land use),
+       in which case each returned array has one row per land use and eight columns.
+    """
+    gdd = np.stack(np.broadcast_arrays(np.nextafter(gdd_plant, -np.inf), gdd_plant, gdd_ini, gdd_dev,
+                                       gdd_mid, gdd_late, gdd_fallow, np.nextafter(gdd_fallow, np.inf)), axis=-1)
+    kcb = np.stack(np.broadcast_arrays(kcb_min, kcb_ini, kcb_ini, kcb_mid,
+                                       kcb_mid, kcb_end, kcb_end, kcb_min), axis=-1)
+    return gdd.astype(np.float64), kcb.astype(np.float64)
@@ -0,0 +1,154 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# month lengths for the fixed-length model calendars used by climate-model (e.g. CMIP6) output
+FIXED_CALENDAR_MONTH_LENGTHS = {
+    'noleap':   np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]),
+    'all_leap': np.array([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]),
+    '360_day':  np.full(12, 30),
+}
+
+CALENDAR_ALIASES = {
+    'standard': 'standard',
+    'gregorian': 'standard',
+    'proleptic_gregorian': 'standard',
+    'noleap': 'noleap',
+    '365_day': 'noleap',
+    'all_leap': 'all_leap',
+    '366_day': 'all_leap',
+    '360_day': '360_day',
+}
+
+
+def normalize_calendar_name(calendar):
+    try:
+        return CALENDAR_ALIASES[calendar.strip().lower()]
+    except KeyError:
+        raise ValueError(f"unsupported calendar '{calendar}'; expected one of {sorted(CALENDAR_ALIASES)}")
+
+
+class DateMeasures:
+    """
+    Calendar quantities for every day of a run window, held as integer arrays.
+
+    Rather than building datetime objects every simulated day, the year, month, day, day of year,
+    number of days in the year, and the January 1 (GDD reset) flag are computed for the entire run in
+    one vectorized pass. Model code indexes these arrays by timestep; the day_of_year and
+    number_of_days_in_year arrays may also be passed directly to the PET functions.
+
+    Instances are normally created with one of the date_measures_* functions below.
+    """
+
+    def __init__(self, year, month, day, calendar='standard'):
+        self.calendar = normalize_calendar_name(calendar)
+        self.year = np.asarray(year, dtype=np.int32)
+        self.month = np.asarray(month, dtype=np.int32)
+        self.day = np.asarray(day, dtype=np.int32)
+
+        if self.calendar == 'standard':
+            is_leap_year = ((self.year % 4 == 0) & (self.year % 100 != 0)) | (self.year % 400 == 0)
+            cumulative_days = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+            self.number_of_days_in_year = np.where(is_leap_year, 366, 365).astype(np.int32)
+            self.day_of_year = (cumulative_days[self.month - 1] + self.day
+                                + ((self.month > 2) & is_leap_year)).astype(np.int32)
+        else:
+            month_lengths = FIXED_CALENDAR_MONTH_LENGTHS[self.calendar]
+            cumulative_days = np.concatenate(([0], np.cumsum(month_lengths)[:-1]))
+            self.number_of_days_in_year = np.full(self.year.shape, month_lengths.sum(), dtype=np.int32)
+            self.day_of_year = (cumulative_days[self.month - 1] + self.day).astype(np.int32)
+
+        self.is_jan_1 = (self.month == 1) & (self.day == 1)
+
+    def __len__(self):
+        return self.year.size
+
+    @property
+    def dtindex(self):
+        """'YYYYMMDD' strings, one per day, matching the index used for SWBCell output."""
+        return np.char.mod('%08d', self.year * 10000 + self.month * 100 + self.day)
+
+    @property
+    def dates(self):
+        """datetime64[D] array of the dates; only available for the standard calendar."""
+        if self.calendar != 'standard':
+            raise ValueError(f"the '{self.calendar}' calendar has no equivalent datetime64 representation")
+        return pd.to_datetime(pd.DataFrame({'year': self.year, 'month': self.month, 'day': self.day})) \
+                 .to_numpy().astype('datetime64[D]')
+
+
+def date_measures_from_dates(dates):
+    """Return DateMeasures for a sequence of (standard calendar) dates, e.g. a dataframe date column."""
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return DateMeasures(dates.year.to_numpy(), dates.month.to_numpy(), dates.day.to_numpy())
+
+
+def _fixed_calendar_measures(start_year, start_day_of_year, elapsed_days, calendar):
+    month_lengths = FIXED_CALENDAR_MONTH_LENGTHS[calendar]
+    days_in_year = month_lengths.sum()
+    month_starts = np.concatenate(([0], np.cumsum(month_lengths)[:-1]))
+
+    day_count = np.asarray(elapsed_days, dtype=np.int64) + (start_day_of_year - 1)
+    year = start_year + day_count // days_in_year
+    day_index = day_count % days_in_year
+    month = np.searchsorted(month_starts, day_index, side='right')
+    day = day_index - month_starts[month - 1] + 1
+    return DateMeasures(year, month, day, calendar=calendar)
+
+
+def date_measures_for_period(start_date, end_date, calendar='standard'):
+    """
+    Return DateMeasures for every day from start_date through end_date, inclusive.
+
+    start_date and end_date may be anything pd.Timestamp understands (for instance the MM/DD/YYYY
+    START_DATE / END_DATE strings used in control files). For the fixed-length calendars, dates that do
+    not exist (e.g. February 30) are not generated, while February 29 is omitted from 'noleap' runs.
+    """
+    calendar = normalize_calendar_name(calendar)
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+
+    if calendar == 'standard':
+        return date_measures_from_dates(pd.date_range(start, end, freq='D'))
+
+    start_measures = DateMeasures([start.year], [start.month], [start.day], calendar=calendar)
+    end_measures = DateMeasures([end.year], [end.month], [end.day], calendar=calendar)
+    days_in_year = int(start_measures.number_of_days_in_year[0])
+    number_of_days = ((end.year - start.year) * days_in_year
+                      + int(end_measures.day_of_year[0]) - int(start_measures.day_of_year[0]) + 1)
+    return _fixed_calendar_measures(start.year, int(start_measures.day_of_year[0]),
+                                    np.arange(number_of_days), calendar)
+
+
+def date_measures_from_time_values(time_values, units, calendar='standard'):
+    """
+    Return DateMeasures for CF-convention time values, e.g. the TIME variable of a NetCDF weather file.
+
+    time_values     Array of time offsets.
+    units           CF time units string of the form '<days|hours|minutes|seconds> since YYYY-MM-DD[ hh:mm:ss]'.
+    calendar        CF calendar attribute ('standard', 'gregorian', 'noleap', '365_day', '360_day', ...).
+
+    Each time value is assigned to the calendar day on which it falls (any time-of-day part is dropped).
+    """
+    calendar = normalize_calendar_name(calendar)
+    match = re.match(r'\s*(days?|hours?|minutes?|seconds?)\s+since\s+(.+)$', units, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"unrecognized CF time units '{units}'")
+
+    unit = match.group(1).lower().rstrip('s')
+    reference = pd.Timestamp(match.group(2).strip())
+    units_per_day = {'day': 1., 'hour': 24., 'minute': 1440., 'second': 86400.}[unit]
+
+    # fractional days, counted from midnight of the reference date
+    elapsed = np.asarray(time_values, dtype=np.float64) / units_per_day \
+              + (reference - reference.normalize()) / pd.Timedelta(days=1)
+    elapsed_days = np.floor(elapsed).astype(np.int64)
+
+    if calendar == 'standard':
+        dates = np.datetime64(reference.normalize().date(), 'D') + elapsed_days.astype('timedelta64[D]')
+        return date_measures_from_dates(dates)
+
+    reference_measures = DateMeasures([reference.year], [reference.month], [reference.day], calendar=calendar)
+    return _fixed_calendar_measures(reference.year, int(reference_measures.day_of_year[0]), elapsed_days, calendar)
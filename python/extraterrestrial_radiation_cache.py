@@ -0,0 +1,151 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from solar_and_meteorological_functions import relative_earth_sun_distance__D_r, \
+                                                solar_declination__delta,         \
+                                                sunrise_sunset_angle__omega_s,    \
+                                                extraterrestrial_radiation__Ra,   \
+                                                equivalent_evaporation
+
+
+DEGREES_TO_RADIANS = (2.0 * np.pi) / 360.0
+
+SCALARS = (int, float, np.integer, np.floating)
+
+# latitude columns (a few KB each) kept for scalar lookups before they are discarded
+MAX_SCALAR_COLUMNS = 10000
+
+
+class ExtraterrestrialRadiationCache:
+    """
+    Cache of daily extraterrestrial radiation (expressed as equivalent evaporation, mm/day).
+
+    Extraterrestrial radiation depends only on latitude, day of year, and the number of days in the year,
+    so rather than evaluating the solar geometry (D_r, delta, omega_s, Ra) every cell-day, a table of
+    shape (number_of_days_in_year, number_of_latitude_bands) is built once and daily values are gathered
+    from it.
+
+    latitude_resolution     Latitudes are quantized to bands of this width (degrees) before lookup. The
+                            default, 0.01 degrees (about 1.1 km), gives one band per 0.01 degrees of
+                            latitude spanned (651 bands, under 2 MB per table, for a grid of Minnesota) and
+                            changes Ra by less than 0.002 mm/day. With the default, PET from a cached run
+                            (for example an SWBGrid given a cache) therefore differs slightly from an
+                            uncached SWBCell run instead of matching it exactly. None uses the exact
+                            latitudes supplied, which reproduces the direct calculation but builds one band
+                            per distinct latitude, over 1 GB for a 688 x 620 projected grid.
+    max_tables              Maximum number of tables to retain. Tables are keyed by the number of days in
+                            the year and the set of latitude bands; the least recently used table is
+                            evicted when the limit is exceeded.
+    """
+
+    def __init__(self, latitude_resolution=0.01, max_tables=4):
+        self.latitude_resolution = latitude_resolution
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._last_latitude = None
+        self._last_bands = None
+        # (latitude, number_of_days_in_year): that latitude's column of the table, for scalar lookups
+        self._columns = {}
+
+    def latitude_bands(self, latitude):
+        """
+        Return (band_latitudes, band_index): the sorted, unique (quantized) latitudes, and for each
+        element of `latitude` the index of its band in band_latitudes.
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        if self.latitude_resolution is not None:
+            latitude = np.round(latitude / self.latitude_resolution) * self.latitude_resolution
+        band_latitudes, band_index = np.unique(latitude.ravel(), return_inverse=True)
+        return band_latitudes, band_index.reshape(latitude.shape)
+
+    def _bands_for(self, latitude):
+        # grids pass the same latitude array every day; remember its bands rather than recomputing them
+        if isinstance(latitude, np.ndarray) and latitude is self._last_latitude:
+            return self._last_bands
+        bands = self.latitude_bands(latitude)
+        if isinstance(latitude, np.ndarray):
+            self._last_latitude = latitude
+            self._last_bands = bands
+        return bands
+
+    def radiation_table(self, number_of_days_in_year, band_latitudes):
+        """
+        Return the (number_of_days_in_year, len(band_latitudes)) table of extraterrestrial radiation,
+        in mm/day of equivalent evaporation, building and caching it if necessary.
+        """
+        number_of_days_in_year = int(number_of_days_in_year)
+        key = (number_of_days_in_year, band_latitudes.tobytes())
+
+        table = self._tables.get(key)
+        if table is not None:
+            self._tables.move_to_end(key)
+            return table
+
+        day_of_year = np.arange(1, number_of_days_in_year + 1, dtype=np.float64)[:, np.newaxis]
+        latitude_radians = band_latitudes[np.newaxis, :] * DEGREES_TO_RADIANS
+
+        d_r     = relative_earth_sun_distance__D_r(day_of_year, number_of_days_in_year)
+        delta   = solar_declination__delta(day_of_year, number_of_days_in_year)
+        omega_s = sunrise_sunset_angle__omega_s(latitude_radians, delta)
+
+        table = equivalent_evaporation(extraterrestrial_radiation__Ra(latitude_radians, delta, omega_s, d_r))
+        table.flags.writeable = False
+
+        self._tables[key] = table
+        while len(self._tables) > self.max_tables:
+            self._tables.popitem(last=False)
+
+        return table
+
+    def extraterrestrial_radiation(self, day_of_year, number_of_days_in_year, latitude, out=None):
+        """
+        Return extraterrestrial radiation (mm/day of equivalent evaporation) for the given day(s) of year
+        at each latitude.
+
+        day_of_year, number_of_days_in_year and latitude broadcast against one another, so a column of days,
+        e.g. day_of_year[:, np.newaxis], with a row of latitudes yields a (time x cell) array. Scalar
+        arguments return a scalar. If `out` is given (scalar day of year only), the result is written into it.
+        """
+        if out is None and isinstance(latitude, SCALARS) and isinstance(day_of_year, SCALARS) \
+                and isinstance(number_of_days_in_year, SCALARS):
+            return self._scalar_radiation(day_of_year, number_of_days_in_year, latitude)
+
+        band_latitudes, band_index = self._bands_for(latitude)
+        day_index = np.asarray(day_of_year).astype(np.intp) - 1
+        number_of_days_in_year = np.asarray(number_of_days_in_year)
+
+        if number_of_days_in_year.ndim == 0:
+            table = self.radiation_table(number_of_days_in_year, band_latitudes)
+            if day_index.ndim == 0:
+                return np.take(table[day_index], band_index, out=out)[()]
+            return table[day_index, band_index]
+
+        # a time series spanning both common and leap years: gather from each year-length table in turn
+        shape = np.broadcast_shapes(day_index.shape, number_of_days_in_year.shape, band_index.shape)
+        result = np.empty(shape, dtype=np.float64)
+        for days_in_year in np.unique(number_of_days_in_year):
+            table = self.radiation_table(days_in_year, band_latitudes)
+            selected = np.broadcast_to(number_of_days_in_year == days_in_year, shape)
+            values = np.broadcast_to(table[np.minimum(day_index, table.shape[0] - 1), band_index], shape)
+            result[selected] = values[selected]
+        return result
+
+    def _scalar_radiation(self, day_of_year, number_of_days_in_year, latitude):
+        # SWBCell asks for one latitude every day; keep its column of the table so that each lookup is a
+        # dictionary hit and an index
+        key = (latitude, number_of_days_in_year)
+        column = self._columns.get(key)
+        if column is None:
+            band_latitudes, band_index = self.latitude_bands(latitude)
+            column = self.radiation_table(number_of_days_in_year, band_latitudes)[:, band_index]
+            if len(self._columns) >= MAX_SCALAR_COLUMNS:
+                self._columns.clear()
+            self._columns[key] = column
+        return column[int(day_of_year) - 1]
+
+    def clear(self):
+        self._tables.clear()
+        self._columns.clear()
+        self._last_latitude = None
+        self._last_bands = None
@@ -0,0 +1,327 @@
+"""
+Gridded daily output (OUTPUT ENABLE / OUTPUT DISABLE).
+
+GriddedOutputWriter records the enabled output variables of an SWBGrid each day and writes each variable to
+its own chunked, compressed file: NetCDF4 (requires netCDF4) or a Zarr (version 2) store, written directly
+with zlib compression so that no zarr installation is needed to produce it. Files are named as in SWB2,
+
+    <prefix><variable>__<start YYYY-MM-DD>_to_<end YYYY-MM-DD>__<rows>_by_<columns>.nc (or .zarr)
+
+Chunks are time-major: each holds chunk_days days of a small block of cells, so the daily series of one cell
+is read from a few chunks. Days are accumulated in memory until a chunk's worth of days is complete, and the
+block is then passed through a bounded queue to a background writer thread, which compresses and writes it
+while the model computes the next days. The buffers are recycled, so memory use is bounded by
+(queue_size + 2) blocks per variable, and the model only waits on disk if the writer falls queue_size blocks
+behind.
+"""
+
+import json
+import operator
+import pathlib as pl
+import queue
+import threading
+import zlib
+
+import numpy as np
+
+try:
+    import netCDF4
+    # netcdf-c is not thread safe; every netCDF4 call, here and in the weather reader, holds this lock
+    from netcdf_weather import NETCDF_LOCK
+    HAVE_NETCDF4 = True
+except ImportError:
+    HAVE_NETCDF4 = False
+
+
+def delta_soil_storage(grid):
+    return grid.soil_storage - grid.previous_soil_storage
+
+
+def variable_getter(source):
+    """Function of the grid returning an output variable given as an SWBGrid attribute name or a function."""
+    return source if callable(source) else operator.attrgetter(source)
+
+
+# SWB2 output name: (SWBGrid attribute, or function of the grid; units)
+GRIDDED_OUTPUT_VARIABLES = {
+    'gross_precip':             ('gross_precip', 'mm'),
+    'gross_precipitation':      ('gross_precip', 'mm'),
+    'rainfall':                 ('rainfall', 'mm'),
+    'snowfall':                 ('snowfall', 'mm'),
+    'snowmelt':                 ('snowmelt', 'mm'),
+    'snow_storage':             ('snow_storage', 'mm'),
+    'soil_storage':             ('soil_storage', 'mm'),
+    'delta_soil_storage':       (delta_soil_storage, 'mm'),
+    'reference_et0':            ('pet', 'mm'),
+    'actual_et':                ('aet', 'mm'),
+    'runoff':                   ('runoff', 'mm'),
+    'infiltration':             ('infiltration', 'mm'),
+    'net_infiltration':         ('net_infiltration', 'mm'),
+    'irrigation':               ('irrigation', 'mm'),
+    'tmin':                     ('tmin_c', 'degrees_Celsius'),
+    'tmax':                     ('tmax_c', 'degrees_Celsius'),
+    'bare_soil_evaporation':    (lambda grid: grid.fao56.bare_soil_evaporation, 'mm'),
+    'crop_et':                  (lambda grid: grid.fao56.crop_transpiration, 'mm'),
+}
+
+# outputs that SWB2 control files may also name otherwise; both names must be enabled
+OUTPUT_NAME_ALIASES = {'gross_precip': 'gross_precipitation'}
+
+FAO56_OUTPUT_VARIABLES = ('bare_soil_evaporation', 'crop_et')
+
+OUTPUT_FORMATS = ('netcdf', 'zarr')
+
+
+def date_text(date_measures, index):
+    """'YYYY-MM-DD' of one day of a DateMeasures (in its own calendar, so e.g. 2001-02-30 for 360_day)."""
+    return (f'{int(date_measures.year[index]):04d}-{int(date_measures.month[index]):02d}'
+            f'-{int(date_measures.day[index]):02d}')
+
+
+def time_attributes(date_measures):
+    """CF units and calendar of a time axis counting the days of the run from its first day."""
+    return {'units': f'days since {date_text(date_measures, 0)} 00:00:00', 'calendar': date_measures.calendar}
+
+
+def output_filename(output_directory, prefix, name, date_measures, shape, output_format):
+    extension = 'nc' if output_format == 'netcdf' else 'zarr'
+    return pl.Path(output_directory) / (f'{prefix}{name}__{date_text(date_measures, 0)}_to_'
+                                        f'{date_text(date_measures, -1)}__{shape[0]}_by_{shape[1]}.{extension}')
+
+
+class NetCDFGridStore:
+    """
+    One variable in a NetCDF4 file with dimensions (time, y, x), chunked and zlib compressed. All file access
+    holds NETCDF_LOCK, so stores may be written from the writer thread while weather is read on another.
+    """
+
+    def __init__(self, filename, name, units, date_measures, shape, chunks, x=None, y=None, compression_level=4):
+        if not HAVE_NETCDF4:
+            raise ImportError("netCDF4 is required to write NetCDF output; use output_format='zarr'")
+        self.filename = filename
+        number_of_days = len(date_measures)
+        with NETCDF_LOCK:
+            self.dataset = netCDF4.Dataset(filename, 'w', format='NETCDF4')
+            self.dataset.createDimension('time', number_of_days)
+            self.dataset.createDimension('y', shape[0])
+            self.dataset.createDimension('x', shape[1])
+            time = self.dataset.createVariable('time', 'f8', ('time',))
+            time.setncatts(time_attributes(date_measures))
+            time[:] = np.arange(number_of_days, dtype=np.float64)
+            for axis, values in (('x', x), ('y', y)):
+                if values is not None:
+                    self.dataset.createVariable(axis, 'f8', (axis,))[:] = values
+            self.variable = self.dataset.createVariable(name, 'f4', ('time', 'y', 'x'), zlib=True,
+                                                        complevel=compression_level, shuffle=True,
+                                                        chunksizes=chunks, fill_value=np.float32(np.nan))
+            self.variable.units = units
+
+    def write(self, start_day, block):
+        with NETCDF_LOCK:
+            self.variable[start_day:start_day + block.shape[0]] = block
+
+    def close(self):
+        with NETCDF_LOCK:
+            self.dataset.close()
+
+
+class ZarrGridStore:
+    """
+    One variable in a Zarr version 2 group (readable with zarr or xarray.open_zarr): the variable and its
+    time, y and x coordinates are arrays, chunks are zlib compressed, and edge chunks are padded with NaN.
+    """
+
+    def __init__(self, filename, name, units, date_measures, shape, chunks, x=None, y=None, compression_level=4):
+        self.filename = pl.Path(filename)
+        self.name = name
+        number_of_days = len(date_measures)
+        self.shape = (number_of_days,) + tuple(shape)
+        self.chunks = tuple(chunks)
+        self.compression_level = compression_level
+        self.filename.mkdir(parents=True, exist_ok=True)
+        self._write_json(self.filename / '.zgroup', {'zarr_format': 2})
+
+        self._create_array(name, self.shape, self.chunks, ['time', 'y', 'x'], {'units': units})
+        self._write_coordinate('time', np.arange(number_of_days, dtype=np.float64), time_attributes(date_measures))
+        for axis, values in (('x', x), ('y', y)):
+            if values is not None:
+                self._write_coordinate(axis, np.asarray(values, dtype=np.float64), {})
+
+    @staticmethod
+    def _write_json(filename, content):
+        with open(filename, 'w') as f:
+            json.dump(content, f, indent=2)
+
+    def _create_array(self, name, shape, chunks, dimensions, attributes, dtype='<f4'):
+        directory = self.filename / name
+        directory.mkdir(exist_ok=True)
+        self._write_json(directory / '.zarray', {
+            'zarr_format': 2, 'shape': list(shape), 'chunks': list(chunks), 'dtype': dtype,
+            'compressor': {'id': 'zlib', 'level': self.compression_level}, 'fill_value': 'NaN',
+            'order': 'C', 'filters': None, 'dimension_separator': '.'})
+        self._write_json(directory / '.zattrs', {'_ARRAY_DIMENSIONS': dimensions, **attributes})
+        return directory
+
+    def _write_coordinate(self, name, values, attributes):
+        directory = self._create_array(name, values.shape, values.shape, [name], attributes, dtype='<f8')
+        with open(directory / '0', 'wb') as f:
+            f.write(zlib.compress(values.astype('<f8').tobytes(), self.compression_level))
+
+    def write(self, start_day, block):
+        (chunk_days, chunk_rows, chunk_columns) = self.chunks
+        if start_day % chunk_days:
+            raise ValueError(f"blocks must start on a chunk boundary (a multiple of {chunk_days} days)")
+        directory = self.filename / self.name
+        padded = np.full((chunk_days, chunk_rows, chunk_columns), np.nan, dtype='<f4')
+        for k in range(0, block.shape[0], chunk_days):
+            for i in range(0, block.shape[1], chunk_rows):
+                for j in range(0, block.shape[2], chunk_columns):
+                    chunk = block[k:k + chunk_days, i:i + chunk_rows, j:j + chunk_columns]
+                    if chunk.shape != padded.shape:
+                        padded[...] = np.nan
+                        padded[:chunk.shape[0], :chunk.shape[1], :chunk.shape[2]] = chunk
+                        chunk = padded
+                    key = f'{(start_day + k) // chunk_days}.{i // chunk_rows}.{j // chunk_columns}'
+                    with open(directory / key, 'wb') as f:
+                        f.write(zlib.compress(np.ascontiguousarray(chunk, dtype='<f4').tobytes(),
+                                              self.compression_level))
+
+    def close(self):
+        pass
+
+
+class GriddedOutputWriter:
+    """
+    Record the enabled output variables of an SWBGrid each day and write them, chunked and compressed, on a
+    background thread.
+
+    output_directory    Directory for the output files.
+    variables           SWB2 output names (keys of GRIDDED_OUTPUT_VARIABLES).
+    shape               Grid shape (rows, columns).
+    date_measures       DateMeasures of the run; the time axis and filenames follow its calendar.
+    output_format       'netcdf' (the default when netCDF4 is installed) or 'zarr'.
+    prefix              Prepended to every filename (cf. OUTPUT_PREFIX).
+    chunk_days          Days per chunk (and per block handed to the writer thread).
+    chunk_cells         (rows, columns) per chunk.
+    queue_size          Blocks that may wait for the writer before record() blocks.
+    x, y                Optional cell-center coordinates written with each variable.
+
+    Use as a context manager, or call close() after the last day, so the final partial block is written and
+    any error raised on the writer thread is reported.
+    """
+
+    def __init__(self, output_directory, variables, shape, date_measures, output_format=None,
+                 prefix='', chunk_days=32, chunk_cells=(32, 32), queue_size=2, compression_level=4, x=None, y=None):
+        if output_format is None:
+            output_format = 'netcdf' if HAVE_NETCDF4 else 'zarr'
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, not '{output_format}'")
+        unknown = [name for name in variables if name.lower() not in GRIDDED_OUTPUT_VARIABLES]
+        if unknown:
+            raise ValueError(f"no gridded output is available for {unknown}")
+
+        self.variables = [name.lower() for name in variables]
+        self.shape = tuple(shape)
+        self.date_measures = date_measures
+        self.number_of_days = len(date_measures)
+        self.chunk_days = min(chunk_days, self.number_of_days)
+        chunks = (self.chunk_days, min(chunk_cells[0], self.shape[0]), min(chunk_cells[1], self.shape[1]))
+
+        pl.Path(output_directory).mkdir(parents=True, exist_ok=True)
+        store_class = NetCDFGridStore if output_format == 'netcdf' else ZarrGridStore
+        self.stores = {}
+        for name in self.variables:
+            filename = output_filename(output_directory, prefix, name, date_measures, self.shape, output_format)
+            self.stores[name] = store_class(filename, name, GRIDDED_OUTPUT_VARIABLES[name][1], date_measures,
+                                            self.shape, chunks, x=x, y=y, compression_level=compression_level)
+
+        self._getters = [variable_getter(GRIDDED_OUTPUT_VARIABLES[name][0]) for name in self.variables]
+
+        # each block holds chunk_days days of every variable; queue_size + 2 blocks let the model fill one
+        # while the writer writes another and queue_size more wait
+        self._free_blocks = queue.Queue()
+        for _ in range(queue_size + 2):
+            self._free_blocks.put(np.empty((len(self.variables), self.chunk_days) + self.shape, dtype=np.float32))
+        self._pending = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_blocks, name='gridded-output-writer', daemon=True)
+        self._thread.start()
+
+        self._block = None
+        self._block_start = 0
+        self._next_step = 0
+        self._closed = False
+
+    @classmethod
+    def from_configuration(cls, configuration, output_directory, shape=None, calendar='standard', **kwargs):
+        """Writer for every gridded output that the configuration leaves enabled (see OutputOptions)."""
+        variables = [name for name in GRIDDED_OUTPUT_VARIABLES
+                     if name not in OUTPUT_NAME_ALIASES.values()
+                     and configuration.output.is_enabled(OUTPUT_NAME_ALIASES.get(name, name))
+                     and configuration.output.is_enabled(name)]
+        if configuration.calculation_method != 'fao56_two_stage':
+            variables = [name for name in variables if name not in FAO56_OUTPUT_VARIABLES]
+        grid = configuration.grid
+        if grid is not None:
+            kwargs.setdefault('x', grid.x)
+            kwargs.setdefault('y', grid.y)
+            shape = grid.shape if shape is None else shape
+        if shape is None:
+            raise ValueError("the control file has no GRID directive; give the grid shape")
+        return cls(output_directory, variables, shape, configuration.date_measures(calendar), **kwargs)
+
+    def _write_blocks(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            (start_day, number_of_days, block) = item
+            try:
+                if self._error is None:
+                    for index, name in enumerate(self.variables):
+                        self.stores[name].write(start_day, block[index, :number_of_days])
+            except Exception as error:
+                self._error = error
+            finally:
+                self._free_blocks.put(block)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError("gridded output writer failed") from self._error
+
+    def _flush(self, number_of_days):
+        self._pending.put((self._block_start, number_of_days, self._block))
+        self._block = None
+        self._block_start += number_of_days
+
+    def record(self, step, source):
+        """Copy today's value of every output variable of `source` (an SWBGrid) into the current block."""
+        if step != self._next_step:
+            raise ValueError(f"days must be recorded in order; expected day {self._next_step}, got {step}")
+        self._check_error()
+        if self._block is None:
+            self._block = self._free_blocks.get()
+        day = step - self._block_start
+        for index, getter in enumerate(self._getters):
+            self._block[index, day] = getter(source)
+        self._next_step += 1
+        if day + 1 == self.chunk_days:
+            self._flush(self.chunk_days)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._block is not None:
+            self._flush(self._next_step - self._block_start)
+        self._pending.put(None)
+        self._thread.join()
+        for store in self.stores.values():
+            store.close()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,53 @@
+"""
+Growing season by day of year (GROWING_SEASON).
+
+SWB2 control files give the growing season as
+
+    GROWING_SEASON <first day> <last day> [TRUE|FALSE]
+
+where the days are days of the year (133) or month/day (05/13). The season includes both days; a first day
+after the last day describes a season that wraps over the new year (southern hemisphere). The trailing flag
+of older control files is kept as `flag` but does not change the season.
+
+SWBCell and SWBGrid accept a GrowingSeason (growing_season=...) and set is_growing_season from it each day;
+the runoff curve-number method uses it to select the growing or dormant antecedent runoff condition limits.
+"""
+
+
+def season_day(value):
+    """Day of the year for a GROWING_SEASON day: a day of the year (133) or a month/day (05/13)."""
+    text = str(value).strip()
+    if '/' not in text:
+        return int(float(text))
+    (month, day) = (int(part) for part in text.split('/')[:2])
+    # month/day values are counted in a 365-day year
+    return sum((31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)[:month - 1]) + day
+
+
+class GrowingSeason:
+    """
+    The days of the year, first_day to last_day inclusive, that make up the growing season.
+    """
+
+    def __init__(self, first_day, last_day, flag=True):
+        self.first_day = season_day(first_day)
+        self.last_day = season_day(last_day)
+        self.flag = flag
+        for day in (self.first_day, self.last_day):
+            if not 1 <= day <= 366:
+                raise ValueError(f"growing season days must be between 1 and 366, not {day}")
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """The GROWING_SEASON of an SWBConfiguration, or None when the control file has none."""
+        growing_season = configuration.growing_season
+        return None if growing_season is None else cls(*growing_season)
+
+    def contains(self, day_of_year):
+        """True when day_of_year falls in the growing season."""
+        if self.first_day <= self.last_day:
+            return self.first_day <= day_of_year <= self.last_day
+        return day_of_year >= self.first_day or day_of_year <= self.last_day
+
+    def __repr__(self):
+        return f'GrowingSeason({self.first_day}, {self.last_day})'
@@ -0,0 +1,185 @@
+"""
+FAO-56 irrigation demand (IRRIGATION_METHOD FAO56).
+
+Irrigation parameters come from the irrigation lookup table (IRRIGATION_LOOKUP_TABLE), one row per land use:
+the irrigation season (irrigation_start, irrigation_end as MM/DD, irrigation_length in days), the management
+allowed depletion (mad), the application scheme and amount, the application efficiency and the fraction of
+the water drawn from groundwater. FAO56Irrigation gathers them into per-cell arrays once; each day every cell
+in season whose root-zone deficit exceeds the readily available water, RAW = p * TAW (p being mad adjusted for
+the evaporative demand, see adjust_depletion_fraction_p), is irrigated at once with array operations.
+
+Application schemes:
+
+    none                no irrigation
+    field_capacity      apply the root-zone deficit, divided by the application efficiency
+    constant_amount     apply application_amount, divided by the application efficiency
+"""
+
+import copy
+
+import numpy as np
+
+from actual_et_fao56_two_stage import adjust_depletion_fraction_p
+from crop_coefficient_curves import CALENDAR_YEAR_LENGTHS, day_of_year_from_mmdd
+from lookup_tables import data_cells
+
+
+IRRIGATION_APPLICATION_SCHEMES = ('none', 'field_capacity', 'constant_amount')
+
+
+def application_scheme_code(scheme):
+    """Return the index in IRRIGATION_APPLICATION_SCHEMES of an application scheme name (e.g. 'FIELD-CAPACITY')."""
+    if scheme is None or (isinstance(scheme, float) and np.isnan(scheme)):
+        return 0
+    name = str(scheme).strip().lower().replace('-', '_').replace(' ', '_')
+    if name not in IRRIGATION_APPLICATION_SCHEMES:
+        raise ValueError(f"unknown irrigation application scheme '{scheme}'; use one of "
+                         f"{IRRIGATION_APPLICATION_SCHEMES}")
+    return IRRIGATION_APPLICATION_SCHEMES.index(name)
+
+
+class FAO56Irrigation:
+    """
+    Per-cell irrigation parameters and the daily irrigation calculation.
+
+    shape                               Grid shape; () for a single cell.
+    management_allowed_depletion        Depletion fraction (of TAW) that triggers irrigation, before adjustment.
+    irrigation_start_doy                First day of the irrigation season, and likewise the last day: an
+    irrigation_end_doy                  array, or a dict of arrays keyed by the number of days in the year
+                                        (see crop_coefficient_curves.CALENDAR_YEAR_LENGTHS).
+    irrigation_length                   Maximum length of the irrigation season, in days.
+    application_scheme                  Codes into IRRIGATION_APPLICATION_SCHEMES.
+    application_amount                  Amount applied by the 'constant_amount' scheme (mm).
+    application_efficiency              Fraction of the applied water that meets the crop demand.
+    fraction_from_groundwater           Fraction of the applied water drawn from groundwater.
+    irrigation_mask                     Fraction of each cell that is irrigated (IRRIGATION_MASK).
+
+    Scalar arguments are broadcast to the grid shape.
+    """
+
+    def __init__(self, shape=(), management_allowed_depletion=0.5, irrigation_start_doy=1, irrigation_end_doy=366,
+                 irrigation_length=9999, application_scheme=1, application_amount=0., application_efficiency=1.,
+                 fraction_from_groundwater=1., irrigation_mask=1.):
+        self.shape = tuple(shape)
+        self.management_allowed_depletion = self._array(management_allowed_depletion)
+        if not isinstance(irrigation_start_doy, dict):
+            irrigation_start_doy = dict.fromkeys(CALENDAR_YEAR_LENGTHS, irrigation_start_doy)
+        if not isinstance(irrigation_end_doy, dict):
+            irrigation_end_doy = dict.fromkeys(CALENDAR_YEAR_LENGTHS, irrigation_end_doy)
+        self.irrigation_start_doy = {n: self._array(values) for n, values in irrigation_start_doy.items()}
+        self.irrigation_end_doy = {n: np.minimum(self._array(values),
+                                                 self.irrigation_start_doy[n] + self._array(irrigation_length) - 1.)
+                                   for n, values in irrigation_end_doy.items()}
+        self.application_scheme = np.empty(self.shape, dtype=np.uint8)
+        self.application_scheme[...] = application_scheme
+        self.application_amount = self._array(application_amount)
+        self.application_efficiency = self._array(application_efficiency)
+        self.fraction_from_groundwater = self._array(fraction_from_groundwater)
+        self.irrigation_mask = self._array(irrigation_mask)
+
+        # cells that can ever be irrigated; the daily calculation skips everything else
+        self.is_irrigable = (self.application_scheme != 0) & (self.irrigation_mask > 0.) & \
+                            (self.application_efficiency > 0.)
+
+        self.irrigation = self._array(0.)
+        self.irrigation_from_groundwater = self._array(0.)
+        self.irrigation_from_surface_water = self._array(0.)
+
+    def _array(self, values):
+        array = np.empty(self.shape, dtype=np.float64)
+        array[...] = values
+        return array
+
+    def select_rows(self, rows):
+        """
+        Return a copy holding the parameters of the cells in grid rows `rows` (a slice), for
+        swb_parallel.run_sharded.
+        """
+        selected = copy.copy(self)
+        for name, values in vars(self).items():
+            if isinstance(values, np.ndarray) and values.shape == self.shape:
+                setattr(selected, name, values[rows].copy())
+            elif isinstance(values, dict):
+                setattr(selected, name, {n: doy[rows].copy() for n, doy in values.items()})
+        selected.shape = selected.irrigation.shape
+        return selected
+
+    @classmethod
+    def from_lookup_table(cls, lookup_table, lu_grid, irrigation_mask=1., active=None, mm_per_table_unit=25.4):
+        """
+        Gather the irrigation parameters from a CompiledLookupTable of the irrigation lookup table for every
+        cell of lu_grid. application_amount is converted to mm with mm_per_table_unit (SWB2 tables are in
+        inches). When the table has no mad column, depletion_fraction is used. Cells outside `active` (default:
+        the cells of lu_grid holding data, see lookup_tables.data_cells) are never irrigated.
+        """
+        codes = lookup_table.codes
+        if active is None:
+            active = data_cells(lu_grid)
+        lookup_table.validate(lu_grid, active=active)
+        active = np.asarray(active, dtype=bool)
+        # inactive cells are gathered from code 0, which always indexes safely, and masked out below
+        lu_grid = np.where(active, lu_grid, 0).astype(np.intp)
+
+        def per_code(name, default):
+            if name not in lookup_table.parameters:
+                return np.full(lookup_table.code_axis_length, default, dtype=np.float64)
+            return lookup_table.table(name)
+
+        mad = per_code('mad' if 'mad' in lookup_table.parameters else 'depletion_fraction', 0.5)
+
+        start_doy = {}
+        end_doy = {}
+        for number_of_days_in_year in CALENDAR_YEAR_LENGTHS:
+            for (column, default, doy) in (('irrigation_start', 1., start_doy), ('irrigation_end', 366., end_doy)):
+                dense = np.full(lookup_table.code_axis_length, default)
+                if column in lookup_table.parameters:
+                    dense[codes] = day_of_year_from_mmdd(lookup_table.table(column)[codes], default,
+                                                         number_of_days_in_year)
+                doy[number_of_days_in_year] = dense[lu_grid]
+
+        scheme = np.zeros(lookup_table.code_axis_length, dtype=np.uint8)
+        if 'application_scheme' in lookup_table.parameters:
+            scheme[codes] = [application_scheme_code(value) for value in lookup_table.table('application_scheme')[codes]]
+
+        return cls(lu_grid.shape,
+                   management_allowed_depletion=mad[lu_grid],
+                   irrigation_start_doy=start_doy,
+                   irrigation_end_doy=end_doy,
+                   irrigation_length=per_code('irrigation_length', 9999.)[lu_grid],
+                   application_scheme=scheme[lu_grid],
+                   application_amount=per_code('application_amount', 0.)[lu_grid] * mm_per_table_unit,
+                   application_efficiency=per_code('irrigation_application_efficiency', 1.)[lu_grid],
+                   fraction_from_groundwater=per_code('fraction_irrigation_from_gw', 1.)[lu_grid],
+                   irrigation_mask=np.where(active, irrigation_mask, 0.))
+
+    def calculate(self, day_of_year, number_of_days_in_year, pet, soil_storage, soil_storage_max):
+        """
+        Return the irrigation (mm) applied today to every cell.
+
+        day_of_year, number_of_days_in_year     Today's date measures.
+        pet                                     Reference evapotranspiration (mm).
+        soil_storage                            Root-zone storage, including today's infiltration (mm).
+        soil_storage_max                        Root-zone storage at field capacity, TAW (mm).
+        """
+        n = int(number_of_days_in_year)
+        if n not in self.irrigation_start_doy or n not in self.irrigation_end_doy:
+            raise ValueError(f"no irrigation season is defined for years of {n} days; the season is given for "
+                             f"years of {sorted(self.irrigation_start_doy)} days")
+        in_season = (day_of_year >= self.irrigation_start_doy[n]) & (day_of_year <= self.irrigation_end_doy[n])
+        in_season &= self.is_irrigable
+
+        self.irrigation[...] = 0.
+        if in_season.any():
+            p = np.clip(adjust_depletion_fraction_p(self.management_allowed_depletion, pet), 0., 1.)
+            readily_available_water_raw = p * soil_storage_max
+            deficit = np.maximum(soil_storage_max - soil_storage, 0.)
+            irrigate = in_season & (deficit > readily_available_water_raw)
+
+            amount = np.where(self.application_scheme == 1, deficit, self.application_amount)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                amount = amount / self.application_efficiency * self.irrigation_mask
+            np.copyto(self.irrigation, amount, where=irrigate)
+
+        np.multiply(self.irrigation, self.fraction_from_groundwater, out=self.irrigation_from_groundwater)
+        np.subtract(self.irrigation, self.irrigation_from_groundwater, out=self.irrigation_from_surface_water)
+        return self.irrigation
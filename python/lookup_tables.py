@@ -0,0 +1,205 @@
+"""
+Compiler for SWB2 lookup tables (LU_lookup_*.txt, IRR_lookup_*.txt).
+
+Lookup tables are tab-separated, one row per land-use code (lu_code). Parameters that vary with hydrologic
+soil group are spread over numbered columns (cn_1 .. cn_7, max_net_infil_1 .. 7, rz_1 .. 7, rew_1 .. 7, ...).
+CompiledLookupTable turns a table into dense NumPy arrays indexed directly by land-use code, and for the
+numbered parameters also by soil group, so the parameter grid for a whole model domain is a single gather:
+
+    cn = lookup.table('cn')[lu_grid, hsg_grid]      # or lookup.gather('cn', lu_grid, hsg_grid)
+
+Cells outside the model domain hold the grids' nodata value; validate() and assign() skip them unless told
+which cells are active (see data_cells).
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+SOIL_GROUP_COLUMN = re.compile(r'^(?P<name>.+)_(?P<soil_group>\d+)$')
+
+# both table axes cover at least 0..255, so uint8 land-use and soil-group grids (including the nodata value of
+# their binary caches) always index safely; values not in the table gather NaN
+MINIMUM_AXIS_LENGTH = 256
+
+
+def read_lookup_table(filename):
+    """Read a tab-separated lookup table, stripping stray spaces from the column names."""
+    df = pd.read_csv(filename, sep='\t')
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def nodata_mask(values, nodata_value=None):
+    """
+    Cells of a grid holding nodata: those equal to nodata_value when it is given, otherwise NaN cells of a
+    float grid, or cells holding the type's largest value in an integer grid (how the binary grid caches of
+    arc_ascii_grid.py store nodata, e.g. 255 in a uint8 HSG grid).
+    """
+    values = np.asarray(values)
+    if nodata_value is not None:
+        return values == nodata_value
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    if values.dtype.kind in 'iu':
+        return values == np.iinfo(values.dtype).max
+    return np.zeros(values.shape, dtype=bool)
+
+
+def data_cells(lu_grid, hsg_grid=None):
+    """Cells that hold data in the land-use grid and, when it is given, in the soil-group grid."""
+    active = ~nodata_mask(lu_grid)
+    if hsg_grid is not None:
+        active &= ~nodata_mask(hsg_grid)
+    return active
+
+
+def _unique_values(values):
+    values = np.asarray(values).ravel()
+    if values.dtype.kind == 'u' and values.dtype.itemsize <= 2:
+        return np.flatnonzero(np.bincount(values))
+    return np.unique(values)
+
+
+class CompiledLookupTable:
+    """
+    Dense per-code parameter arrays built from a lookup table.
+
+    df                  The lookup table (see read_lookup_table).
+    code_column         Column holding the land-use code.
+    name                Used in error messages (e.g. the table's filename).
+
+    table(name) returns, for a per-code parameter, an array of length code_axis_length; for a soil-group
+    parameter (name_1 .. name_n), a 2-D array whose column k holds name_k for k = 1 .. n (every other column,
+    like every row for a code not in the table, is NaN). Numeric parameters are float64; text columns
+    (descriptions, MM/DD dates, ...) are object arrays holding None for codes not in the table.
+    """
+
+    def __init__(self, df, code_column='lu_code', name='lookup table'):
+        self.name = name
+        codes = df[code_column].to_numpy()
+        if np.any(codes < 0) or np.any(codes != np.round(codes)):
+            raise ValueError(f"{name}: land-use codes must be non-negative integers")
+        codes = codes.astype(np.intp)
+        (unique_codes, counts) = np.unique(codes, return_counts=True)
+        duplicates = unique_codes[counts > 1]
+        if duplicates.size:
+            raise ValueError(f"{name}: land-use codes {duplicates.tolist()} appear more than once")
+
+        self.codes = np.sort(codes)
+        self.code_axis_length = max(int(codes.max()) + 1, MINIMUM_AXIS_LENGTH)
+        self.is_valid_code = np.zeros(self.code_axis_length, dtype=bool)
+        self.is_valid_code[codes] = True
+
+        soil_group_columns = {}
+        self._tables = {}
+        for column in df.columns:
+            if column == code_column:
+                continue
+            match = SOIL_GROUP_COLUMN.match(column)
+            if match:
+                soil_group_columns.setdefault(match.group('name'), {})[int(match.group('soil_group'))] = column
+            else:
+                self._tables[column] = self._dense(df[column], codes)
+
+        self.number_of_soil_groups = {}
+        for parameter, columns in soil_group_columns.items():
+            number_of_soil_groups = max(columns)
+            dense = [self._dense(df[columns[group]], codes) if group in columns else None
+                     for group in range(1, number_of_soil_groups + 1)]
+            if any(column is None or column.dtype == object for column in dense):
+                # not a complete numeric set (e.g. a text column that happens to end in _<digit>)
+                for group, column in columns.items():
+                    self._tables[column] = self._dense(df[column], codes)
+                continue
+            table = np.full((self.code_axis_length, max(number_of_soil_groups + 1, MINIMUM_AXIS_LENGTH)), np.nan)
+            table[:, 1:number_of_soil_groups + 1] = np.stack(dense, axis=1)
+            self._tables[parameter] = table
+            self.number_of_soil_groups[parameter] = number_of_soil_groups
+
+    def _dense(self, series, codes):
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            dense = np.full(self.code_axis_length, np.nan)
+            dense[codes] = series.to_numpy(dtype=np.float64)
+        else:
+            dense = np.full(self.code_axis_length, None, dtype=object)
+            dense[codes] = series.to_numpy(dtype=object)
+        return dense
+
+    @classmethod
+    def from_file(cls, filename, code_column='lu_code'):
+        return cls(read_lookup_table(filename), code_column=code_column, name=str(filename))
+
+    @property
+    def parameters(self):
+        return list(self._tables)
+
+    def is_soil_group_parameter(self, name):
+        return name in self.number_of_soil_groups
+
+    def table(self, name):
+        try:
+            return self._tables[name]
+        except KeyError:
+            raise KeyError(f"{self.name} has no parameter '{name}'")
+
+    def validate(self, lu_grid, hsg_grid=None, active=None, parameters=()):
+        """
+        Check that every land-use code in lu_grid appears in the table and, when hsg_grid is given, that every
+        soil group has a column for each soil-group parameter in `parameters`. Only cells where `active` is
+        True (default: the cells with data in both grids, see data_cells) are checked. Raises ValueError
+        listing the offending values.
+        """
+        lu_grid = np.asarray(lu_grid)
+        if active is None:
+            active = data_cells(lu_grid, hsg_grid)
+        lu_grid = lu_grid[active]
+        hsg_grid = np.asarray(hsg_grid)[active] if hsg_grid is not None else None
+
+        lu_codes = _unique_values(lu_grid)
+        in_range = lu_codes < self.code_axis_length
+        missing = np.concatenate([lu_codes[~in_range], lu_codes[in_range][~self.is_valid_code[lu_codes[in_range]]]])
+        if missing.size:
+            raise ValueError(f"land-use codes {sorted(missing.tolist())} in the grid are missing from {self.name}")
+
+        if hsg_grid is not None:
+            soil_groups = _unique_values(hsg_grid)
+            for parameter in parameters:
+                if not self.is_soil_group_parameter(parameter):
+                    continue
+                unsupported = soil_groups[(soil_groups < 1) | (soil_groups > self.number_of_soil_groups[parameter])]
+                if unsupported.size:
+                    raise ValueError(f"soil groups {unsupported.tolist()} in the grid have no '{parameter}' column "
+                                     f"in {self.name} (columns 1..{self.number_of_soil_groups[parameter]})")
+
+    def gather(self, name, lu_grid, hsg_grid=None, out=None):
+        """Return parameter `name` for every cell: table[lu_grid] or, for soil-group parameters, table[lu_grid, hsg_grid]."""
+        table = self.table(name)
+        if table.ndim == 2:
+            if hsg_grid is None:
+                raise ValueError(f"'{name}' varies with soil group; an hsg_grid is required")
+            index = np.ravel_multi_index((np.asarray(lu_grid, dtype=np.intp), np.asarray(hsg_grid, dtype=np.intp)),
+                                         table.shape)
+            return np.take(table.ravel(), index, out=out)
+        return np.take(table, np.asarray(lu_grid, dtype=np.intp), out=out)
+
+    def assign(self, names, lu_grid, hsg_grid=None, active=None):
+        """
+        Validate the grids, then return {name: parameter grid} for each of `names`. Cells outside `active`
+        (default: the cells with data in both grids) are NaN, or None for text parameters.
+        """
+        if active is None:
+            active = data_cells(lu_grid, hsg_grid)
+        self.validate(lu_grid, hsg_grid, active=active, parameters=names)
+        inactive = ~np.asarray(active, dtype=bool)
+        if inactive.any():
+            # gather the inactive cells from code (and soil group) 0, which always indexes safely
+            lu_grid = np.where(inactive, 0, lu_grid)
+            hsg_grid = np.where(inactive, 0, hsg_grid) if hsg_grid is not None else None
+        parameters = {name: self.gather(name, lu_grid, hsg_grid) for name in names}
+        if inactive.any():
+            for values in parameters.values():
+                values[inactive] = None if values.dtype == object else np.nan
+        return parameters
@@ -0,0 +1,343 @@
+"""
+Streaming reader for gridded daily weather stored in NetCDF files (Gridmet, Daymet, nclimgrid, CMIP6, ...).
+
+Each of the PRECIPITATION, TMAX and TMIN inputs is described by the same control-file keywords SWB2 uses:
+
+    PRECIPITATION NETCDF <filename>             the filename may contain %y (year) and %m (month), e.g.
+                                                prcp_%y.nc, for data split over several files
+    PRECIPITATION_NETCDF_Z_VAR <name>           data variable (default prcp / tmax / tmin)
+    PRECIPITATION_NETCDF_X_VAR <name>           x coordinate variable (default x)
+    PRECIPITATION_NETCDF_Y_VAR <name>           y coordinate variable (default y)
+    PRECIPITATION_NETCDF_TIME_VAR <name>        time coordinate variable (default time)
+    PRECIPITATION_UNITS_<MILLIMETERS|INCHES>    TMAX_/TMIN_UNITS_<KELVIN|CELSIUS|FAHRENHEIT>; as in SWB2, inches
+                                                and degrees Fahrenheit are assumed when no units are given
+    PRECIPITATION_SCALE_FACTOR <value>          values are multiplied by the scale factor and then the
+    PRECIPITATION_ADD_OFFSET <value>            offset is added, before units are converted
+    PRECIPITATION_MISSING_VALUES_CODE <value>   cells whose (stored) value compares true against the code
+    PRECIPITATION_MISSING_VALUES_OPERATOR <op>  using the operator (<, <=, >, >=, ==), or that hold NaN or the
+    PRECIPITATION_MISSING_VALUES_ACTION <act>   _FillValue, are replaced by zero ('zero') or by the mean of the
+                                                day's valid values ('mean')
+    PRECIPITATION_GRID_PROJECTION_DEFINITION    PROJ4 string for the weather grid
+
+Grids are returned in model units (millimeters and degrees Celsius) as float64 arrays of shape (n_y, n_x),
+in the row order of the file. Only one time slice of each file is read at a time, so files of any length
+can be streamed.
+
+netcdf-c is not thread safe, so every netCDF4 call made here (and by the NetCDF output writer, see
+gridded_output.py) holds NETCDF_LOCK; the prefetch thread and the output writer thread take turns in the
+library, while unit conversion and missing-value handling run outside the lock.
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import netCDF4
+
+from control_file import read_control_file, get_argument, get_text, has_keyword, resolve_path
+from date_measures import date_measures_from_time_values, date_measures_for_period
+
+
+WEATHER_VARIABLE_DEFAULTS = {
+    # control file prefix: (default z variable name, default units)
+    'PRECIPITATION': ('prcp', 'INCHES'),
+    'TMAX':          ('tmax', 'FAHRENHEIT'),
+    'TMIN':          ('tmin', 'FAHRENHEIT'),
+}
+
+UNIT_CONVERSIONS = {
+    # units: function converting to model units (mm or degrees C)
+    'MILLIMETERS': lambda values: values,
+    'INCHES':      lambda values: values * 25.4,
+    'CELSIUS':     lambda values: values,
+    'KELVIN':      lambda values: values - 273.15,
+    'FAHRENHEIT':  lambda values: (values - 32.) / 1.8,
+}
+
+# held around every call into netCDF4 / netcdf-c; reentrant, as open() reads the time coordinate
+NETCDF_LOCK = threading.RLock()
+
+MISSING_VALUE_OPERATORS = {
+    '<':  np.less,
+    '<=': np.less_equal,
+    '>':  np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '=':  np.equal,
+}
+
+
+def date_key(year, month, day):
+    return int(year) * 10000 + int(month) * 100 + int(day)
+
+
+class NetCDFWeatherGrid:
+    """
+    One gridded NetCDF weather input (precipitation, tmax or tmin).
+
+    Files are opened when first needed; for filename templates (%y, %m) the previously open file is closed
+    when the next one is opened, so a multi-year run keeps a single file open per input.
+    """
+
+    def __init__(self, filename, z_var, x_var='x', y_var='y', time_var='time', units='MILLIMETERS',
+                 scale_factor=1.0, add_offset=0.0, missing_value_code=None, missing_value_operator='<=',
+                 missing_value_action='zero', projection_definition=None):
+        self.filename = str(filename)
+        self.z_var = z_var
+        self.x_var = x_var
+        self.y_var = y_var
+        self.time_var = time_var
+        self.units = units.upper()
+        if self.units not in UNIT_CONVERSIONS:
+            raise ValueError(f"unsupported units '{units}'; expected one of {sorted(UNIT_CONVERSIONS)}")
+        self.scale_factor = scale_factor
+        self.add_offset = add_offset
+        self.missing_value_code = missing_value_code
+        if missing_value_operator not in MISSING_VALUE_OPERATORS:
+            raise ValueError(f"unsupported missing values operator '{missing_value_operator}'")
+        self.missing_value_operator = missing_value_operator
+        self.missing_value_action = missing_value_action.lower()
+        if self.missing_value_action not in ('zero', 'mean'):
+            raise ValueError(f"unsupported missing values action '{missing_value_action}'; expected 'zero' or 'mean'")
+        self.projection_definition = projection_definition
+
+        self._dataset = None
+        self._dataset_filename = None
+        self._time_index = None
+
+    @classmethod
+    def from_control_file(cls, directives, prefix, data_directory=None):
+        """Build the input named by `prefix` ('PRECIPITATION', 'TMAX' or 'TMIN') from read_control_file output."""
+        prefix = prefix.upper()
+        (default_z_var, default_units) = WEATHER_VARIABLE_DEFAULTS[prefix]
+        if get_argument(directives, prefix, index=0, default='').upper() != 'NETCDF':
+            raise ValueError(f"control file does not define {prefix} as a NETCDF input")
+
+        units = default_units
+        for candidate in UNIT_CONVERSIONS:
+            if has_keyword(directives, f'{prefix}_UNITS_{candidate}'):
+                units = candidate
+
+        code = get_argument(directives, f'{prefix}_MISSING_VALUES_CODE')
+        return cls(resolve_path(get_argument(directives, prefix, index=1), data_directory),
+                   z_var=get_argument(directives, f'{prefix}_NETCDF_Z_VAR', default_z_var),
+                   x_var=get_argument(directives, f'{prefix}_NETCDF_X_VAR', 'x'),
+                   y_var=get_argument(directives, f'{prefix}_NETCDF_Y_VAR', 'y'),
+                   time_var=get_argument(directives, f'{prefix}_NETCDF_TIME_VAR', 'time'),
+                   units=units,
+                   scale_factor=float(get_argument(directives, f'{prefix}_SCALE_FACTOR', 1.0)),
+                   add_offset=float(get_argument(directives, f'{prefix}_ADD_OFFSET', 0.0)),
+                   missing_value_code=float(code) if code is not None else None,
+                   missing_value_operator=get_argument(directives, f'{prefix}_MISSING_VALUES_OPERATOR', '<='),
+                   missing_value_action=get_argument(directives, f'{prefix}_MISSING_VALUES_ACTION', 'zero'),
+                   projection_definition=get_text(directives, f'{prefix}_GRID_PROJECTION_DEFINITION'))
+
+    def filename_for(self, year, month):
+        return re.sub('%y', f'{year:04d}', re.sub('%m', f'{month:02d}', self.filename))
+
+    def open(self, year, month):
+        """Make the file holding (year, month) the open file, and return the netCDF4 Dataset."""
+        filename = self.filename_for(year, month)
+        with NETCDF_LOCK:
+            if filename != self._dataset_filename:
+                self.close()
+                self._dataset = netCDF4.Dataset(filename)
+                self._dataset_filename = filename
+
+                variable = self._dataset.variables[self.z_var]
+                variable.set_auto_mask(False)
+                self._fill_value = getattr(variable, '_FillValue', None)
+                time = self._dataset.variables[self.time_var]
+                self._time_axis = variable.dimensions.index(time.dimensions[0])
+                self._transpose = variable.dimensions.index(self._dataset.variables[self.y_var].dimensions[0]) > \
+                                  variable.dimensions.index(self._dataset.variables[self.x_var].dimensions[-1])
+
+                measures = self.time_measures()
+                self._time_index = {date_key(*ymd): index
+                                    for index, ymd in enumerate(zip(measures.year, measures.month, measures.day))}
+        return self._dataset
+
+    def time_measures(self):
+        """DateMeasures of the open file's time coordinate."""
+        with NETCDF_LOCK:
+            time = self._dataset.variables[self.time_var]
+            (values, units, calendar) = (time[:], time.units, getattr(time, 'calendar', 'standard'))
+        return date_measures_from_time_values(values, units, calendar)
+
+    @property
+    def calendar(self):
+        with NETCDF_LOCK:
+            return getattr(self._dataset.variables[self.time_var], 'calendar', 'standard')
+
+    @property
+    def x(self):
+        with NETCDF_LOCK:
+            return np.asarray(self._dataset.variables[self.x_var][:])
+
+    @property
+    def y(self):
+        with NETCDF_LOCK:
+            return np.asarray(self._dataset.variables[self.y_var][:])
+
+    def missing_days(self, date_measures):
+        """
+        Return the 'YYYY-MM-DD' days of date_measures that the file has no data for. Every day is checked in a
+        single file; for files named by a %y / %m template only the first and last days are.
+        """
+        days = list(zip(date_measures.year.tolist(), date_measures.month.tolist(), date_measures.day.tolist()))
+        if '%' in self.filename:
+            days = [days[0], days[-1]]
+        missing = []
+        for (year, month, day) in days:
+            self.open(year, month)
+            if date_key(year, month, day) not in self._time_index:
+                missing.append(f'{year:04d}-{month:02d}-{day:02d}')
+        return missing
+
+    def read(self, year, month, day):
+        """Return the grid for one day, in model units, with missing values replaced."""
+        self.open(year, month)
+        try:
+            time_index = self._time_index[date_key(year, month, day)]
+        except KeyError:
+            raise KeyError(f"{self._dataset_filename} has no {self.z_var} data for {year:04d}-{month:02d}-{day:02d}")
+
+        with NETCDF_LOCK:
+            variable = self._dataset.variables[self.z_var]
+            selection = [slice(None)] * variable.ndim
+            selection[self._time_axis] = time_index
+            values = np.asarray(variable[tuple(selection)], dtype=np.float64)
+        if self._transpose:
+            values = values.T
+
+        missing = np.isnan(values)
+        if self._fill_value is not None and not np.isnan(self._fill_value):
+            missing |= values == self._fill_value
+        if self.missing_value_code is not None:
+            missing |= MISSING_VALUE_OPERATORS[self.missing_value_operator](values, self.missing_value_code)
+
+        values *= self.scale_factor
+        values += self.add_offset
+        values = UNIT_CONVERSIONS[self.units](values)
+
+        if missing.any():
+            if self.missing_value_action == 'mean':
+                valid = values[~missing]
+                values[missing] = valid.mean() if valid.size else np.nan
+            else:
+                values[missing] = 0.0
+        return values
+
+    def close(self):
+        if self._dataset is not None:
+            with NETCDF_LOCK:
+                self._dataset.close()
+        self._dataset = None
+        self._dataset_filename = None
+        self._time_index = None
+
+
+class NetCDFWeatherSource:
+    """
+    Daily precipitation, tmin and tmax grids streamed from NetCDF files.
+
+    daily_grids() is a generator of (precip, tmin, tmax) arrays, one day at a time. Each day is read (one time
+    slice per file) on a background thread while the caller works on the previous day, so reading overlaps
+    the model calculations. Use as a context manager, or call close(), to release the files.
+    """
+
+    def __init__(self, precipitation, tmin, tmax, start_date=None, end_date=None, prefetch=True):
+        self.precipitation = precipitation
+        self.tmin = tmin
+        self.tmax = tmax
+        self.start_date = start_date
+        self.end_date = end_date
+        self.prefetch = prefetch
+
+    @classmethod
+    def from_control_file(cls, control_file, data_directory=None, prefetch=True):
+        """
+        Build the weather source from a control file (a path, or the dict returned by read_control_file).
+        Relative filenames are resolved against data_directory (cf. SWB2's --weather_data_dir); the run
+        window defaults to the file's START_DATE and END_DATE.
+        """
+        directives = control_file if isinstance(control_file, dict) else read_control_file(control_file)
+        return cls(*[NetCDFWeatherGrid.from_control_file(directives, prefix, data_directory)
+                     for prefix in ('PRECIPITATION', 'TMIN', 'TMAX')],
+                   start_date=get_argument(directives, 'START_DATE'),
+                   end_date=get_argument(directives, 'END_DATE'),
+                   prefetch=prefetch)
+
+    @property
+    def grids(self):
+        return (self.precipitation, self.tmin, self.tmax)
+
+    def date_measures(self, start_date=None, end_date=None):
+        """DateMeasures for the run window, in the calendar of the precipitation file."""
+        start_date = self.start_date if start_date is None else start_date
+        end_date = self.end_date if end_date is None else end_date
+        if start_date is None or end_date is None:
+            # no window given: fall back on the time coordinate of the precipitation file
+            if '%' in self.precipitation.filename:
+                raise ValueError("a start and end date are required when weather filenames are templates")
+            self.precipitation.open(0, 0)
+            measures = self.precipitation.time_measures()
+            return date_measures_for_period(start_date or measures.dtindex[0], end_date or measures.dtindex[-1],
+                                            measures.calendar)
+
+        start = date_measures_for_period(start_date, start_date)
+        self.precipitation.open(int(start.year[0]), int(start.month[0]))
+        measures = date_measures_for_period(start_date, end_date, self.precipitation.calendar)
+
+        # fail now, rather than part way through the run, when the files do not cover the window
+        for grid in self.grids:
+            missing = grid.missing_days(measures)
+            if missing:
+                available = grid.time_measures()
+                raise ValueError(f"{grid._dataset_filename} has no {grid.z_var} data for "
+                                 f"{', '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}; it covers "
+                                 f"{available.year[0]:04d}-{available.month[0]:02d}-{available.day[0]:02d} to "
+                                 f"{available.year[-1]:04d}-{available.month[-1]:02d}-{available.day[-1]:02d}, "
+                                 f"the run window is {start_date} to {end_date}")
+        return measures
+
+    def read_day(self, year, month, day):
+        return tuple(grid.read(year, month, day) for grid in self.grids)
+
+    def daily_grids(self, start_date=None, end_date=None, date_measures=None):
+        """
+        Yield (precip, tmin, tmax) grids for each day of the run window (or of `date_measures`, if given).
+        """
+        if date_measures is None:
+            date_measures = self.date_measures(start_date, end_date)
+        days = zip(date_measures.year.tolist(), date_measures.month.tolist(), date_measures.day.tolist())
+
+        if not self.prefetch:
+            for ymd in days:
+                yield self.read_day(*ymd)
+            return
+
+        # a single reader thread does all of the file access, one day ahead of the caller
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            pending = None
+            for ymd in days:
+                upcoming = reader.submit(self.read_day, *ymd)
+                if pending is not None:
+                    yield pending.result()
+                pending = upcoming
+            if pending is not None:
+                yield pending.result()
+
+    def close(self):
+        for grid in self.grids:
+            grid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self.daily_grids()
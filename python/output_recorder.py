@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_OUTPUT_VARIABLES = ['date','previous_soil_storage','soil_storage','rainfall',
+                            'snow_storage', 'snowfall', 'snowmelt','pet','p_minus_pet',
+                            'aet','net_infiltration','apwl','gdd']
+
+
+class OutputRecorder:
+    """
+    Preallocated, columnar recorder for daily model output.
+
+    One NumPy array is allocated per selected variable, sized to the length of the run, and each call to
+    record() copies the current value of every selected attribute of the model object (an SWBCell, or an
+    SWBGrid when `shape` is given) into position `step`. Nothing is allocated while the model runs.
+
+    number_of_steps     Number of timesteps (days) in the run.
+    variables           Names of the model attributes to record; defaults to DEFAULT_OUTPUT_VARIABLES.
+                        'date' is stored as datetime64; every other variable as float64.
+    shape               Shape of each recorded value: () for a single cell, or the grid shape for SWBGrid.
+    """
+
+    def __init__(self, number_of_steps, variables=None, shape=()):
+        self.number_of_steps = number_of_steps
+        self.variables = list(DEFAULT_OUTPUT_VARIABLES if variables is None else variables)
+        self.shape = tuple(shape)
+        self.arrays = {}
+        for name in self.variables:
+            dtype = 'datetime64[us]' if name == 'date' else np.float64
+            self.arrays[name] = np.empty((number_of_steps,) + self.shape, dtype=dtype)
+        self._items = list(self.arrays.items())
+
+    def record(self, step, source):
+        for name, values in self._items:
+            values[step] = getattr(source, name)
+
+    def to_dataframe(self, index=None):
+        """
+        Return the recorded values as a dataframe with one column per variable. The dataframe is built
+        directly on the recorder's arrays (no copy); only single-cell recorders can be converted.
+        """
+        if self.shape != ():
+            raise ValueError("only single-cell output (shape=()) can be converted to a dataframe")
+        return pd.DataFrame(self.arrays, index=index, copy=False)
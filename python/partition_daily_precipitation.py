@@ -1,3 +1,5 @@
+import numpy as np
+
 def partition_daily_precip(gross_precipitation: float,
                            tmin_c: float, 
                            tmax_c: float, 
@@ -13,6 +15,8 @@ def partition_daily_precip(gross_precipitation: float,
         tmin_c (float): daily minimum air temperature, in degrees Celsius
         tmax_c (float): daily maximum air temperature, in degrees Celsius
         tmean_c (float): daily mean air temperature, in degrees Celsius
+
+    Arguments are scalars (one cell); see partition_daily_precip_grid for arrays.
     """
     def c_to_f(t):
         return t*1.8 + 32.
@@ -34,6 +38,25 @@ def partition_daily_precip(gross_precipitation: float,
 
     return rainfall, snowfall
 
+def partition_daily_precip_grid(gross_precipitation, tmin_c, tmax_c, tmean_c):
+    """Array form of partition_daily_precip, used by SWBGrid. Arguments are NumPy arrays of matching (or
+    broadcastable) shape; rainfall and snowfall are returned as arrays.
+    """
+    def c_to_f(t):
+        return t*1.8 + 32.
+
+    # same snowfall criteria as partition_daily_precip
+    FREEZING_PT_DEG_F = 32.0
+
+    snowfall_threshold = c_to_f(tmean_c) - (c_to_f(tmax_c) - c_to_f(tmin_c)) / 3.
+
+    is_snowfall = snowfall_threshold <= FREEZING_PT_DEG_F
+
+    snowfall = np.where(is_snowfall, gross_precipitation, 0.)
+    rainfall = np.where(is_snowfall, 0., gross_precipitation)
+
+    return rainfall, snowfall
+
 def references():
     """
     Dripps, W.R., 2003, The spatial and temporal variability of groundwater recharge within the Trout Lake 
@@ -1,4 +1,5 @@
-from numpy import nanmax, float_power, pi
+from numpy import (fmax, float_power, pi, errstate, add, subtract, multiply, empty, empty_like,
+                   broadcast_shapes, shape, ndim)
 
 from solar_and_meteorological_functions import relative_earth_sun_distance__D_r, \
                                                 solar_declination__delta,         \
@@ -11,7 +12,7 @@ DEGREES_TO_RADIANS = (2.0 * pi) / 360.0
 RADIANS_TO_DEGREES = 360.0 / (2.0 * pi) 
 
 def et0_hargreaves_samani(extraterrestrial_radiation__Ra, air_temp_min, air_temp_max, air_temp_mean, 
-                            et_slope=0.0023, et_constant=17.8, et_exponent=0.5):
+                            et_slope=0.0023, et_constant=17.8, et_exponent=0.5, out=None, work=None):
     """
     Return the daily reference evapotranspriation in millimeters given extraterrestrial
     radiation (expressed as the number of millimeters of water that could be evaporated by
@@ -19,19 +20,40 @@ def et0_hargreaves_samani(extraterrestrial_radiation__Ra, air_temp_min, air_temp
 
     Implemented as equation 4 in Hagreaves and Samani (1985) and as equation 50 in Allen and others (1998).
 
+    If `out` is given, the result is written into it; `work` may supply a second array of the same shape
+    to hold intermediate values, in which case no temporary arrays are allocated. `work` may be the same
+    array as extraterrestrial_radiation__Ra, which is then overwritten.
     """
-    air_temp_delta = air_temp_max - air_temp_min
+    if out is None:
+        air_temp_delta = air_temp_max - air_temp_min
 
-    et0 = nanmax((0.0,
-                  et_slope * extraterrestrial_radiation__Ra * (air_temp_mean + et_constant)          \
-                       * float_power(air_temp_delta,et_exponent)) 
-             )
+        # fmax treats NaN the same way nanmax did (a negative temperature range yields 0.0), but also
+        # works elementwise when whole grids of temperatures are passed in
+        with errstate(invalid='ignore'):
+            et0 = fmax(0.0,
+                       et_slope * extraterrestrial_radiation__Ra * (air_temp_mean + et_constant)          \
+                            * float_power(air_temp_delta,et_exponent)) 
 
-    return et0
+        return et0
+
+    if work is None:
+        work = empty_like(out)
+
+    # same order of operations as above, so results are identical to the allocating version
+    with errstate(invalid='ignore'):
+        multiply(et_slope, extraterrestrial_radiation__Ra, out=work)
+        add(air_temp_mean, et_constant, out=out)
+        multiply(work, out, out=work)
+        subtract(air_temp_max, air_temp_min, out=out)
+        float_power(out, et_exponent, out=out)
+        multiply(work, out, out=out)
+        fmax(0.0, out, out=out)
+
+    return out
 
 
 def calculate_et0_hargreaves_samani(day_of_year, number_of_days_in_year, latitude,
-                                        air_temp_min, air_temp_max, air_temp_mean):
+                                        air_temp_min, air_temp_max, air_temp_mean, radiation_cache=None):
     """
     Return the calculated reference evapotranspiration in millimeters per day, 
     given the day number, latitude, and min, max, and mean air temperatures in Celsius.
@@ -42,20 +64,73 @@ def calculate_et0_hargreaves_samani(day_of_year, number_of_days_in_year, latitud
     air_temp_min                Minimum daily air temperature, in degrees Celsius
     air_temp_max                Maximum daily air temperature, in degrees Celsius
     air_temp_mean               Mean daily air temperature, in degrees Celsius
+    radiation_cache             Optional ExtraterrestrialRadiationCache; if supplied, extraterrestrial
+                                radiation is looked up from the cache instead of being recalculated.
     """    
-    latitude_radians = latitude * DEGREES_TO_RADIANS
+    if radiation_cache is not None:
+        Ra = radiation_cache.extraterrestrial_radiation(day_of_year, number_of_days_in_year, latitude)
+    else:
+        latitude_radians = latitude * DEGREES_TO_RADIANS
+
+        d_r     = relative_earth_sun_distance__D_r(day_of_year, number_of_days_in_year)
+        delta   = solar_declination__delta(day_of_year, number_of_days_in_year)
+        omega_s = sunrise_sunset_angle__omega_s(latitude_radians, delta)
 
-    d_r     = relative_earth_sun_distance__D_r(day_of_year, number_of_days_in_year)
-    delta   = solar_declination__delta(day_of_year, number_of_days_in_year)
-    omega_s = sunrise_sunset_angle__omega_s(latitude_radians, delta)
+        Ra = equivalent_evaporation(extraterrestrial_radiation__Ra(latitude_radians, delta, omega_s, d_r))
 
-    Ra = equivalent_evaporation(extraterrestrial_radiation__Ra(latitude_radians, delta, omega_s, d_r))
     ref_ET = et0_hargreaves_samani(Ra, air_temp_min, air_temp_max, air_temp_mean)
     #print(f"doy: {day_of_year}  number_of_days_in_year: {number_of_days_in_year}  d_r: {d_r}   delta: {delta}   omega_s: {omega_s}  Ra: {Ra}   ref_ET0: {ref_ET}  latitude_rad: {latitude_radians}")
     return ref_ET
 
 
 
+def calculate_et0_hargreaves_samani_grid(day_of_year, number_of_days_in_year, latitude,
+                                         air_temp_min, air_temp_max, air_temp_mean,
+                                         radiation_cache=None, out=None, work=None):
+    """
+    Return reference evapotranspiration in millimeters per day for whole grids or time series in one pass.
+
+    All arguments broadcast against one another following the usual NumPy rules. For a single day over
+    a grid, pass scalar day_of_year and number_of_days_in_year with temperature and latitude arrays of
+    the grid's shape. For a (time x cell) block, pass day_of_year and number_of_days_in_year as column
+    vectors (shape (n_days, 1)), latitude with shape (n_cells,), and temperatures with shape (n_days, n_cells).
+
+    day_of_year                 Day number of the current solar year.
+    number_of_days_in_year      Number of days in the solar year.
+    latitude                    Latitude (in degrees) at which calculation is to be made.
+    air_temp_min                Minimum daily air temperature, in degrees Celsius
+    air_temp_max                Maximum daily air temperature, in degrees Celsius
+    air_temp_mean               Mean daily air temperature, in degrees Celsius
+    radiation_cache             Optional ExtraterrestrialRadiationCache used to look up extraterrestrial radiation.
+    out                         Optional float64 array of the broadcast shape to receive the result.
+    work                        Optional float64 scratch array of the broadcast shape. With both `out` and
+                                `work` supplied, a daily grid calculation using a radiation cache does not
+                                allocate any arrays.
+    """
+    result_shape = broadcast_shapes(shape(day_of_year), shape(number_of_days_in_year), shape(latitude),
+                                    shape(air_temp_min), shape(air_temp_max), shape(air_temp_mean))
+    if out is None:
+        out = empty(result_shape)
+    if work is None:
+        work = empty(result_shape)
+
+    single_day = ndim(day_of_year) == 0 and ndim(number_of_days_in_year) == 0
+    if radiation_cache is not None and single_day and shape(latitude) == result_shape:
+        radiation_cache.extraterrestrial_radiation(day_of_year, number_of_days_in_year, latitude, out=work)
+    elif radiation_cache is not None:
+        work[...] = radiation_cache.extraterrestrial_radiation(day_of_year, number_of_days_in_year, latitude)
+    else:
+        latitude_radians = latitude * DEGREES_TO_RADIANS
+
+        d_r     = relative_earth_sun_distance__D_r(day_of_year, number_of_days_in_year)
+        delta   = solar_declination__delta(day_of_year, number_of_days_in_year)
+        omega_s = sunrise_sunset_angle__omega_s(latitude_radians, delta)
+
+        work[...] = equivalent_evaporation(extraterrestrial_radiation__Ra(latitude_radians, delta, omega_s, d_r))
+
+    return et0_hargreaves_samani(work, air_temp_min, air_temp_max, air_temp_mean, out=out, work=work)
+
+
 def references():
     """
     Allen, R.G., Pereira, L.S., Raes, D., and Smith, M., 1998, Crop evapotranspiration-Guidelines
@@ -0,0 +1,175 @@
+"""
+DUMP_VARIABLES point output for gridded runs.
+
+Control files select points with DUMP_VARIABLES COORDINATES x y ID name (or DUMP_VARIABLES column row); for
+each one SWB2 writes the daily trace of every model variable to
+
+    SWB2_variable_values__<ID>__col_<column>__row_<row>__x_<x>__y_<y>.csv
+
+PointOutputRecorder does the same for an SWBGrid. The points are resolved to flat cell indices once, when the
+recorder is created, and every day's values are gathered into a preallocated (points, days, variables) array:
+the SWBGrid state variables with one index into SWBGrid.state, and the few others (air temperatures, optional
+stages, derived values) one np.take each, so following dozens of wells or gauges costs far less than the grid
+step itself.
+The files are written by write_csv() at the end of the run. Values are in the units of the Python engine (mm
+and degrees Celsius), not in the inches and degrees Fahrenheit of SWB2.
+"""
+
+import pathlib as pl
+
+import numpy as np
+import pandas as pd
+
+from gridded_output import delta_soil_storage, variable_getter
+from swb_grid import GRID_STATE_VARIABLES
+
+
+def _optional(state, attribute):
+    # variables of optional stages are NaN for grids that run without them
+    def value(grid):
+        source = getattr(grid, state)
+        return np.nan if source is None else getattr(source, attribute)
+    return value
+
+
+# SWB2 column name: SWBGrid attribute, or function of the grid
+DUMP_VARIABLE_COLUMNS = {
+    'gross_precip':             'gross_precip',
+    'rainfall':                 'rainfall',
+    'snowfall':                 'snowfall',
+    'snowmelt':                 'snowmelt',
+    'snow_storage':             'snow_storage',
+    'tmin':                     'tmin_c',
+    'tmax':                     'tmax_c',
+    'tmean':                    'tmean_c',
+    'gdd':                      'gdd',
+    'continuous_frozen_ground_index': _optional('frozen_ground_index', 'cfgi'),
+    'runoff':                   'runoff',
+    'infiltration':             'infiltration',
+    'irrigation':               'irrigation',
+    'reference_ET0':            'pet',
+    'actual_ET':                'aet',
+    'crop_coefficient_kcb':     _optional('fao56', 'kcb'),
+    'bare_soil_evaporation':    _optional('fao56', 'bare_soil_evaporation'),
+    'crop_et':                  _optional('fao56', 'crop_transpiration'),
+    'P_minus_PET':              'p_minus_pet',
+    'accumulated_potential_water_loss': 'apwl',
+    'soil_storage':             'soil_storage',
+    'soil_storage_max':         'soil_storage_max',
+    'delta_soil_storage':       delta_soil_storage,
+    'net_infiltration':         'net_infiltration',
+}
+
+
+class PointOutputRecorder:
+    """
+    Daily values of the model variables at a set of points of an SWBGrid.
+
+    locations       DumpLocation objects (see SWBConfiguration.dump_variables). Columns and rows are numbered
+                    from 1, as in SWB2; locations given by coordinates need project_grid.
+    shape           Grid shape (rows, columns).
+    date_measures   DateMeasures of the run.
+    project_grid    ProjectGrid, to locate points given by coordinates.
+    variables       Columns to record (keys of DUMP_VARIABLE_COLUMNS); defaults to all of them.
+
+    values[point, day, variable] holds the recorded values.
+    """
+
+    def __init__(self, locations, shape, date_measures, project_grid=None, variables=None):
+        self.locations = list(locations)
+        self.shape = tuple(shape)
+        self.date_measures = date_measures
+        self.variables = list(DUMP_VARIABLE_COLUMNS if variables is None else variables)
+        unknown = [name for name in self.variables if name not in DUMP_VARIABLE_COLUMNS]
+        if unknown:
+            raise ValueError(f"no point output is available for {unknown}")
+
+        rows = []
+        columns = []
+        self.x = []
+        self.y = []
+        for location in self.locations:
+            if location.by_coordinates:
+                if project_grid is None:
+                    raise ValueError(f"{location} is given by coordinates; a project grid is needed to locate it")
+                (row, column) = (int(index) for index in project_grid.cell_index(location.x, location.y))
+                (x, y) = (location.x, location.y)
+            else:
+                (row, column) = (location.row - 1, location.column - 1)
+                (x, y) = ((project_grid.x[column], project_grid.y[row]) if project_grid is not None
+                          else (None, None))
+            if not (0 <= row < self.shape[0] and 0 <= column < self.shape[1]):
+                raise ValueError(f"{location} is outside the {self.shape[0]} by {self.shape[1]} grid")
+            rows.append(row)
+            columns.append(column)
+            self.x.append(x)
+            self.y.append(y)
+        self.rows = np.array(rows, dtype=np.intp)
+        self.columns = np.array(columns, dtype=np.intp)
+        self.flat_indices = np.ravel_multi_index((self.rows, self.columns), self.shape)
+
+        # variables held in SWBGrid.state are gathered together; the rest are gathered one by one
+        sources = [DUMP_VARIABLE_COLUMNS[name] for name in self.variables]
+        in_state = [isinstance(source, str) and source in GRID_STATE_VARIABLES for source in sources]
+        self._state_columns = np.flatnonzero(in_state)
+        self._state_rows = np.array([GRID_STATE_VARIABLES.index(sources[column]) for column in self._state_columns],
+                                    dtype=np.intp)
+        self._getters = [(column, variable_getter(source)) for column, source in enumerate(sources)]
+        self._other_getters = [(column, getter) for column, getter in self._getters if not in_state[column]]
+
+        self.values = np.full((len(self.locations), len(date_measures), len(self.variables)), np.nan)
+
+    @classmethod
+    def from_configuration(cls, configuration, shape=None, variables=None, calendar='standard'):
+        """Recorder for the DUMP_VARIABLES locations of an SWBConfiguration."""
+        grid = configuration.grid
+        if shape is None:
+            if grid is None:
+                raise ValueError("the control file has no GRID directive; give the grid shape")
+            shape = grid.shape
+        return cls(configuration.dump_variables, shape, configuration.date_measures(calendar),
+                   project_grid=grid, variables=variables)
+
+    def record(self, step, source):
+        """Gather today's value of every variable of `source` (an SWBGrid) at each point."""
+        if not self.locations:
+            return
+        day = self.values[:, step]
+        getters = self._getters
+        state = getattr(source, 'state', None)
+        if state is not None and self._state_columns.size:
+            flat_state = state.reshape(state.shape[0], -1)
+            day[:, self._state_columns] = flat_state[np.ix_(self._state_rows, self.flat_indices)].T
+            getters = self._other_getters
+        for index, getter in getters:
+            value = getter(source)
+            day[:, index] = value if np.ndim(value) == 0 else np.take(value, self.flat_indices)
+
+    def filename(self, point):
+        location = self.locations[point]
+        name = 'SWB2_variable_values__'
+        if location.id is not None:
+            name += f'{location.id}__'
+        name += f'col_{self.columns[point] + 1}__row_{self.rows[point] + 1}'
+        if self.x[point] is not None:
+            name += f'__x_{round(self.x[point])}__y_{round(self.y[point])}'
+        return name + '.csv'
+
+    def to_dataframe(self, point):
+        measures = self.date_measures
+        dates = np.char.add(np.char.add(np.char.mod('%04d-', measures.year), np.char.mod('%02d-', measures.month)),
+                            np.char.mod('%02d', measures.day))
+        columns = {'date': dates, 'year': measures.year, 'month': measures.month, 'day': measures.day}
+        columns.update(zip(self.variables, self.values[point].T))
+        return pd.DataFrame(columns)
+
+    def write_csv(self, output_directory):
+        """Write one SWB2-style CSV file per point; returns the filenames."""
+        output_directory = pl.Path(output_directory)
+        output_directory.mkdir(parents=True, exist_ok=True)
+        filenames = []
+        for point in range(len(self.locations)):
+            filename = output_directory / self.filename(point)
+            self.to_dataframe(point).to_csv(filename, index=False)
+            filenames.append(filename)
+        return filenames
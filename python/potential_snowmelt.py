@@ -1,3 +1,5 @@
+import numpy as np
+
 
 
 def calculate_potential_snowmelt(tmean_c: float,
@@ -11,6 +13,8 @@ def calculate_potential_snowmelt(tmean_c: float,
         tmean_c (float): daily mean air temperature, in degrees Celsius
         tmax_c (float): daily maximum air temperature, in degrees Celsius
 
+    Arguments are scalars (one cell); see calculate_potential_snowmelt_grid for arrays.
+
     Returns:
         float: potential snowmelt, in millimeters of water
     """
@@ -25,6 +29,16 @@ def calculate_potential_snowmelt(tmean_c: float,
 
     return potential_snowmelt
 
+def calculate_potential_snowmelt_grid(tmean_c, tmax_c):
+    """Array form of calculate_potential_snowmelt, used by SWBGrid. Arguments are NumPy arrays of matching
+    (or broadcastable) shape.
+    """
+
+    MELT_INDEX = 1.5         # mm potential melt per degree C
+    FREEZING_PT_DEG_C = 0.0  # freezing point of water in degrees C
+
+    return np.where(tmean_c > FREEZING_PT_DEG_C, MELT_INDEX * tmax_c, 0.)
+
 def references():
     """
     Dripps, W.R., 2003, The spatial and temporal variability of groundwater recharge within the Trout Lake 
@@ -0,0 +1,267 @@
+"""
+Resampling of weather grids onto the SWB project grid.
+
+The mapping from weather-grid cells to project-grid cells depends only on the two grid definitions, so it
+is computed once (projecting every project cell center into the weather grid's coordinate system) and stored
+as index and weight arrays; each day's weather grid is then resampled with a single gather. Mappings are
+cached on disk as .npz files keyed by a hash of the project GRID definition, the weather grid coordinates,
+both projection strings and the method, so later runs skip the projection step entirely.
+
+Project grids follow the ASCII grid convention: row 0 is the northern-most row and column 0 the western-most.
+Weather-grid axes may run in either direction; the index is built from the coordinate values, so grids stored
+south-to-north or east-to-west are not flipped or inverted. The orientation of each weather axis is recorded
+on the RegridIndex (weather_x_descending, weather_y_descending) for checking.
+
+Projecting between different coordinate systems requires pyproj.
+"""
+
+import hashlib
+import os
+import pathlib as pl
+
+import numpy as np
+
+from control_file import get_argument, get_text
+
+try:
+    import pyproj
+    HAVE_PYPROJ = True
+except ImportError:
+    HAVE_PYPROJ = False
+
+
+REGRID_METHODS = ('nearest', 'bilinear')
+
+
+class ProjectGrid:
+    """
+    The SWB project grid, as given by the control-file line 'GRID nx ny x_ll y_ll cellsize' and the
+    BASE_PROJECTION_DEFINITION.
+    """
+
+    def __init__(self, nx, ny, x_ll, y_ll, cellsize, projection_definition=None):
+        self.nx = int(nx)
+        self.ny = int(ny)
+        self.x_ll = float(x_ll)
+        self.y_ll = float(y_ll)
+        self.cellsize = float(cellsize)
+        self.projection_definition = projection_definition
+
+    @classmethod
+    def from_control_file(cls, directives):
+        arguments = directives['GRID'][-1]
+        return cls(*arguments[:5], projection_definition=get_text(directives, 'BASE_PROJECTION_DEFINITION'))
+
+    @property
+    def shape(self):
+        return (self.ny, self.nx)
+
+    @property
+    def grid_definition(self):
+        return f'GRID {self.nx} {self.ny} {self.x_ll!r} {self.y_ll!r} {self.cellsize!r}'
+
+    @property
+    def x(self):
+        """x coordinate of each column's cell centers, west to east."""
+        return self.x_ll + (np.arange(self.nx) + 0.5) * self.cellsize
+
+    @property
+    def y(self):
+        """y coordinate of each row's cell centers, north to south."""
+        return self.y_ll + (self.ny - np.arange(self.ny) - 0.5) * self.cellsize
+
+    def cell_index(self, x, y):
+        """Return the (row, column) of the cells holding the points (x, y); raises ValueError outside the grid."""
+        column = np.floor((np.asarray(x, dtype=np.float64) - self.x_ll) / self.cellsize).astype(np.intp)
+        row = self.ny - 1 - np.floor((np.asarray(y, dtype=np.float64) - self.y_ll) / self.cellsize).astype(np.intp)
+        outside = (column < 0) | (column >= self.nx) | (row < 0) | (row >= self.ny)
+        if np.any(outside):
+            raise ValueError(f"points {np.column_stack(np.broadcast_arrays(x, y))[np.atleast_1d(outside)].tolist()} "
+                             f"are outside the project grid ({self.grid_definition})")
+        return row, column
+
+
+def _fractional_index(coordinate, axis):
+    # position of each coordinate along a monotonic axis, in units of cells (0 = center of the first cell)
+    axis = np.asarray(axis, dtype=np.float64)
+    positions = np.arange(axis.size, dtype=np.float64)
+    descending = axis.size > 1 and axis[0] > axis[-1]
+    if descending:
+        (axis, positions) = (axis[::-1], positions[::-1])
+
+    fractional = np.interp(coordinate, axis, positions)
+    # cells extend half a cell beyond the outermost centers
+    half_cell = 0.5 * (np.abs(axis[-1] - axis[0]) / (axis.size - 1) if axis.size > 1 else 0.)
+    outside = (coordinate < axis[0] - half_cell) | (coordinate > axis[-1] + half_cell)
+    return fractional, outside, descending
+
+
+class RegridIndex:
+    """
+    Precomputed mapping from a weather grid onto the project grid.
+
+    indices     Flat indices into the weather grid: shape project_shape for 'nearest', (4,) + project_shape for
+                'bilinear' (one entry per corner).
+    weights     None for 'nearest'; bilinear weights with the same shape as indices.
+    outside     Project cells that fall outside the weather grid; these receive NaN.
+    """
+
+    def __init__(self, method, indices, weights, outside, weather_shape,
+                 weather_x_descending=False, weather_y_descending=False):
+        if method not in REGRID_METHODS:
+            raise ValueError(f"method must be one of {REGRID_METHODS}, not '{method}'")
+        self.method = method
+        self.indices = indices
+        self.weights = weights
+        self.outside = outside
+        self.weather_shape = tuple(weather_shape)
+        self.weather_x_descending = bool(weather_x_descending)
+        self.weather_y_descending = bool(weather_y_descending)
+        self._any_outside = bool(outside.any())
+
+    @property
+    def shape(self):
+        return self.outside.shape
+
+    def apply(self, weather_values, out=None):
+        """Resample one (n_y, n_x) weather grid onto the project grid."""
+        weather_values = np.asarray(weather_values)
+        if weather_values.shape != self.weather_shape:
+            raise ValueError(f"weather grid has shape {weather_values.shape}; this index expects {self.weather_shape}")
+
+        flat = weather_values.ravel()
+        if self.method == 'nearest':
+            out = np.take(flat, self.indices, out=out)
+        else:
+            corners = np.take(flat, self.indices)
+            corners *= self.weights
+            out = np.sum(corners, axis=0, out=out)
+
+        if self._any_outside:
+            out[self.outside] = np.nan
+        return out
+
+    def save(self, filename):
+        # write to a temporary name and rename, so concurrent readers never see a partial file
+        filename = pl.Path(filename)
+        temporary = filename.with_name(f'{filename.name}.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez(f, method=self.method, indices=self.indices,
+                     weights=self.weights if self.weights is not None else np.empty(0),
+                     outside=self.outside, weather_shape=np.array(self.weather_shape),
+                     weather_x_descending=self.weather_x_descending, weather_y_descending=self.weather_y_descending)
+        os.replace(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as cached:
+            method = str(cached['method'])
+            return cls(method, cached['indices'], cached['weights'] if method == 'bilinear' else None,
+                       cached['outside'], tuple(cached['weather_shape']),
+                       bool(cached['weather_x_descending']), bool(cached['weather_y_descending']))
+
+
+def project_cell_centers(project_grid, weather_projection_definition=None):
+    """
+    Return the (n_y, n_x) coordinates of the project grid's cell centers in the weather grid's coordinate
+    system.
+    """
+    (x, y) = np.meshgrid(project_grid.x, project_grid.y)
+    source = project_grid.projection_definition
+    if weather_projection_definition is None or source is None or \
+            ' '.join(source.split()) == ' '.join(weather_projection_definition.split()):
+        return x, y
+
+    if not HAVE_PYPROJ:
+        raise ImportError("pyproj is required to resample weather grids that use a different projection")
+    transformer = pyproj.Transformer.from_crs(pyproj.CRS.from_proj4(source),
+                                              pyproj.CRS.from_proj4(weather_projection_definition),
+                                              always_xy=True)
+    return transformer.transform(x, y)
+
+
+def build_regrid_index(project_grid, weather_x, weather_y, weather_projection_definition=None, method='nearest'):
+    """
+    Compute the RegridIndex mapping a weather grid with 1-D cell-center coordinates weather_x (n_x) and
+    weather_y (n_y) onto the project grid.
+    """
+    if method not in REGRID_METHODS:
+        raise ValueError(f"method must be one of {REGRID_METHODS}, not '{method}'")
+    weather_x = np.asarray(weather_x, dtype=np.float64)
+    weather_y = np.asarray(weather_y, dtype=np.float64)
+    (n_x, n_y) = (weather_x.size, weather_y.size)
+
+    (x, y) = project_cell_centers(project_grid, weather_projection_definition)
+    (column, outside_x, x_descending) = _fractional_index(x, weather_x)
+    (row, outside_y, y_descending) = _fractional_index(y, weather_y)
+    outside = outside_x | outside_y
+
+    if method == 'nearest':
+        indices = np.rint(row).astype(np.intp) * n_x + np.rint(column).astype(np.intp)
+        return RegridIndex(method, indices, None, outside, (n_y, n_x), x_descending, y_descending)
+
+    column_0 = np.clip(np.floor(column), 0, max(n_x - 2, 0)).astype(np.intp)
+    row_0 = np.clip(np.floor(row), 0, max(n_y - 2, 0)).astype(np.intp)
+    column_1 = np.minimum(column_0 + 1, n_x - 1)
+    row_1 = np.minimum(row_0 + 1, n_y - 1)
+    weight_x = np.clip(column - column_0, 0., 1.)
+    weight_y = np.clip(row - row_0, 0., 1.)
+
+    indices = np.stack([row_0 * n_x + column_0, row_0 * n_x + column_1,
+                        row_1 * n_x + column_0, row_1 * n_x + column_1])
+    weights = np.stack([(1. - weight_y) * (1. - weight_x), (1. - weight_y) * weight_x,
+                        weight_y * (1. - weight_x), weight_y * weight_x])
+    return RegridIndex(method, indices, weights, outside, (n_y, n_x), x_descending, y_descending)
+
+
+def regrid_cache_key(project_grid, weather_x, weather_y, weather_projection_definition, method):
+    """Hash of everything the RegridIndex depends on."""
+    digest = hashlib.sha256()
+    for text in (project_grid.grid_definition, project_grid.projection_definition or '',
+                 weather_projection_definition or '', method):
+        digest.update(' '.join(text.split()).encode())
+        digest.update(b'\0')
+    for axis in (weather_x, weather_y):
+        digest.update(np.ascontiguousarray(axis, dtype=np.float64).tobytes())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def cached_regrid_index(project_grid, weather_x, weather_y, weather_projection_definition=None, method='nearest',
+                        cache_directory=None):
+    """
+    Return the RegridIndex for the given grids, loading it from cache_directory when a matching .npz file
+    exists, and building and saving it otherwise. With cache_directory=None the index is always built.
+    """
+    if cache_directory is None:
+        return build_regrid_index(project_grid, weather_x, weather_y, weather_projection_definition, method)
+
+    key = regrid_cache_key(project_grid, weather_x, weather_y, weather_projection_definition, method)
+    filename = pl.Path(cache_directory) / f'regrid_index__{method}__{key[:24]}.npz'
+    if filename.exists():
+        return RegridIndex.load(filename)
+
+    index = build_regrid_index(project_grid, weather_x, weather_y, weather_projection_definition, method)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    index.save(filename)
+    return index
+
+
+def regridded_daily_grids(weather_source, project_grid, method='nearest', cache_directory=None, **kwargs):
+    """
+    Yield (precip, tmin, tmax) on the project grid for each day streamed by a NetCDFWeatherSource
+    (see netcdf_weather.py); keyword arguments are passed on to its daily_grids().
+    """
+    date_measures = kwargs.pop('date_measures', None)
+    if date_measures is None:
+        date_measures = weather_source.date_measures(kwargs.pop('start_date', None), kwargs.pop('end_date', None))
+    year, month = int(date_measures.year[0]), int(date_measures.month[0])
+
+    indices = []
+    for grid in weather_source.grids:
+        grid.open(year, month)
+        indices.append(cached_regrid_index(project_grid, grid.x, grid.y, grid.projection_definition, method,
+                                           cache_directory))
+
+    for daily_values in weather_source.daily_grids(date_measures=date_measures, **kwargs):
+        yield tuple(index.apply(values) for index, values in zip(indices, daily_values))
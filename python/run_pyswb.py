@@ -14,7 +14,7 @@ output_dir = pl.Path.cwd().parent / 'output'
 swb2_executable = str(pl.Path.cwd().parent / 'bin' /'swb2.exe')
 sys.path.append(str(python_script_dir))
 
-from swb_cell import SWBCell
+from swb_cell import SWBCell, run_timeseries
 import run_management as rm
 
 tm_soil_moisture_retention_df = pd.read_csv(tm_table_file)
@@ -86,11 +86,7 @@ mycell_tm.init_swb_cell()
 #                                  row['tmin'],row['tmax'],row['tmean'],row['gross_precip'])
 #    mycell.variables_todict()
 
-for index, row in swb_df.iterrows():
-    mycell_tm.calc_cell_water_budget(int(row['year']),int(row['month']),int(row['day']),
-                                     row['tmin'],row['tmax'],row['tmean'],row['gross_precip'])
-    mycell_tm.variables_todict()
-
-mycell_tm.convert_dict_to_df()
+run_timeseries(mycell_tm, swb_df, date_column='date', tmin_column='tmin', tmax_column='tmax',
+               tmean_column='tmean', precip_column='gross_precip')
 py_tm_df = mycell_tm.output_df.copy()
 py_tm_df.loc[:,'date'] = pd.to_datetime(py_tm_df['date'])
\ No newline at end of file
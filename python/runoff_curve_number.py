@@ -1,6 +1,21 @@
+import copy
+
 import numpy as np
 
 
+MM_PER_INCH = 25.4
+
+# 5-day antecedent inflow thresholds (inches) separating dry (ARC I), average (ARC II) and wet (ARC III) conditions
+ARC_DRY_GROWING = 1.40
+ARC_DRY_DORMANT = 0.50
+ARC_WET_GROWING = 2.10
+ARC_WET_DORMANT = 1.10
+
+# default (lower, upper) CFGI limits, LOWER_LIMIT_CFGI and UPPER_LIMIT_CFGI in an SWB2 control file: frozen-ground
+# runoff enhancement starts above the lower limit and is complete at the upper limit
+CFGI_LIMITS = (55., 83.)
+
+
 def calculate_cn_S_inches(curve_number):
     """
     Return the curve number storage (S) term, in inches. Equation 2-4, Cronshey and others (1986).
@@ -30,10 +45,11 @@ def calculate_cn_runoff(inflow, storage_S, initial_abstraction_Ia = 0.05):
     Equation 2-3, Cronshey and others (1986).
     """
     Ia = initial_abstraction_Ia
-    runoff = np.where(inflow > Ia,
-                            np.float_power(inflow - Ia * storage_S, 2.0) / (inflow + (1.0 - Ia) * storage_S),
-                            0.0
-                     )
+    # inflow + (1 - Ia) * S == excess + S; fmax turns a NaN storage term (no curve number) into no runoff
+    excess = np.fmax(inflow - Ia * storage_S, 0.0)
+    denominator = excess + storage_S
+    runoff = np.divide(excess * excess, denominator, out=np.zeros(np.shape(denominator)),
+                       where=denominator > 0.0)[()]
 
     return runoff
 
@@ -42,9 +58,9 @@ def calculate_cn_runoff(inflow, storage_S, initial_abstraction_Ia = 0.05):
 def calculate_cn_alternative_S_0_05(storage_S):
     """
     Return the curve number storage term, assuming that the initial abstraction is 0.05, rather than 0.2.
-    Equation 8, Woodward and others (2003).
+    Equation 8, Woodward and others (2003). storage_S is the usual (Ia = 0.2) storage term, in inches.
     """
-    return 1.33 * (storage_S^1.15)
+    return 1.33 * (storage_S**1.15)
 
 
 
@@ -72,35 +88,172 @@ def calculate_cn_arc2_to_arc3(curve_number_arc2):
 
     Resulting curve numbers are clipped to the range 30-100.
     """
-    return np.clip((curve_number_arc2 / (0.427 - 0.00573 * curve_number_arc2 )),      
+    return np.clip((curve_number_arc2 / (0.427 + 0.00573 * curve_number_arc2 )),      
                 30.0,
                 100.0
                )
 
-def adjust_curve_number(curve_number, inflow_5_day_sum, is_growing_season=False, cfgi=0, cfgi_ll=55, cfgi_ul=85):
+def calculate_probability_of_enhanced_runoff(cfgi, cfgi_ll=CFGI_LIMITS[0], cfgi_ul=CFGI_LIMITS[1]):
+    """
+    Return the probability of enhanced runoff due to frozen ground: zero at or below the lower CFGI limit,
+    one at or above the upper limit, and linear in between (Molnau and Bissell, 1983).
+    """
+    return np.clip((np.asarray(cfgi) - cfgi_ll) / (cfgi_ul - cfgi_ll), 0.0, 1.0)[()]
+
 
-    ARC_DRY_GROWING = 1.40
-    ARC_DRY_DORMANT = 0.50
-    ARC_WET_GROWING = 2.10
-    ARC_WET_DORMANT = 1.10
 
-    if( cfgi > cfgi_ll ):
+def adjust_curve_number(curve_number, inflow_5_day_sum, is_growing_season=False, cfgi=0., cfgi_ll=CFGI_LIMITS[0],
+                        cfgi_ul=CFGI_LIMITS[1], curve_number_arc1=None, curve_number_arc3=None):
+    """
+    Return the curve number adjusted for antecedent runoff condition and frozen ground.
+
+    curve_number            ARC II curve number.
+    inflow_5_day_sum        Sum of inflow over the previous five days, in inches.
+    is_growing_season       True during the growing season (scalar or per-cell), selecting the growing-season
+                            ARC thresholds.
+    cfgi                    Continuous frozen ground index. Where it exceeds cfgi_ll the curve number is
+                            blended toward the ARC III value by the probability of enhanced runoff.
+    cfgi_ll, cfgi_ul        Lower and upper CFGI limits; default CFGI_LIMITS.
+    curve_number_arc1       ARC I and ARC III curve numbers; computed from curve_number when not given. Pass
+    curve_number_arc3       them when adjusting the same cells repeatedly.
+
+    Arguments may be scalars or NumPy arrays of matching (or broadcastable) shape.
+    """
+    if curve_number_arc1 is None:
+        curve_number_arc1 = calculate_cn_arc2_to_arc1(curve_number)
+    if curve_number_arc3 is None:
+        curve_number_arc3 = calculate_cn_arc2_to_arc3(curve_number)
 
-        p_er = calculate_probability_of_enhanced_runoff(cfgi, cfgi_ll, cfgi_ul)
+    (is_dry, is_wet) = antecedent_runoff_condition(inflow_5_day_sum, is_growing_season)
+    curve_number_adj = np.where(is_wet, curve_number_arc3, np.where(is_dry, curve_number_arc1, curve_number))
 
-        curve_number_adj = curve_number * (1. - p_er) + curve_number_arc3 * p_er
+    p_er = calculate_probability_of_enhanced_runoff(cfgi, cfgi_ll, cfgi_ul)
+    curve_number_adj = np.where(np.asarray(cfgi) > cfgi_ll,
+                                curve_number * (1. - p_er) + curve_number_arc3 * p_er,
+                                curve_number_adj)
 
-    elif( is_growing_season ):
+    return curve_number_adj[()]
 
-        curve_number_adj = np.where(inflow_5_day_sum > ARC_WET_GROWING, curve_number_arc3,
-                             np.where(inflow_5_day_sum < ARC_DRY_GROWING, curve_number_arc1, curve_number))
 
-    else:
 
-        curve_number_adj = np.where(inflow_5_day_sum > ARC_WET_DORMANT, curve_number_arc3,
-                             np.where(inflow_5_day_sum < ARC_DRY_DORMANT, curve_number_arc1, curve_number))
+def antecedent_runoff_condition(inflow_5_day_sum, is_growing_season=False):
+    """
+    Return (is_dry, is_wet): where the 5-day inflow sum (inches) is below the ARC I threshold, and where it
+    is above the ARC III threshold, for the growing or dormant season.
+    """
+    arc_dry = np.where(is_growing_season, ARC_DRY_GROWING, ARC_DRY_DORMANT)
+    arc_wet = np.where(is_growing_season, ARC_WET_GROWING, ARC_WET_DORMANT)
+    return inflow_5_day_sum < arc_dry, inflow_5_day_sum > arc_wet
 
-    return curve_number_adj
+
+
+class InflowRingBuffer:
+    """
+    Rolling sum of the last `number_of_days` daily inflows of every cell, kept in a fixed-size circular buffer
+    of shape (number_of_days,) + shape. push() overwrites the oldest day; `total` holds the current sum.
+    """
+
+    def __init__(self, shape=(), number_of_days=5):
+        self.number_of_days = number_of_days
+        self.buffer = np.zeros((number_of_days,) + tuple(shape), dtype=np.float64)
+        self.total = np.zeros(tuple(shape), dtype=np.float64)
+        self.position = 0
+
+    def push(self, inflow):
+        self.buffer[self.position] = inflow
+        self.position = (self.position + 1) % self.number_of_days
+        # summing the buffer rather than adding and subtracting keeps the total free of round-off drift
+        np.sum(self.buffer, axis=0, out=self.total)
+
+    def reset(self, inflow=0.):
+        self.buffer[...] = inflow
+        np.sum(self.buffer, axis=0, out=self.total)
+
+    def select_rows(self, rows):
+        """Return a copy holding the window of the cells in grid rows `rows` (a slice)."""
+        selected = copy.copy(self)
+        selected.buffer = self.buffer[:, rows].copy()
+        selected.total = self.total[rows].copy()
+        return selected
+
+
+
+class CurveNumberRunoff:
+    """
+    Curve-number runoff for a single cell or a whole grid.
+
+    The ARC I and ARC III curve numbers and the storage (S) term for all three antecedent runoff conditions
+    depend only on the cell's curve number, so they are computed once; each day, calculate() picks the
+    storage term for every cell from the 5-day antecedent inflow and evaluates the runoff equation with
+    array operations. Only cells with frozen ground (cfgi above cfgi_ll) have their curve number, and so
+    their storage term, recomputed.
+
+    curve_number                ARC II curve number of each cell (see CompiledLookupTable.gather('cn', ...)).
+                                Scalar or array; cells with NaN curve numbers produce no runoff.
+    initial_abstraction_ratio   Ia/S. With 0.05 (the default) S is converted with the relation of Woodward
+                                and others (2003); with 0.2 the usual S is used.
+    cfgi_ll, cfgi_ul            Lower and upper CFGI limits for frozen-ground runoff enhancement; default
+                                CFGI_LIMITS.
+    number_of_antecedent_days   Length of the antecedent inflow window.
+
+    Inflow and runoff are in millimeters; the ARC thresholds (inches) are applied to the 5-day sum in inches.
+    """
+
+    def __init__(self, curve_number, initial_abstraction_ratio=0.05, cfgi_ll=CFGI_LIMITS[0], cfgi_ul=CFGI_LIMITS[1],
+                 number_of_antecedent_days=5):
+        self.curve_number = np.array(curve_number, dtype=np.float64)
+        self.shape = self.curve_number.shape
+        self.initial_abstraction_ratio = initial_abstraction_ratio
+        self.cfgi_ll = cfgi_ll
+        self.cfgi_ul = cfgi_ul
+        self.curve_number_arc1 = calculate_cn_arc2_to_arc1(self.curve_number)
+        self.curve_number_arc3 = calculate_cn_arc2_to_arc3(self.curve_number)
+        self.storage_S_arc1 = self.storage_S(self.curve_number_arc1)
+        self.storage_S_arc2 = self.storage_S(self.curve_number)
+        self.storage_S_arc3 = self.storage_S(self.curve_number_arc3)
+        self.inflow_5_day_sum = InflowRingBuffer(self.shape, number_of_antecedent_days)
+
+    def select_rows(self, rows):
+        """
+        Return a copy holding the curve numbers and antecedent inflow of the cells in grid rows `rows` (a slice),
+        for swb_parallel.run_sharded.
+        """
+        selected = copy.copy(self)
+        for name in ('curve_number', 'curve_number_arc1', 'curve_number_arc3',
+                     'storage_S_arc1', 'storage_S_arc2', 'storage_S_arc3'):
+            setattr(selected, name, getattr(self, name)[rows].copy())
+        selected.shape = selected.curve_number.shape
+        selected.inflow_5_day_sum = self.inflow_5_day_sum.select_rows(rows)
+        return selected
+
+    def storage_S(self, curve_number):
+        """Storage term (mm) consistent with the initial abstraction ratio."""
+        with np.errstate(divide='ignore'):
+            storage_S = calculate_cn_S_millimeters(curve_number)
+        if self.initial_abstraction_ratio == 0.05:
+            storage_S = MM_PER_INCH * calculate_cn_alternative_S_0_05(storage_S / MM_PER_INCH)
+        return storage_S
+
+    def calculate(self, inflow, is_growing_season=False, cfgi=None):
+        """
+        Return today's runoff (mm) for inflow (mm; rainfall + snowmelt), then add inflow to the antecedent
+        window. The antecedent condition is taken from the five days before today.
+        """
+        (is_dry, is_wet) = antecedent_runoff_condition(self.inflow_5_day_sum.total / MM_PER_INCH, is_growing_season)
+        storage_S = np.where(is_wet, self.storage_S_arc3, np.where(is_dry, self.storage_S_arc1, self.storage_S_arc2))
+
+        if cfgi is not None:
+            frozen = np.broadcast_to(np.asarray(cfgi) > self.cfgi_ll, self.shape)
+            if frozen.any():
+                p_er = np.broadcast_to(calculate_probability_of_enhanced_runoff(cfgi, self.cfgi_ll, self.cfgi_ul),
+                                       self.shape)[frozen]
+                curve_number = self.curve_number[frozen]
+                storage_S[frozen] = self.storage_S(curve_number * (1. - p_er)
+                                                   + self.curve_number_arc3[frozen] * p_er)
+
+        runoff = calculate_cn_runoff(inflow, storage_S, self.initial_abstraction_ratio)
+        self.inflow_5_day_sum.push(inflow)
+        return runoff
 
 
 
@@ -110,6 +263,9 @@ def cn_references():
         for Small Watersheds - Technical release 55: US Dept. of Agriculture, Soil Conservation Service, 
         Engineering Division, accessed at http://www.nrcs.usda.gov/Internet/FSE_DOCUMENTS/16/stelprdb1044171.pdf.
 
+    Molnau, M., and Bissell, V.C., 1983, A continuous frozen ground index for flood forecasting, in
+        Proceedings 51st Annual Meeting Western Snow Conference, Vancouver, Washington, p. 109-119.
+
     Mishra, S.K., and Singh, V.P., 2003, Soil Conservation Service Curve Number (SCS-CN) Methodology: Water Science
          and Technology Library, Springer Netherlands, Dordrecht, 534 p.
 
@@ -0,0 +1,141 @@
+"""
+Per-stage timers for the daily water-budget pipeline.
+
+SWBCell and SWBGrid accept an optional StageProfiler (profiler=...). When one is attached, the engine marks the
+end of each stage of the daily sequence (weather inputs, PET, precipitation partitioning, snow, frozen ground,
+runoff, irrigation, GDD, actual ET, soil storage, net infiltration), and the profiler adds the time since the
+previous mark to that stage: wall time, number of calls and number of cells processed. Without one the engines
+use NULL_PROFILER, a NullProfiler whose methods do nothing, so the hooks cost one empty call per stage.
+
+Work done outside the engines, such as recording output, is timed with the stage() context manager:
+
+    profiler = StageProfiler(trace=True)
+    grid = SWBGrid(..., profiler=profiler)
+    for step in range(number_of_days):
+        grid.calc_grid_water_budget(...)
+        with profiler.stage('record_output', 'output', grid.number_of_cells):
+            recorder.record(step, grid)
+
+    profiler.to_dataframe()                         # one row per stage
+    profiler.to_dataframe(by='module')              # PET, snow, actual_et/<method>, runoff, output, ...
+    profiler.write_chrome_trace('swb_trace.json')   # open in chrome://tracing or https://ui.perfetto.dev
+
+With trace=True every stage call is also kept as a Chrome trace event (up to max_trace_events of them).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class NullProfiler:
+    """Stand-in for a StageProfiler that records nothing; engines run without profiling use NULL_PROFILER."""
+
+    def start(self):
+        pass
+
+    def lap(self, stage, module, cells=1):
+        pass
+
+    @contextmanager
+    def stage(self, stage, module, cells=1):
+        yield
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    """
+    Accumulated wall time, calls and cells for each stage of the daily pipeline.
+
+    trace               Keep one Chrome trace event per stage call.
+    max_trace_events    Events kept when tracing; later calls are still accumulated but not traced.
+    """
+
+    def __init__(self, trace=False, max_trace_events=1_000_000):
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.reset()
+
+    def reset(self):
+        # stage: [module, calls, nanoseconds, cells]
+        self.stages = {}
+        self.trace_events = []
+        self._origin_ns = time.perf_counter_ns()
+        self._last_ns = self._origin_ns
+
+    def start(self):
+        """Start timing the first stage of a day."""
+        self._last_ns = time.perf_counter_ns()
+
+    def lap(self, stage, module, cells=1):
+        """Add the time since start() or the previous lap() to `stage` (of `module`)."""
+        now_ns = time.perf_counter_ns()
+        self._add(stage, module, cells, self._last_ns, now_ns)
+        self._last_ns = now_ns
+
+    @contextmanager
+    def stage(self, stage, module, cells=1):
+        """Time the enclosed block as `stage`."""
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            now_ns = time.perf_counter_ns()
+            self._add(stage, module, cells, start_ns, now_ns)
+            self._last_ns = now_ns
+
+    def _add(self, stage, module, cells, start_ns, end_ns):
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = [module, 0, 0, 0]
+        totals[1] += 1
+        totals[2] += end_ns - start_ns
+        totals[3] += cells
+        if self.trace and len(self.trace_events) < self.max_trace_events:
+            self.trace_events.append((stage, module, start_ns, end_ns, cells))
+
+    def to_dict(self):
+        """{stage: {module, calls, seconds, cells, seconds_per_call, ns_per_cell}}"""
+        results = {}
+        for stage, (module, calls, nanoseconds, cells) in self.stages.items():
+            results[stage] = {'module': module, 'calls': calls, 'seconds': nanoseconds * 1e-9, 'cells': cells,
+                              'seconds_per_call': nanoseconds * 1e-9 / calls,
+                              'ns_per_cell': nanoseconds / cells if cells else float('nan')}
+        return results
+
+    def to_dataframe(self, by='stage'):
+        """Totals by 'stage' or by 'module', with each one's share of the total time, slowest first."""
+        if by not in ('stage', 'module'):
+            raise ValueError(f"by must be 'stage' or 'module', not '{by}'")
+        df = pd.DataFrame.from_dict(self.to_dict(), orient='index',
+                                    columns=['module', 'calls', 'seconds', 'cells', 'seconds_per_call',
+                                             'ns_per_cell'])
+        df.index.name = 'stage'
+        if by == 'module':
+            df = df.groupby('module')[['calls', 'seconds', 'cells']].sum()
+            df['seconds_per_call'] = df['seconds'] / df['calls']
+            df['ns_per_cell'] = df['seconds'] * 1e9 / df['cells']
+        total = df['seconds'].sum()
+        df['fraction_of_time'] = df['seconds'] / total if total > 0. else 0.
+        return df.sort_values('seconds', ascending=False)
+
+    def chrome_trace(self):
+        """The trace events as a Chrome trace (Trace Event Format) document."""
+        (pid, tid) = (os.getpid(), threading.get_ident())
+        return {'traceEvents': [{'name': stage, 'cat': module, 'ph': 'X', 'pid': pid, 'tid': tid,
+                                 'ts': (start_ns - self._origin_ns) / 1e3, 'dur': (end_ns - start_ns) / 1e3,
+                                 'args': {'cells': cells}}
+                                for (stage, module, start_ns, end_ns, cells) in self.trace_events],
+                'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        if not self.trace:
+            raise ValueError("this profiler does not keep trace events; create it with trace=True")
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f)
@@ -5,16 +5,29 @@ import sys
 from pet_hargreaves_samani import calculate_et0_hargreaves_samani
 from actual_et_thornthwaite_mather import calc_actual_et
 from actual_et_thornthwaite_mather__tables import (calc_actual_et__tm_tables,
-                                                  calc_actual_et__tm_eqns)
+                                                  calc_actual_et__tm_eqns,
+                                                  calc_actual_et__tm_curves,
+                                                  TMTableIndex,
+                                                  TMRetentionCurves)
+from actual_et_fao56_two_stage import calc_actual_et__fao56_two_stage
 from growing_degree_day import update_growing_degree_day
 from partition_daily_precipitation import partition_daily_precip
 from potential_snowmelt import calculate_potential_snowmelt
+from stage_profiler import NULL_PROFILER
+from output_recorder import OutputRecorder, DEFAULT_OUTPUT_VARIABLES
+from date_measures import date_measures_from_dates
+
+OUTPUT_COLUMNS = DEFAULT_OUTPUT_VARIABLES
+
 
 class SWBCell:
 
     def __init__(self, latitude, available_water_capacity, rooting_depth, calculation_method='tm_exp',
-                 thornthwaite_mather_df=None):
+                 thornthwaite_mather_df=None, radiation_cache=None, runoff=None,
+                 frozen_ground_index=None, fao56_two_stage=None,
+                 crop_coefficients=None, irrigation=None, profiler=None, growing_season=None):
         self.latitude = latitude
+        self.radiation_cache = radiation_cache
         self.available_water_capacity = available_water_capacity
         self.gross_precip = 0.
         self.rainfall = 0.
@@ -26,8 +39,33 @@ class SWBCell:
         self.apwl = 0.
         self.rooting_depth = rooting_depth
         self.net_infiltration = 0.
+        # optional CurveNumberRunoff (see runoff_curve_number.py); without it all inflow infiltrates
+        self.runoff_method = runoff
+        self.inflow = 0.
+        self.runoff = 0.
+        self.infiltration = 0.
+        # optional GrowingSeason (see growing_season.py); sets is_growing_season each day
+        self.growing_season = growing_season
+        self.is_growing_season = False
+        # optional ContinuousFrozenGroundIndex; its cfgi is updated in place each day
+        self.frozen_ground_index = frozen_ground_index
+        self.cfgi = frozen_ground_index.cfgi if frozen_ground_index is not None else None
         self.calc_method = calculation_method
         self.tm_df=thornthwaite_mather_df
+        # build the table structure that the method uses once, rather than searching the table every day
+        has_table = thornthwaite_mather_df is not None
+        self.tm_index = TMTableIndex(thornthwaite_mather_df) if has_table and calculation_method == 'tm_table' else None
+        self.tm_curves = TMRetentionCurves(thornthwaite_mather_df) \
+            if has_table and calculation_method == 'tm_curves' else None
+        # FAO56TwoStage crop parameters and evaporable water state (required for 'fao56_two_stage')
+        self.fao56 = fao56_two_stage
+        # optional GridKcb (see crop_coefficient_curves.py) setting the FAO-56 Kcb each day
+        self.crop_coefficients = crop_coefficients
+        # optional FAO56Irrigation; applied water is added to the soil before actual ET
+        self.irrigation_method = irrigation
+        self.irrigation = 0.
+        # optional StageProfiler (see stage_profiler.py) timing each stage of the day
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
         self.output_dict = {}
 
     def init_soil_storage_max(self):
@@ -71,8 +109,22 @@ class SWBCell:
 
     def calc_daily_pet(self):
         self.pet = calculate_et0_hargreaves_samani(self.day_of_year, self.number_of_days_in_year, self.latitude,
-                                        air_temp_min=self.tmin_c, air_temp_max=self.tmax_c, air_temp_mean=self.tmean_c)
+                                        air_temp_min=self.tmin_c, air_temp_max=self.tmax_c, air_temp_mean=self.tmean_c,
+                                        radiation_cache=self.radiation_cache)
+
+
+    def calc_runoff(self):
+        self.inflow = self.rainfall + self.snowmelt
+        if self.runoff_method is not None:
+            self.runoff = float(self.runoff_method.calculate(self.inflow, self.is_growing_season, self.cfgi))
+        self.infiltration = self.inflow - self.runoff
 
+    def calc_irrigation(self):
+        if self.irrigation_method is not None:
+            self.irrigation = float(self.irrigation_method.calculate(self.day_of_year, self.number_of_days_in_year,
+                                                                     self.pet, self.soil_storage + self.infiltration,
+                                                                     self.soil_storage_max))
+            self.infiltration += self.irrigation
 
     def calc_net_infiltration(self):
         if self.soil_storage > self.soil_storage_max:
@@ -87,53 +139,105 @@ class SWBCell:
         self.apwl = 0.0
 
 
+    def set_date_measures(self, date, day_of_year, number_of_days_in_year, dtindex):
+        # used by drivers that have precomputed the date measures for an entire run
+        self.date = date
+        self.day_of_year = day_of_year
+        self.number_of_days_in_year = number_of_days_in_year
+        self.dtindex = dtindex
+
     def calc_cell_water_budget(self, year, month, day, tmin_c, tmax_c, tmean_c, precip_mm):
         self.update_date_measures(year, month, day)
+        self.calc_daily_water_budget(tmin_c, tmax_c, tmean_c, precip_mm, reset_gdd=(month == 1 and day == 1))
+
+    def calc_daily_water_budget(self, tmin_c, tmax_c, tmean_c, precip_mm, reset_gdd=False):
+        # date measures must already be current; GDD is reset to zero when reset_gdd is True (January 1)
+        self.profiler.start()
         self.update_daily_precip(precip_mm)
         self.update_daily_air_temps(tmin_c, tmax_c, tmean_c)
+        if self.growing_season is not None:
+            self.is_growing_season = self.growing_season.contains(self.day_of_year)
+        self.profiler.lap('weather_inputs', 'inputs')
         self.calc_daily_pet()
+        self.profiler.lap('reference_et', 'pet')
 #        self.partition_daily_precip()
         (self.rainfall, self.snowfall) = partition_daily_precip(self.gross_precip, self.tmin_c, self.tmax_c, self.tmean_c)
+        self.profiler.lap('partition_precip', 'snow')
         self.potential_snowmelt = calculate_potential_snowmelt(self.tmean_c, self.tmax_c)
         self.update_snow_storage()
+        self.profiler.lap('snowmelt', 'snow')
+        if self.frozen_ground_index is not None:
+            self.frozen_ground_index.update(self.tmean_c, self.snow_storage)
+            self.profiler.lap('frozen_ground_index', 'runoff')
+        self.calc_runoff()
+        self.profiler.lap('runoff', 'runoff')
+        self.calc_irrigation()
+        self.profiler.lap('irrigation', 'irrigation')
         self.previous_soil_storage = self.soil_storage
         self.previous_apwl = self.apwl
 
-        if month == 1 and day == 1:
+        if reset_gdd:
             self.gdd = 0.
         else:
             self.gdd += update_growing_degree_day(tmin=self.tmin_c,
                                                   tmax=self.tmax_c)
 
+        self.profiler.lap('growing_degree_days', 'gdd')
+
         if self.calc_method=='tm_table':
-            (self.p_minus_pet, self.apwl, self.aet) = calc_actual_et__tm_tables(self.rainfall,
-                                                                                self.snowmelt,
+            (self.p_minus_pet, self.apwl, self.aet) = calc_actual_et__tm_tables(self.infiltration,
+                                                                                0.,
                                                                                 self.pet,
                                                                                 self.previous_apwl,
                                                                                 self.previous_soil_storage,
-                                                                                self.tm_df)
+                                                                                self.tm_index)
+
+        elif self.calc_method=='tm_curves':
+            (self.p_minus_pet, self.apwl, self.aet) = calc_actual_et__tm_curves(self.infiltration,
+                                                                                0.,
+                                                                                self.pet,
+                                                                                self.previous_soil_storage,
+                                                                                self.soil_storage_max,
+                                                                                self.tm_curves)
 
         elif self.calc_method=='tm_eqns':
-            (self.p_minus_pet, self.apwl, self.aet) = calc_actual_et__tm_eqns (self.rainfall,
-                                                                               self.snowmelt,
+            (self.p_minus_pet, self.apwl, self.aet) = calc_actual_et__tm_eqns (self.infiltration,
+                                                                               0.,
                                                                                self.pet,
                                                                                self.previous_apwl,
                                                                                self.previous_soil_storage)
 
         elif self.calc_method=='tm_exp':
-            (self.p_minus_pet, self.aet) = calc_actual_et(self.rainfall,
-                                                          self.snowmelt,
+            (self.p_minus_pet, self.aet) = calc_actual_et(self.infiltration,
+                                                          0.,
                                                           self.pet,
                                                           self.previous_soil_storage,
                                                           self.soil_storage_max)
 
+        elif self.calc_method=='fao56_two_stage':
+            if self.crop_coefficients is not None:
+                self.crop_coefficients.kcb(self.day_of_year, self.number_of_days_in_year, self.gdd, out=self.fao56.kcb)
+            (self.p_minus_pet, aet) = calc_actual_et__fao56_two_stage(self.infiltration,
+                                                                      0.,
+                                                                      self.pet,
+                                                                      self.previous_soil_storage,
+                                                                      self.soil_storage_max,
+                                                                      self.fao56)
+            self.aet = float(aet)
+
         else:
-            print("You need to choose an actual ET calculation method ('tm_tables', or 'tm_exp').")
+            print("You need to choose an actual ET calculation method ('tm_table', 'tm_curves', 'tm_eqns', 'tm_exp', "
+                  "or 'fao56_two_stage').")
             sys.exit(-1)
 
-        self.soil_storage = self.soil_storage + self.rainfall + self.snowmelt - self.aet
+        self.profiler.lap('actual_et', f'actual_et/{self.calc_method}')
+
+        self.soil_storage = self.soil_storage + self.rainfall + self.snowmelt - self.runoff + self.irrigation - self.aet
+
+        self.profiler.lap('soil_storage', 'soil_moisture')
 
         self.calc_net_infiltration()
+        self.profiler.lap('net_infiltration', 'soil_moisture')
 
     def variables_toscreen(self):
         print(f'{self.date}  {self.previous_soil_storage:.2f}  {self.soil_storage:.2f}  {self.rainfall:.2f}  {self.snowmelt:.2f}'
@@ -148,9 +252,57 @@ class SWBCell:
         
     def convert_dict_to_df(self):
         self.output_df = pd.DataFrame.from_dict(self.output_dict, orient='index')
-        self.output_df.columns=['date','previous_soil_storage','soil_storage','rainfall',
-                                'snow_storage', 'snowfall', 'snowmelt','pet','p_minus_pet',
-                                'aet','net_infiltration','apwl','gdd']
+        self.output_df.columns=OUTPUT_COLUMNS
+
+
+def run_timeseries(cell, df, date_column='date', tmin_column='tmin', tmax_column='tmax',
+                   tmean_column='tmean', precip_column='gross_precip', variables=None):
+    """
+    Run an initialized SWBCell over every row of a daily weather dataframe and return the daily results.
+
+    The weather columns are pulled out of the dataframe once as plain arrays, and the date measures
+    (day of year, number of days in year, GDD reset flag) are computed for the whole record up front
+    with date_measures_from_dates,
+    so the daily loop does no pandas row access or datetime construction. Results are written into
+    an OutputRecorder, which preallocates one array per output variable.
+
+    cell            SWBCell object; init_swb_cell() should already have been called.
+    df              Pandas dataframe with one row per day.
+    date_column     Name of the column holding the dates (anything pd.to_datetime understands).
+    tmin_column     Name of the column holding minimum air temperature, in degrees Celsius.
+    tmax_column     Name of the column holding maximum air temperature, in degrees Celsius.
+    tmean_column    Name of the column holding mean air temperature, in degrees Celsius.
+    precip_column   Name of the column holding gross precipitation, in millimeters.
+    variables       Names of the cell variables to record; defaults to all of OUTPUT_COLUMNS.
+
+    Returns a dataframe with the same columns (and the same 'YYYYMMDD' index) as cell.output_df
+    would have after calling variables_todict() daily and convert_dict_to_df(); the dataframe is also
+    stored as cell.output_df.
+    """
+    measures = date_measures_from_dates(df[date_column])
+    number_of_days = len(measures)
+
+    dates = measures.dates
+    day_of_year = measures.day_of_year
+    number_of_days_in_year = measures.number_of_days_in_year
+    is_jan_1 = measures.is_jan_1
+    dtindex = measures.dtindex
+
+    tmin = df[tmin_column].to_numpy(dtype=np.float64)
+    tmax = df[tmax_column].to_numpy(dtype=np.float64)
+    tmean = df[tmean_column].to_numpy(dtype=np.float64)
+    precip = df[precip_column].to_numpy(dtype=np.float64)
+
+    recorder = OutputRecorder(number_of_days, variables=variables)
+
+    for i in range(number_of_days):
+        cell.set_date_measures(dates[i], day_of_year[i], number_of_days_in_year[i], dtindex[i])
+        cell.calc_daily_water_budget(tmin[i], tmax[i], tmean[i], precip[i], reset_gdd=is_jan_1[i])
+        recorder.record(i, cell)
+        cell.profiler.lap('record_output', 'output')
+
+    cell.output_df = recorder.to_dataframe(index=pd.Index(dtindex))
+    return cell.output_df
 
 
 def references():
@@ -0,0 +1,341 @@
+"""
+Typed run configuration read from an SWB2 control (.ctl) file.
+
+read_swb_configuration() turns the directives of a control file into an SWBConfiguration: the project grid,
+the selected *_METHODs, gridded and constant inputs, lookup tables, output options, DUMP_VARIABLES
+locations and the run dates. Gridded inputs (ARC_GRID files) are only referenced when the configuration is
+read; each one is loaded the first time its values are requested, so a run only reads the grids that its
+selected methods use (see SWBConfiguration.required_inputs).
+"""
+
+import pathlib as pl
+
+import numpy as np
+import pandas as pd
+
+from control_file import read_control_file, get_argument, get_text, resolve_path
+from arc_ascii_grid import cached_arc_ascii_grid
+from regrid import ProjectGrid
+from date_measures import date_measures_for_period
+from lookup_tables import CompiledLookupTable, read_lookup_table
+
+
+INPUT_SOURCE_TYPES = ('CONSTANT', 'ARC_GRID', 'NETCDF')
+
+WEATHER_INPUTS = ('PRECIPITATION', 'TMAX', 'TMIN')
+
+# gridded inputs used by each (method, setting); inputs in ALWAYS_REQUIRED_INPUTS are used by every run
+METHOD_REQUIRED_INPUTS = {
+    ('PRECIPITATION', 'GRIDDED'):           WEATHER_INPUTS,
+    ('INTERCEPTION', 'BUCKET'):             ('LAND_USE',),
+    ('RUNOFF', 'CURVE_NUMBER'):             ('LAND_USE', 'HYDROLOGIC_SOILS_GROUP',
+                                             'INITIAL_CONTINUOUS_FROZEN_GROUND_INDEX'),
+    ('SOIL_STORAGE_MAX', 'CALCULATED'):     ('AVAILABLE_WATER_CONTENT', 'LAND_USE', 'HYDROLOGIC_SOILS_GROUP'),
+    ('SOIL_STORAGE_MAX', 'TABLE'):          ('AVAILABLE_WATER_CONTENT', 'LAND_USE', 'HYDROLOGIC_SOILS_GROUP'),
+    ('SOIL_MOISTURE', 'FAO56_TWO_STAGE'):   ('LAND_USE', 'HYDROLOGIC_SOILS_GROUP'),
+    ('IRRIGATION', 'FAO56'):                ('LAND_USE', 'IRRIGATION_MASK'),
+}
+ALWAYS_REQUIRED_INPUTS = ('INITIAL_PERCENT_SOIL_MOISTURE', 'INITIAL_SNOW_COVER_STORAGE')
+
+# SOIL_MOISTURE_METHOD settings and the SWBCell / SWBGrid calculation_method implementing each; the
+# Thornthwaite-Mather tables are applied through the retention curves, which serve every soil storage capacity
+# ('tm_table' reads only the 300 mm column)
+SOIL_MOISTURE_CALCULATION_METHODS = {
+    'THORNTHWAITE_MATHER':              'tm_curves',
+    'THORNTHWAITE_MATHER_EQUATIONS':    'tm_eqns',
+    'FAO56_TWO_STAGE':                  'fao56_two_stage',
+}
+
+
+def normalize_method_name(name):
+    # SWB2 accepts e.g. both FAO56 and FAO-56, THORNTHWAITE-MATHER and THORNTHWAITE_MATHER
+    return name.upper().replace('-', '_')
+
+
+class GriddedInput:
+    """
+    A model input given either as a CONSTANT or as a gridded file (ARC_GRID, NETCDF).
+
+    Constant inputs return their value; ARC_GRID inputs are opened on the first call to load() and kept,
+    as read-only memory maps of a binary cache of the grid written to cache_directory (by default, beside
+    the grid; see arc_ascii_grid.cached_arc_ascii_grid). NETCDF inputs are the daily weather grids, which are
+    streamed (see SWBConfiguration.weather_source).
+    """
+
+    def __init__(self, name, source_type, value=None, filename=None, projection_definition=None,
+                 cache_directory=None):
+        self.name = name
+        self.source_type = source_type
+        self.value = value
+        self.filename = filename
+        self.projection_definition = projection_definition
+        self.cache_directory = cache_directory
+        self._grid = None
+
+    @property
+    def is_constant(self):
+        return self.source_type == 'CONSTANT'
+
+    @property
+    def is_loaded(self):
+        return self.is_constant or self._grid is not None
+
+    @property
+    def grid(self):
+        """The ArcASCIIGrid (values and georeferencing) of an ARC_GRID input, read on first use."""
+        if self.source_type != 'ARC_GRID':
+            raise ValueError(f"{self.name} is a {self.source_type} input, not an ARC_GRID")
+        if self._grid is None:
+            self._grid = cached_arc_ascii_grid(self.filename, cache_directory=self.cache_directory)
+        return self._grid
+
+    def load(self, shape=None):
+        """
+        Return the input's values: the grid of an ARC_GRID input, or the value of a CONSTANT input (broadcast
+        to `shape` when it is given).
+        """
+        if self.is_constant:
+            return self.value if shape is None else np.full(shape, self.value)
+        if self.source_type == 'NETCDF':
+            raise ValueError(f"{self.name} is a NETCDF weather input; use SWBConfiguration.weather_source()")
+        return self.grid.values
+
+    def __repr__(self):
+        source = self.value if self.is_constant else self.filename
+        return f'GriddedInput({self.name!r}, {self.source_type!r}, {source!r})'
+
+
+class OutputOptions:
+    """
+    OUTPUT ENABLE / OUTPUT DISABLE settings. Outputs not named in the control file take `default`, which
+    is True (enabled) as in SWB2.
+    """
+
+    def __init__(self, default=True):
+        self.default = default
+        self.settings = {}
+
+    def set(self, names, enabled):
+        for name in names:
+            self.settings[name.lower()] = enabled
+
+    def is_enabled(self, name):
+        return self.settings.get(name.lower(), self.default)
+
+    @property
+    def enabled(self):
+        return [name for name, enabled in self.settings.items() if enabled]
+
+    @property
+    def disabled(self):
+        return [name for name, enabled in self.settings.items() if not enabled]
+
+
+class DumpLocation:
+    """
+    A DUMP_VARIABLES location, given either by projected coordinates (DUMP_VARIABLES COORDINATES x y) or by
+    grid column and row (DUMP_VARIABLES column row), with an optional ID.
+    """
+
+    def __init__(self, x=None, y=None, column=None, row=None, id=None):
+        self.x = x
+        self.y = y
+        self.column = column
+        self.row = row
+        self.id = id
+
+    @classmethod
+    def from_arguments(cls, arguments):
+        arguments = list(arguments)
+        id = None
+        upper = [argument.upper() for argument in arguments]
+        if 'ID' in upper:
+            position = upper.index('ID')
+            id = ' '.join(arguments[position + 1:]) or None
+            arguments = arguments[:position]
+        if arguments and arguments[0].upper() in ('COORDINATES', 'COORDS'):
+            return cls(x=float(arguments[1]), y=float(arguments[2]), id=id)
+        return cls(column=int(arguments[0]), row=int(arguments[1]), id=id)
+
+    @property
+    def by_coordinates(self):
+        return self.x is not None
+
+    def __repr__(self):
+        where = f'x={self.x}, y={self.y}' if self.by_coordinates else f'column={self.column}, row={self.row}'
+        return f'DumpLocation({where}, id={self.id!r})'
+
+
+class SWBConfiguration:
+    """
+    Run configuration read from a control file.
+
+    grid                ProjectGrid from GRID and BASE_PROJECTION_DEFINITION.
+    methods             Selected methods keyed by module, e.g. methods['RUNOFF'] == 'CURVE_NUMBER'; names are
+                        upper case with '-' replaced by '_'.
+    inputs              GriddedInput for each CONSTANT, ARC_GRID or NETCDF input, keyed by keyword.
+    lookup_tables       Paths of the *_LOOKUP_TABLE files, keyed by name (e.g. 'LAND_USE', 'IRRIGATION').
+    output              OutputOptions.
+    dump_variables      List of DumpLocation.
+    start_date,
+    end_date            Run window, as pd.Timestamp.
+    parameters          Arguments of every other directive, e.g. parameters['UPPER_LIMIT_CFGI'] == ['83.'].
+    directives          Everything read from the control file (see control_file.read_control_file).
+    """
+
+    def __init__(self, directives, data_directory=None, lookup_directory=None, weather_data_directory=None,
+                 grid_cache_directory=None):
+        self.directives = directives
+        self.data_directory = data_directory
+        self.lookup_directory = lookup_directory
+        self.weather_data_directory = weather_data_directory
+        self.grid_cache_directory = grid_cache_directory
+
+        self.grid = ProjectGrid.from_control_file(directives) if 'GRID' in directives else None
+        self.methods = {}
+        self.inputs = {}
+        self.lookup_tables = {}
+        self.output = OutputOptions()
+        self.dump_variables = []
+        self.parameters = {}
+        self._lookup_table_dfs = {}
+        self._compiled_lookup_tables = {}
+
+        for keyword, occurrences in directives.items():
+            arguments = occurrences[-1]
+            if keyword.endswith('_METHOD'):
+                self.methods[keyword[:-len('_METHOD')]] = normalize_method_name(arguments[0])
+            elif keyword.endswith('_LOOKUP_TABLE'):
+                self.lookup_tables[keyword[:-len('_LOOKUP_TABLE')]] = resolve_path(arguments[0], lookup_directory)
+            elif arguments and arguments[0].upper() in INPUT_SOURCE_TYPES:
+                self.inputs[keyword] = self._gridded_input(keyword, arguments)
+            elif keyword in ('OUTPUT', 'OUTPUT_ENABLE', 'OUTPUT_DISABLE'):
+                for arguments in occurrences:
+                    self._set_output(keyword, arguments)
+            elif keyword == 'DUMP_VARIABLES':
+                self.dump_variables = [DumpLocation.from_arguments(arguments) for arguments in occurrences]
+            elif keyword not in ('GRID', 'BASE_PROJECTION_DEFINITION'):
+                self.parameters[keyword] = arguments
+
+        start_date = get_argument(directives, 'START_DATE')
+        end_date = get_argument(directives, 'END_DATE')
+        self.start_date = pd.Timestamp(start_date) if start_date is not None else None
+        self.end_date = pd.Timestamp(end_date) if end_date is not None else None
+
+    def _gridded_input(self, keyword, arguments):
+        source_type = arguments[0].upper()
+        projection_definition = get_text(self.directives, f'{keyword}_PROJECTION_DEFINITION') or \
+                                get_text(self.directives, f'{keyword}_GRID_PROJECTION_DEFINITION')
+        if source_type == 'CONSTANT':
+            return GriddedInput(keyword, source_type, value=float(arguments[1]))
+        directory = self.weather_data_directory if keyword in WEATHER_INPUTS else self.data_directory
+        return GriddedInput(keyword, source_type, filename=resolve_path(arguments[1], directory),
+                            projection_definition=projection_definition, cache_directory=self.grid_cache_directory)
+
+    def _set_output(self, keyword, arguments):
+        if keyword == 'OUTPUT':
+            (action, *names) = arguments
+        else:
+            (action, names) = (keyword[len('OUTPUT_'):], arguments)
+        self.output.set(names, enabled=action.upper() == 'ENABLE')
+
+    def method(self, module, default='NONE'):
+        return self.methods.get(module.upper(), default)
+
+    def parameter(self, keyword, default=None, index=0, type=float):
+        arguments = self.parameters.get(keyword.upper())
+        if not arguments or len(arguments) <= index:
+            return default
+        return type(arguments[index])
+
+    @property
+    def upper_limit_cfgi(self):
+        return self.parameter('UPPER_LIMIT_CFGI')
+
+    @property
+    def lower_limit_cfgi(self):
+        return self.parameter('LOWER_LIMIT_CFGI')
+
+    @property
+    def growing_season(self):
+        """(first day, last day, flag) from GROWING_SEASON, or None."""
+        arguments = self.parameters.get('GROWING_SEASON')
+        if not arguments:
+            return None
+        return (arguments[0], arguments[1], len(arguments) > 2 and arguments[2].upper() == 'TRUE')
+
+    @property
+    def calculation_method(self):
+        """The SWBCell / SWBGrid calculation_method for SOIL_MOISTURE_METHOD."""
+        setting = self.method('SOIL_MOISTURE')
+        try:
+            return SOIL_MOISTURE_CALCULATION_METHODS[setting]
+        except KeyError:
+            raise ValueError(f"SOIL_MOISTURE_METHOD {setting} is not supported; use one of "
+                             f"{sorted(SOIL_MOISTURE_CALCULATION_METHODS)}")
+
+    def required_inputs(self):
+        """Names of the inputs used by the selected methods that this control file defines."""
+        names = list(ALWAYS_REQUIRED_INPUTS)
+        for (module, setting), inputs in METHOD_REQUIRED_INPUTS.items():
+            if self.methods.get(module) == setting:
+                names.extend(inputs)
+        return [name for name in dict.fromkeys(names) if name in self.inputs]
+
+    def load_required_inputs(self):
+        """Load every non-weather input the selected methods use; returns {name: values}."""
+        return {name: self.inputs[name].load() for name in self.required_inputs()
+                if self.inputs[name].source_type != 'NETCDF'}
+
+    def lookup_table(self, name, **kwargs):
+        """
+        Return a lookup table (e.g. 'LAND_USE', 'IRRIGATION') as a dataframe, reading it on first use. The
+        table is read as tab-delimited unless other pandas.read_csv keyword arguments are given.
+        """
+        name = name.upper()
+        if name not in self._lookup_table_dfs:
+            kwargs.setdefault('sep', '\t')
+            self._lookup_table_dfs[name] = pd.read_csv(self.lookup_tables[name], **kwargs)
+        return self._lookup_table_dfs[name]
+
+    def compiled_lookup_table(self, name):
+        """Return a lookup table compiled to dense per-code arrays (see lookup_tables.py), compiling it on first use."""
+        name = name.upper()
+        if name not in self._compiled_lookup_tables:
+            self._compiled_lookup_tables[name] = CompiledLookupTable(read_lookup_table(self.lookup_tables[name]),
+                                                                     name=str(self.lookup_tables[name]))
+        return self._compiled_lookup_tables[name]
+
+    def date_measures(self, calendar='standard'):
+        return date_measures_for_period(self.start_date, self.end_date, calendar)
+
+    def weather_source(self, prefetch=True):
+        """NetCDFWeatherSource for a run with PRECIPITATION_METHOD GRIDDED and NETCDF weather inputs."""
+        # imported here so that configurations without NETCDF inputs do not require netCDF4
+        from netcdf_weather import NetCDFWeatherSource
+        return NetCDFWeatherSource.from_control_file(self.directives, self.weather_data_directory,
+                                                     prefetch=prefetch)
+
+    def weather_table(self, precip_mm_per_unit=25.4, temperature_units='fahrenheit'):
+        """
+        WeatherTable (see weather_table.py) of the WEATHER_DATA_LOOKUP_TABLE of a run with PRECIPITATION_METHOD
+        TABULAR, from its binary cache in grid_cache_directory (or beside the table).
+        """
+        from weather_table import cached_weather_table
+        return cached_weather_table(self.lookup_tables['WEATHER_DATA'], precip_mm_per_unit, temperature_units,
+                                    cache_directory=self.grid_cache_directory)
+
+
+def read_swb_configuration(control_file, data_directory=None, lookup_directory=None,
+                           weather_data_directory=None, grid_cache_directory=None):
+    """
+    Read a control file into an SWBConfiguration. The directories play the part of SWB2's --data_dir,
+    --lookup_dir and --weather_data_dir options; each defaults to the directory holding the control file.
+    Binary caches of ARC_GRID inputs are written to grid_cache_directory, or beside each grid if it is None.
+    """
+    control_directory = pl.Path(control_file).parent
+    return SWBConfiguration(read_control_file(control_file),
+                            data_directory=data_directory or control_directory,
+                            lookup_directory=lookup_directory or control_directory,
+                            weather_data_directory=weather_data_directory or control_directory,
+                            grid_cache_directory=grid_cache_directory)
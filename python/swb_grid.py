@@ -0,0 +1,298 @@
+import numpy as np
+import datetime as dt
+import sys
+from pet_hargreaves_samani import calculate_et0_hargreaves_samani_grid
+from actual_et_thornthwaite_mather import calc_actual_et_grid
+from actual_et_thornthwaite_mather__tables import (calc_actual_et__tm_tables,
+                                                  calc_actual_et__tm_eqns_grid,
+                                                  calc_actual_et__tm_curves,
+                                                  TMTableIndex,
+                                                  TMRetentionCurves)
+from actual_et_fao56_two_stage import calc_actual_et__fao56_two_stage
+from growing_degree_day import update_growing_degree_day
+from partition_daily_precipitation import partition_daily_precip_grid
+from potential_snowmelt import calculate_potential_snowmelt_grid
+from stage_profiler import NULL_PROFILER
+
+# per-cell state variables of SWBGrid, in the order of the rows of SWBGrid.state
+GRID_STATE_VARIABLES = ('gross_precip', 'rainfall', 'snowmelt', 'snowfall', 'potential_snowmelt', 'gdd',
+                        'snow_storage', 'pet', 'apwl', 'p_minus_pet', 'aet', 'net_infiltration', 'inflow', 'runoff',
+                        'infiltration', 'irrigation', 'soil_storage_max', 'soil_storage', 'previous_soil_storage',
+                        'previous_apwl')
+
+
+class SWBGrid:
+    """
+    Vectorized counterpart of SWBCell. Every state variable (soil storage, snow storage, APWL, GDD, ...)
+    is held as a contiguous float64 array with one element per grid cell (a row of `state`, see
+    GRID_STATE_VARIABLES), and a single call to calc_grid_water_budget advances all cells by one day.
+    The sequence of calculations is the same as SWBCell.calc_cell_water_budget, so results match SWBCell
+    cell for cell.
+
+    latitude                    Latitude of each cell, in degrees. Scalar or array.
+    available_water_capacity    Available water capacity of each cell, in mm/m. Scalar or array.
+    rooting_depth               Rooting depth of each cell, in meters. Scalar or array.
+    calculation_method          Actual ET method: 'tm_exp', 'tm_eqns', 'tm_table', 'tm_curves', or
+                                'fao56_two_stage' (SOIL_MOISTURE_METHOD FAO56_TWO_STAGE).
+    thornthwaite_mather_df      Thornthwaite-Mather soil moisture retention table (required for 'tm_table'
+                                and 'tm_curves').
+    radiation_cache             Optional ExtraterrestrialRadiationCache used by the PET calculation; its
+                                latitude_resolution (0.01 degrees by default) bounds the table size, and PET
+                                then differs from an uncached SWBCell by up to about 0.002 mm/day (use
+                                latitude_resolution=None to match it exactly).
+    runoff                      Optional CurveNumberRunoff with the grid's shape. Runoff is taken from
+                                rainfall + snowmelt before actual ET and infiltration; without it, all of the
+                                inflow infiltrates.
+    fao56_two_stage             FAO56TwoStage holding the per-cell crop parameters and evaporable water state
+                                (required for 'fao56_two_stage'); its shape must be the grid's.
+    crop_coefficients           Optional GridKcb (see crop_coefficient_curves.py) bound to the grid's land uses;
+                                it sets the Kcb of fao56_two_stage each day from the day of year and GDD.
+    irrigation                  Optional FAO56Irrigation with the grid's shape. Irrigation is computed after
+                                runoff and added to the infiltration seen by actual ET and the soil budget.
+    frozen_ground_index         Optional ContinuousFrozenGroundIndex with the grid's shape, updated each day
+                                from mean air temperature and snow storage; its CFGI drives the frozen-ground
+                                adjustment of the runoff curve numbers.
+    profiler                    Optional StageProfiler (see stage_profiler.py) timing each stage of the day.
+    growing_season              Optional GrowingSeason (see growing_season.py); is_growing_season is set from
+                                the day of year each day and selects the runoff antecedent-condition limits.
+
+    The grid shape is the broadcast shape of the three cell-property arguments; daily weather arrays
+    passed to calc_grid_water_budget must broadcast to that shape.
+    """
+
+    def __init__(self, latitude, available_water_capacity, rooting_depth, calculation_method='tm_exp',
+                 thornthwaite_mather_df=None, radiation_cache=None, runoff=None,
+                 frozen_ground_index=None, fao56_two_stage=None,
+                 crop_coefficients=None, irrigation=None, profiler=None, growing_season=None):
+        (latitude, available_water_capacity, rooting_depth) = np.broadcast_arrays(
+            np.asarray(latitude, dtype=np.float64),
+            np.asarray(available_water_capacity, dtype=np.float64),
+            np.asarray(rooting_depth, dtype=np.float64))
+        self.shape = latitude.shape
+        self.latitude = np.ascontiguousarray(latitude)
+        self.available_water_capacity = np.ascontiguousarray(available_water_capacity)
+        self.rooting_depth = np.ascontiguousarray(rooting_depth)
+        self.calc_method = calculation_method
+        self.radiation_cache = radiation_cache
+        self.tm_df = thornthwaite_mather_df
+        # only the table structure that the method uses is built
+        has_table = thornthwaite_mather_df is not None
+        self.tm_index = TMTableIndex(thornthwaite_mather_df) if has_table and calculation_method == 'tm_table' else None
+        self.tm_curves = TMRetentionCurves(thornthwaite_mather_df) \
+            if has_table and calculation_method == 'tm_curves' else None
+        self.tm_curve_ids = None
+        if runoff is not None and runoff.shape != self.shape:
+            raise ValueError(f"runoff has shape {runoff.shape}; the grid has shape {self.shape}")
+        if frozen_ground_index is not None and frozen_ground_index.shape != self.shape:
+            raise ValueError(f"frozen_ground_index has shape {frozen_ground_index.shape}; "
+                             f"the grid has shape {self.shape}")
+        if runoff is not None and frozen_ground_index is not None and \
+                (runoff.cfgi_ll, runoff.cfgi_ul) != (frozen_ground_index.lower_limit, frozen_ground_index.upper_limit):
+            raise ValueError("runoff and frozen_ground_index must use the same CFGI limits")
+        if fao56_two_stage is not None and fao56_two_stage.shape != self.shape:
+            raise ValueError(f"fao56_two_stage has shape {fao56_two_stage.shape}; the grid has shape {self.shape}")
+        self.fao56 = fao56_two_stage
+        self.crop_coefficients = crop_coefficients
+        if irrigation is not None and irrigation.shape != self.shape:
+            raise ValueError(f"irrigation has shape {irrigation.shape}; the grid has shape {self.shape}")
+        self.irrigation_method = irrigation
+        self.runoff_method = runoff
+        self.growing_season = growing_season
+        self.is_growing_season = False
+        self.frozen_ground_index = frozen_ground_index
+        self.cfgi = frozen_ground_index.cfgi if frozen_ground_index is not None else None
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+
+        # the daily state is held as the rows of one array, so every variable of a set of cells can be
+        # gathered with a single index (see point_output.py); the attributes are views of its rows
+        self.state = np.zeros((len(GRID_STATE_VARIABLES),) + self.shape, dtype=np.float64)
+        for row, name in enumerate(GRID_STATE_VARIABLES):
+            setattr(self, name, self.state[row])
+        self._pet_work = self._zeros()
+
+    def _zeros(self):
+        return np.zeros(self.shape, dtype=np.float64)
+
+    @property
+    def number_of_cells(self):
+        return self.latitude.size
+
+    def init_soil_storage_max(self):
+        # rooting depth in meters, awc in mm/m
+        self.soil_storage_max[...] = self.rooting_depth * self.available_water_capacity
+        if self.tm_curves is not None:
+            # cells sharing a soil_storage_max share one retention curve
+            self.tm_curve_ids = self.tm_curves.curve_ids(self.soil_storage_max)
+
+    def init_soil_storage(self, percent_soil_storage=100.):
+        self.soil_storage[...] = self.soil_storage_max * percent_soil_storage / 100.
+
+    def init_snow_storage(self, snow_storage=0.):
+        self.snow_storage[...] = snow_storage
+
+    def update_date_measures(self, year, month, day):
+        # the date is shared by every cell in the grid, so these remain scalars
+        self.date = dt.datetime(year, month, day)
+        self.day_of_year = (self.date - dt.datetime(year, 1, 1)).days + 1.
+        self.number_of_days_in_year = (dt.datetime(year, 12, 31) - dt.datetime(year, 1, 1)).days + 1.
+        self.dtindex = f'{self.date.year}{self.date.month:02d}{self.date.day:02d}'
+
+    def set_date_measures(self, day_of_year, number_of_days_in_year, dtindex=None, date=None):
+        # used by drivers that have precomputed the date measures for an entire run (see date_measures.py)
+        self.date = date
+        self.day_of_year = day_of_year
+        self.number_of_days_in_year = number_of_days_in_year
+        self.dtindex = dtindex
+
+    def update_daily_precip(self, precip_mm):
+        self.gross_precip[...] = precip_mm
+
+    def update_daily_air_temps(self, tmin_c, tmax_c, tmean_c):
+        self.tmin_c = np.broadcast_to(tmin_c, self.shape)
+        self.tmax_c = np.broadcast_to(tmax_c, self.shape)
+        self.tmean_c = np.broadcast_to(tmean_c, self.shape)
+
+    def update_snow_storage(self):
+        self.snow_storage += self.snowfall
+
+        # where there is not enough snowcover to satisfy the amount that *could* melt, melt all of it
+        np.copyto(self.snowmelt, np.where(self.snow_storage > self.potential_snowmelt,
+                                          self.potential_snowmelt,
+                                          self.snow_storage))
+        self.snow_storage -= self.snowmelt
+
+    def calc_daily_pet(self):
+        calculate_et0_hargreaves_samani_grid(self.day_of_year, self.number_of_days_in_year, self.latitude,
+                                             air_temp_min=self.tmin_c, air_temp_max=self.tmax_c,
+                                             air_temp_mean=self.tmean_c,
+                                             radiation_cache=self.radiation_cache,
+                                             out=self.pet, work=self._pet_work)
+
+    def calc_runoff(self):
+        np.add(self.rainfall, self.snowmelt, out=self.inflow)
+        if self.runoff_method is not None:
+            self.runoff[...] = self.runoff_method.calculate(self.inflow, self.is_growing_season, self.cfgi)
+        np.subtract(self.inflow, self.runoff, out=self.infiltration)
+
+    def calc_irrigation(self):
+        if self.irrigation_method is not None:
+            self.irrigation[...] = self.irrigation_method.calculate(self.day_of_year, self.number_of_days_in_year,
+                                                                    self.pet, self.soil_storage + self.infiltration,
+                                                                    self.soil_storage_max)
+            self.infiltration += self.irrigation
+
+    def calc_net_infiltration(self):
+        np.copyto(self.net_infiltration, np.where(self.soil_storage > self.soil_storage_max,
+                                                  self.soil_storage - self.soil_storage_max,
+                                                  0.))
+        np.minimum(self.soil_storage, self.soil_storage_max, out=self.soil_storage)
+
+    def init_swb_grid(self, percent_soil_storage=100., snow_storage=0.):
+        self.init_soil_storage_max()
+        self.init_soil_storage(percent_soil_storage)
+        self.init_snow_storage(snow_storage)
+        self.apwl[...] = 0.0
+
+    def calc_grid_water_budget(self, year, month, day, tmin_c, tmax_c, tmean_c, precip_mm):
+        self.update_date_measures(year, month, day)
+        self.calc_daily_water_budget(tmin_c, tmax_c, tmean_c, precip_mm, reset_gdd=(month == 1 and day == 1))
+
+    def calc_daily_water_budget(self, tmin_c, tmax_c, tmean_c, precip_mm, reset_gdd=False):
+        # date measures must already be current; GDD is reset to zero when reset_gdd is True (January 1)
+        self.profiler.start()
+        self.update_daily_precip(precip_mm)
+        self.update_daily_air_temps(tmin_c, tmax_c, tmean_c)
+        if self.growing_season is not None:
+            self.is_growing_season = self.growing_season.contains(self.day_of_year)
+        self.profiler.lap('weather_inputs', 'inputs', self.number_of_cells)
+        self.calc_daily_pet()
+        self.profiler.lap('reference_et', 'pet', self.number_of_cells)
+        (rainfall, snowfall) = partition_daily_precip_grid(self.gross_precip, self.tmin_c, self.tmax_c, self.tmean_c)
+        self.rainfall[...] = rainfall
+        self.snowfall[...] = snowfall
+        self.profiler.lap('partition_precip', 'snow', self.number_of_cells)
+        self.potential_snowmelt[...] = calculate_potential_snowmelt_grid(self.tmean_c, self.tmax_c)
+        self.update_snow_storage()
+        self.profiler.lap('snowmelt', 'snow', self.number_of_cells)
+        if self.frozen_ground_index is not None:
+            self.frozen_ground_index.update(self.tmean_c, self.snow_storage)
+            self.profiler.lap('frozen_ground_index', 'runoff', self.number_of_cells)
+        self.calc_runoff()
+        self.profiler.lap('runoff', 'runoff', self.number_of_cells)
+        self.calc_irrigation()
+        self.profiler.lap('irrigation', 'irrigation', self.number_of_cells)
+        np.copyto(self.previous_soil_storage, self.soil_storage)
+        np.copyto(self.previous_apwl, self.apwl)
+
+        if reset_gdd:
+            self.gdd[...] = 0.
+        else:
+            self.gdd += update_growing_degree_day(tmin=self.tmin_c,
+                                                  tmax=self.tmax_c)
+
+        self.profiler.lap('growing_degree_days', 'gdd', self.number_of_cells)
+
+        if self.calc_method=='tm_table':
+            (p_minus_pet, apwl, aet) = calc_actual_et__tm_tables(self.infiltration,
+                                                                 0.,
+                                                                 self.pet,
+                                                                 self.previous_apwl,
+                                                                 self.previous_soil_storage,
+                                                                 self.tm_index)
+            self.apwl[...] = apwl
+
+        elif self.calc_method=='tm_curves':
+            (p_minus_pet, apwl, aet) = calc_actual_et__tm_curves(self.infiltration,
+                                                                 0.,
+                                                                 self.pet,
+                                                                 self.previous_soil_storage,
+                                                                 self.soil_storage_max,
+                                                                 self.tm_curves,
+                                                                 self.tm_curve_ids)
+            self.apwl[...] = apwl
+
+        elif self.calc_method=='tm_eqns':
+            (p_minus_pet, apwl, aet) = calc_actual_et__tm_eqns_grid(self.infiltration,
+                                                                    0.,
+                                                                    self.pet,
+                                                                    self.previous_apwl,
+                                                                    self.previous_soil_storage)
+            self.apwl[...] = apwl
+
+        elif self.calc_method=='tm_exp':
+            (p_minus_pet, aet) = calc_actual_et_grid(self.infiltration,
+                                                     0.,
+                                                     self.pet,
+                                                     self.previous_soil_storage,
+                                                     self.soil_storage_max)
+
+        elif self.calc_method=='fao56_two_stage':
+            if self.crop_coefficients is not None:
+                self.crop_coefficients.kcb(self.day_of_year, self.number_of_days_in_year, self.gdd, out=self.fao56.kcb)
+            (p_minus_pet, aet) = calc_actual_et__fao56_two_stage(self.infiltration,
+                                                                 0.,
+                                                                 self.pet,
+                                                                 self.previous_soil_storage,
+                                                                 self.soil_storage_max,
+                                                                 self.fao56)
+
+        else:
+            print("You need to choose an actual ET calculation method ('tm_table', 'tm_curves', 'tm_eqns', 'tm_exp', "
+                  "or 'fao56_two_stage').")
+            sys.exit(-1)
+
+        self.profiler.lap('actual_et', f'actual_et/{self.calc_method}', self.number_of_cells)
+
+        self.p_minus_pet[...] = p_minus_pet
+        self.aet[...] = aet
+
+        self.soil_storage += self.rainfall
+        self.soil_storage += self.snowmelt
+        self.soil_storage -= self.runoff
+        self.soil_storage += self.irrigation
+        self.soil_storage -= self.aet
+
+        self.profiler.lap('soil_storage', 'soil_moisture', self.number_of_cells)
+
+        self.calc_net_infiltration()
+        self.profiler.lap('net_infiltration', 'soil_moisture', self.number_of_cells)
@@ -0,0 +1,298 @@
+"""
+Fused daily water-budget kernel for one or many cells.
+
+The daily sequence carried out by SWBCell.calc_cell_water_budget (Hargreaves-Samani PET, precipitation
+partitioning, potential snowmelt, snow storage, growing degree days, actual ET, and net infiltration)
+is written here as a single loop over cells and days using only scalar arithmetic. When numba is
+installed the loop is compiled (and run in parallel over cells); otherwise run_water_budget falls back
+to the vectorized Python engine in swb_grid.py, which carries out the same calculations.
+
+The kernel covers the core of the water budget only:
+
+    actual ET           'tm_exp' and 'tm_eqns'. 'tm_table' and 'tm_curves' are run by SWBGrid instead.
+    runoff              none; all rainfall and snowmelt infiltrate (no curve number, CFGI or growing season)
+    irrigation          none
+    FAO-56              no two-stage actual ET or crop coefficients
+    PET                 extraterrestrial radiation computed directly (no ExtraterrestrialRadiationCache)
+
+Runs needing any of the other stages should use SWBGrid (or swb_parallel.run_sharded) directly.
+run_water_budget warns (RuntimeWarning) whenever it runs on SWBGrid because numba is not installed or the
+method is not compiled, rather than silently taking the slower path.
+"""
+
+import math
+import warnings
+
+import numpy as np
+
+from swb_grid import SWBGrid
+from output_recorder import OutputRecorder
+from actual_et_thornthwaite_mather__tables import TM_SLOPE_TERM_MM, TM_EXPONENT_TERM
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+
+KERNEL_METHODS = {'tm_exp': 0, 'tm_eqns': 1}
+
+# methods run_water_budget accepts but runs on SWBGrid only
+PYTHON_ONLY_METHODS = ('tm_table', 'tm_curves')
+
+KERNEL_OUTPUT_VARIABLES = ['rainfall', 'snowfall', 'snowmelt', 'snow_storage', 'pet', 'p_minus_pet',
+                           'aet', 'soil_storage', 'net_infiltration', 'apwl', 'gdd']
+
+DEGREES_TO_RADIANS = (2.0 * math.pi) / 360.0
+LOG_10 = math.log(10)
+
+
+@njit(cache=True)
+def _tm_soil_moisture(max_soil_moisture, apwl):
+    # see thornthwaite_mather_soil_moisture_millimeters
+    if max_soil_moisture > 0.:
+        return max_soil_moisture * 10**(-TM_SLOPE_TERM_MM*apwl*max_soil_moisture**TM_EXPONENT_TERM)
+    return 0.0
+
+
+@njit(cache=True)
+def _tm_accumulated_potential_water_loss(max_soil_moisture, soil_moisture):
+    # see thornthwaite_mather_accumulated_potential_water_loss_millimeters
+    if max_soil_moisture > 0.:
+        if soil_moisture <= 0.:
+            return math.inf
+        return - (math.log(soil_moisture) - math.log(max_soil_moisture)) \
+                 / (LOG_10*TM_SLOPE_TERM_MM*max_soil_moisture**TM_EXPONENT_TERM)
+    return 0.0
+
+
+@njit(cache=True, parallel=True)
+def water_budget_kernel(method_code, day_of_year, number_of_days_in_year, reset_gdd,
+                        tmin, tmax, tmean, precip, latitude, soil_storage_max,
+                        soil_storage, snow_storage, gdd, apwl, output):
+    """
+    Advance every cell through every day, updating the state arrays in place.
+
+    method_code                 KERNEL_METHODS value for the actual ET method.
+    day_of_year                 (n_days,) day of year.
+    number_of_days_in_year      (n_days,) number of days in the year.
+    reset_gdd                   (n_days,) boolean; GDD is reset on days where this is True.
+    tmin, tmax, tmean, precip   (n_cells, n_days) daily weather, in degrees Celsius and millimeters. Each
+                                cell's record is contiguous, since the kernel works through one cell at a time.
+    latitude, soil_storage_max  (n_cells,) cell properties.
+    soil_storage, snow_storage,
+    gdd, apwl                   (n_cells,) state, updated in place.
+    output                      (len(KERNEL_OUTPUT_VARIABLES), n_cells, n_days) array receiving daily values.
+    """
+    number_of_cells = tmin.shape[0]
+    number_of_days = tmin.shape[1]
+
+    # solar geometry depends only on the date: evaluate D_r and the declination once per day
+    d_r = np.empty(number_of_days)
+    delta = np.empty(number_of_days)
+    for day in range(number_of_days):
+        doy = day_of_year[day]
+        days_in_year = number_of_days_in_year[day]
+        # see relative_earth_sun_distance__D_r and solar_declination__delta
+        d_r[day] = 1.0 + 0.033 * math.cos( 2.0 * math.pi * doy / days_in_year )
+        gamma = 2.0 * math.pi * ( doy - 1.0 ) / days_in_year
+        delta[day] =   0.006918                                   \
+                     - 0.399912 * math.cos( gamma )               \
+                     + 0.070257 * math.sin( gamma )               \
+                     - 0.006758 * math.cos( 2.0 * gamma )         \
+                     + 0.000907 * math.sin( 2.0 * gamma )         \
+                     - 0.002697 * math.cos( 3.0 * gamma )         \
+                     + 0.00148  * math.sin( 3.0 * gamma )
+
+    for cell in prange(number_of_cells):
+        latitude_radians = latitude[cell] * DEGREES_TO_RADIANS
+        storage_max = soil_storage_max[cell]
+        soil = soil_storage[cell]
+        snow = snow_storage[cell]
+        cell_gdd = gdd[cell]
+        cell_apwl = apwl[cell]
+
+        for day in range(number_of_days):
+            t_min = tmin[cell, day]
+            t_max = tmax[cell, day]
+            t_mean = tmean[cell, day]
+
+            # PET: Hargreaves and Samani (1985), with extraterrestrial radiation per Allen and others (1998)
+            omega_s = math.acos( -1.0 * math.tan(latitude_radians) * math.tan(delta[day]) )
+            part_a = omega_s * math.sin( latitude_radians ) * math.sin( delta[day] )
+            part_b = math.cos( latitude_radians ) * math.cos( delta[day] ) * math.sin( omega_s )
+            ra = 24.0 * 60.0 * 0.0820 * d_r[day] * ( part_a + part_b ) / math.pi * 0.408
+            air_temp_delta = t_max - t_min
+            pet = 0.0
+            if air_temp_delta >= 0.0:
+                pet = 0.0023 * ra * (t_mean + 17.8) * air_temp_delta**0.5
+                if not pet > 0.0:
+                    pet = 0.0
+
+            # partition precipitation (Dripps, 2003)
+            snowfall_threshold = (t_mean*1.8 + 32.) - ((t_max*1.8 + 32.) - (t_min*1.8 + 32.)) / 3.
+            if snowfall_threshold <= 32.0:
+                snowfall = precip[cell, day]
+                rainfall = 0.
+            else:
+                snowfall = 0.
+                rainfall = precip[cell, day]
+
+            # potential snowmelt and snow storage
+            potential_snowmelt = 1.5 * t_max if t_mean > 0.0 else 0.
+            snow += snowfall
+            if snow > potential_snowmelt:
+                snowmelt = potential_snowmelt
+                snow = snow - snowmelt
+            else:
+                snowmelt = snow
+                snow = 0.
+
+            # growing degree days
+            if reset_gdd[day]:
+                cell_gdd = 0.
+            else:
+                min_temp = t_min if t_min > 10. else 10.
+                max_temp = t_max if t_max < 30. else 30.
+                mean_temp = (min_temp + max_temp) / 2.0
+                cell_gdd += mean_temp - 10. if mean_temp > 10. else 0.0
+
+            # actual ET
+            p_minus_pet = rainfall + snowmelt - pet
+            if method_code == 0:
+                if p_minus_pet >= 0:
+                    aet = pet
+                elif storage_max > 0.:
+                    aet = soil - soil * math.exp( p_minus_pet / storage_max )
+                else:
+                    aet = soil
+            else:
+                if p_minus_pet >= 0:
+                    cell_apwl = _tm_accumulated_potential_water_loss(300., min(300., soil + p_minus_pet))
+                    aet = pet
+                else:
+                    cell_apwl = _tm_accumulated_potential_water_loss(300., soil) + abs(p_minus_pet)
+                    aet = soil - _tm_soil_moisture(300., cell_apwl)
+
+            # net infiltration
+            soil = soil + rainfall + snowmelt - aet
+            if soil > storage_max:
+                net_infiltration = soil - storage_max
+                soil = storage_max
+            else:
+                net_infiltration = 0.
+
+            output[0, cell, day] = rainfall
+            output[1, cell, day] = snowfall
+            output[2, cell, day] = snowmelt
+            output[3, cell, day] = snow
+            output[4, cell, day] = pet
+            output[5, cell, day] = p_minus_pet
+            output[6, cell, day] = aet
+            output[7, cell, day] = soil
+            output[8, cell, day] = net_infiltration
+            output[9, cell, day] = cell_apwl
+            output[10, cell, day] = cell_gdd
+
+        soil_storage[cell] = soil
+        snow_storage[cell] = snow
+        gdd[cell] = cell_gdd
+        apwl[cell] = cell_apwl
+
+
+def run_water_budget(date_measures, tmin, tmax, tmean, precip, latitude, soil_storage_max,
+                     percent_soil_storage=100., snow_storage=0., method='tm_exp', backend='auto',
+                     thornthwaite_mather_df=None):
+    """
+    Run the daily water budget for one or many cells over a whole record.
+
+    date_measures               DateMeasures for the run (see date_measures.py).
+    tmin, tmax, tmean, precip   (n_days, n_cells) daily weather, in degrees Celsius and millimeters.
+                                1-D arrays are treated as a single cell.
+    latitude, soil_storage_max  Cell latitude (degrees) and maximum soil storage (mm); scalar or (n_cells,).
+    percent_soil_storage        Initial soil storage as a percentage of soil_storage_max.
+    snow_storage                Initial snow storage (mm).
+    method                      Actual ET method: 'tm_exp' or 'tm_eqns', or 'tm_table' or 'tm_curves', which
+                                always run on SWBGrid.
+    backend                     'numba' (compiled kernel; requires numba), 'python' (SWBGrid), or 'auto',
+                                which uses numba when it is installed and the method is compiled, and SWBGrid
+                                otherwise, with a RuntimeWarning.
+    thornthwaite_mather_df      Thornthwaite-Mather table, for 'tm_table' and 'tm_curves'.
+
+    Returns a dict of (n_days, n_cells) arrays keyed by KERNEL_OUTPUT_VARIABLES. Both backends carry
+    out the same operations in the same order, so results agree to within floating-point rounding of
+    the transcendental functions.
+    """
+    if method not in KERNEL_METHODS and method not in PYTHON_ONLY_METHODS:
+        raise ValueError(f"method must be one of {sorted(KERNEL_METHODS) + list(PYTHON_ONLY_METHODS)}, "
+                         f"not '{method}'")
+    if backend not in ('auto', 'numba', 'python'):
+        raise ValueError(f"backend must be 'auto', 'numba' or 'python', not '{backend}'")
+    if backend == 'numba' and not HAVE_NUMBA:
+        raise ImportError("the 'numba' backend requires numba to be installed")
+    if backend == 'numba' and method not in KERNEL_METHODS:
+        raise ValueError(f"the numba kernel does not implement '{method}'; use backend='python'")
+    if backend == 'auto':
+        if not HAVE_NUMBA:
+            warnings.warn("numba is not installed; running the water budget on the slower SWBGrid engine",
+                          RuntimeWarning, stacklevel=2)
+        elif method not in KERNEL_METHODS:
+            warnings.warn(f"the numba kernel does not implement '{method}'; running the water budget on the "
+                          f"slower SWBGrid engine", RuntimeWarning, stacklevel=2)
+        backend = 'numba' if HAVE_NUMBA and method in KERNEL_METHODS else 'python'
+
+    weather = [np.asarray(values, dtype=np.float64) for values in (tmin, tmax, tmean, precip)]
+    if weather[0].ndim == 1:
+        weather = [values[:, np.newaxis] for values in weather]
+    (tmin, tmax, tmean, precip) = [np.ascontiguousarray(values) for values in weather]
+    (number_of_days, number_of_cells) = tmin.shape
+
+    latitude = np.ascontiguousarray(np.broadcast_to(latitude, (number_of_cells,)), dtype=np.float64)
+    soil_storage_max = np.ascontiguousarray(np.broadcast_to(soil_storage_max, (number_of_cells,)),
+                                            dtype=np.float64)
+
+    if backend == 'python':
+        return _run_water_budget_grid(date_measures, tmin, tmax, tmean, precip, latitude, soil_storage_max,
+                                      percent_soil_storage, snow_storage, method, thornthwaite_mather_df)
+
+    soil_storage = soil_storage_max * percent_soil_storage / 100.
+    snow = np.full(number_of_cells, snow_storage, dtype=np.float64)
+    gdd = np.zeros(number_of_cells)
+    apwl = np.zeros(number_of_cells)
+    output = np.empty((len(KERNEL_OUTPUT_VARIABLES), number_of_cells, number_of_days))
+
+    # the kernel works through one cell's record at a time, so give it cell-major copies of the weather
+    (tmin, tmax, tmean, precip) = [np.ascontiguousarray(values.T) for values in (tmin, tmax, tmean, precip)]
+
+    water_budget_kernel(KERNEL_METHODS[method],
+                        date_measures.day_of_year.astype(np.float64),
+                        date_measures.number_of_days_in_year.astype(np.float64),
+                        date_measures.is_jan_1,
+                        tmin, tmax, tmean, precip, latitude, soil_storage_max,
+                        soil_storage, snow, gdd, apwl, output)
+
+    return {name: np.ascontiguousarray(values.T) for name, values in zip(KERNEL_OUTPUT_VARIABLES, output)}
+
+
+def _run_water_budget_grid(date_measures, tmin, tmax, tmean, precip, latitude, soil_storage_max,
+                           percent_soil_storage, snow_storage, method, thornthwaite_mather_df=None):
+    grid = SWBGrid(latitude, available_water_capacity=soil_storage_max, rooting_depth=1.0,
+                   calculation_method=method, thornthwaite_mather_df=thornthwaite_mather_df)
+    grid.init_swb_grid(percent_soil_storage=percent_soil_storage, snow_storage=snow_storage)
+
+    recorder = OutputRecorder(len(date_measures), variables=KERNEL_OUTPUT_VARIABLES, shape=grid.shape)
+    for day in range(len(date_measures)):
+        grid.set_date_measures(float(date_measures.day_of_year[day]),
+                               float(date_measures.number_of_days_in_year[day]))
+        grid.calc_daily_water_budget(tmin[day], tmax[day], tmean[day], precip[day],
+                                     reset_gdd=date_measures.is_jan_1[day])
+        recorder.record(day, grid)
+
+    return recorder.arrays
@@ -0,0 +1,243 @@
+"""
+Run the gridded water budget in parallel by splitting the grid into blocks of rows.
+
+With no flow routing (FLOW_ROUTING_METHOD NONE) grid cells do not interact, so each block of rows can
+be advanced through the whole run independently. run_sharded hands the blocks to a ProcessPoolExecutor;
+every worker runs an SWBGrid over its block, with the same stages (runoff, frozen ground index, growing
+season, irrigation, FAO-56 two-stage ET and crop coefficients) as a serial SWBGrid over the whole grid. Input and output arrays are shared with the workers
+(through multiprocessing shared memory, or the backing files of np.memmap arrays), so only small
+descriptors are pickled. Workers are started from a forkserver rather than forked from the caller, which
+may already be running threads (for example numba's, after swb_kernel.run_water_budget) that a forked
+child would inherit in a locked state. As with the spawn start method, the workers import the calling
+script, so scripts must call run_sharded under an `if __name__ == '__main__':` guard.
+
+The blocks are defined by rows_per_block alone, never by the number of workers, so results are
+identical for any worker count (including number_of_workers=0, which runs the blocks in this process).
+"""
+
+import mmap
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from swb_grid import SWBGrid
+from extraterrestrial_radiation_cache import ExtraterrestrialRadiationCache
+
+
+SHARDED_OUTPUT_VARIABLES = ['rainfall', 'snowfall', 'snowmelt', 'snow_storage', 'pet', 'p_minus_pet',
+                            'aet', 'soil_storage', 'net_infiltration', 'apwl', 'gdd']
+
+DEFAULT_ROWS_PER_BLOCK = 16
+
+# SWBGrid stages that hold per-cell parameters or state, and are split into blocks of rows with select_rows()
+ROW_STAGES = ('runoff', 'frozen_ground_index', 'fao56_two_stage', 'crop_coefficients', 'irrigation')
+
+
+def _memmap_descriptor(array):
+    # an np.memmap that still owns its whole mapping can be reopened by the workers from its file
+    if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.filename is not None \
+            and array.flags.c_contiguous:
+        return ('memmap', array.filename, array.offset, array.shape, array.dtype.str)
+    return None
+
+
+class _SharedArrays:
+    """
+    Holds the shared-memory blocks created for one run, and the descriptors used to reopen them.
+    """
+
+    def __init__(self):
+        self.blocks = []
+
+    def share(self, array):
+        descriptor = _memmap_descriptor(array)
+        if descriptor is not None:
+            return descriptor
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        block = self.allocate(array.shape)
+        np.ndarray(array.shape, dtype=np.float64, buffer=block.buf)[...] = array
+        return ('shm', block.name, 0, array.shape, np.dtype(np.float64).str)
+
+    def allocate(self, shape):
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        self.blocks.append(block)
+        return block
+
+    def empty(self, shape):
+        block = self.allocate(shape)
+        return ('shm', block.name, 0, shape, np.dtype(np.float64).str), block
+
+    def detach(self, block, shape):
+        """
+        Return an array over `block` that outlives this run: the block's name is unlinked now, so nothing else
+        can open it, and its memory is released when the array (and every view of it) is freed.
+        """
+        self.blocks.remove(block)
+        values = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        block.unlink()
+        weakref.finalize(values, block.close)
+        return values
+
+    def release(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _open(descriptor, opened, mode='r'):
+    (kind, name, offset, shape, dtype) = descriptor
+    if kind == 'memmap':
+        return np.memmap(name, dtype=dtype, mode=mode, offset=offset, shape=shape)
+    block = shared_memory.SharedMemory(name=name)
+    opened.append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _run_row_block(task):
+    (row_start, row_stop, inputs, outputs, date_arrays, settings, stages) = task
+    (day_of_year, number_of_days_in_year, is_jan_1) = date_arrays
+    opened = []
+    try:
+        arrays = {name: _open(descriptor, opened) for name, descriptor in inputs.items()}
+        results = {name: _open(descriptor, opened, mode='r+') for name, descriptor in outputs.items()}
+        rows = slice(row_start, row_stop)
+
+        radiation_cache = None
+        if settings['latitude_resolution'] is not None:
+            radiation_cache = ExtraterrestrialRadiationCache(latitude_resolution=settings['latitude_resolution'])
+
+        grid = SWBGrid(arrays['latitude'][rows], arrays['available_water_capacity'][rows],
+                       arrays['rooting_depth'][rows], calculation_method=settings['calculation_method'],
+                       thornthwaite_mather_df=settings['thornthwaite_mather_df'],
+                       radiation_cache=radiation_cache, growing_season=settings['growing_season'], **stages)
+        grid.init_swb_grid(percent_soil_storage=settings['percent_soil_storage'],
+                           snow_storage=settings['snow_storage'])
+
+        result_items = [(results[name], name) for name in outputs]
+        for day in range(len(day_of_year)):
+            grid.set_date_measures(float(day_of_year[day]), float(number_of_days_in_year[day]))
+            grid.calc_daily_water_budget(arrays['tmin'][day, rows], arrays['tmax'][day, rows],
+                                         arrays['tmean'][day, rows], arrays['precip'][day, rows],
+                                         reset_gdd=bool(is_jan_1[day]))
+            for values, name in result_items:
+                values[day, rows] = getattr(grid, name)
+
+        for values, name in result_items:
+            if isinstance(values, np.memmap):
+                values.flush()
+    finally:
+        # drop every view of the shared buffers before closing them
+        arrays = results = grid = result_items = None
+        for block in opened:
+            block.close()
+
+    return row_start, row_stop
+
+
+def row_blocks(number_of_rows, rows_per_block=DEFAULT_ROWS_PER_BLOCK):
+    """Return the (row_start, row_stop) pairs that split number_of_rows into blocks of rows_per_block."""
+    return [(start, min(start + rows_per_block, number_of_rows))
+            for start in range(0, number_of_rows, rows_per_block)]
+
+
+def run_sharded(date_measures, tmin, tmax, tmean, precip, latitude, available_water_capacity, rooting_depth,
+                calculation_method='tm_exp', thornthwaite_mather_df=None, percent_soil_storage=100.,
+                snow_storage=0., variables=None, number_of_workers=None, rows_per_block=DEFAULT_ROWS_PER_BLOCK,
+                latitude_resolution=None, output_directory=None, runoff=None, frozen_ground_index=None,
+                fao56_two_stage=None, crop_coefficients=None, irrigation=None, growing_season=None):
+    """
+    Run SWBGrid over a (row x column) grid, one block of rows per task, in a pool of worker processes.
+
+    date_measures               DateMeasures for the run (see date_measures.py).
+    tmin, tmax, tmean, precip   (n_days, n_rows, n_cols) daily weather, in degrees Celsius and millimeters.
+                                np.memmap arrays are read by the workers directly from their files.
+    latitude, available_water_capacity, rooting_depth
+                                Cell properties; scalars or arrays that broadcast to (n_rows, n_cols).
+    calculation_method          Actual ET method passed to SWBGrid.
+    thornthwaite_mather_df      Thornthwaite-Mather table, for 'tm_table' and 'tm_curves'.
+    variables                   SWBGrid attributes to return; defaults to SHARDED_OUTPUT_VARIABLES.
+    number_of_workers           Number of worker processes; None uses os.cpu_count(), and 0 runs every block
+                                in this process.
+    rows_per_block              Number of grid rows in each task.
+    latitude_resolution         If given, each worker uses an ExtraterrestrialRadiationCache with this
+                                latitude resolution for PET.
+    output_directory            If given, outputs are written by the workers to <variable>.npy files in this
+                                directory and returned as read-only memory maps; otherwise the workers write
+                                them to shared memory, which is returned without a copy.
+    runoff, frozen_ground_index, fao56_two_stage, crop_coefficients, irrigation, growing_season
+                                Optional SWBGrid stages for the whole (n_rows, n_cols) grid, as for a serial
+                                SWBGrid. Each task is given the rows of its block (see the stages' select_rows);
+                                the stages passed in are not advanced.
+
+    Returns a dict of (n_days, n_rows, n_cols) arrays keyed by variable name.
+    """
+    variables = list(SHARDED_OUTPUT_VARIABLES if variables is None else variables)
+    number_of_days = len(date_measures)
+    shape = np.shape(tmin)
+    if len(shape) != 3 or shape[0] != number_of_days:
+        raise ValueError(f"weather arrays must have shape (n_days, n_rows, n_cols) with n_days={number_of_days}; "
+                         f"got {shape}")
+    grid_shape = shape[1:]
+
+    date_arrays = (np.asarray(date_measures.day_of_year), np.asarray(date_measures.number_of_days_in_year),
+                   np.asarray(date_measures.is_jan_1))
+    settings = {'calculation_method': calculation_method,
+                'thornthwaite_mather_df': thornthwaite_mather_df,
+                'percent_soil_storage': percent_soil_storage,
+                'snow_storage': snow_storage,
+                'latitude_resolution': latitude_resolution,
+                'growing_season': growing_season}
+    stages = {name: stage for name, stage in zip(ROW_STAGES, (runoff, frozen_ground_index, fao56_two_stage,
+                                                              crop_coefficients, irrigation))
+              if stage is not None}
+    for name, stage in stages.items():
+        if stage.shape != grid_shape:
+            raise ValueError(f"{name} has shape {stage.shape}; the grid has shape {grid_shape}")
+
+    shared = _SharedArrays()
+    try:
+        inputs = {'tmin': shared.share(tmin), 'tmax': shared.share(tmax),
+                  'tmean': shared.share(tmean), 'precip': shared.share(precip)}
+        for name, values in (('latitude', latitude), ('available_water_capacity', available_water_capacity),
+                             ('rooting_depth', rooting_depth)):
+            inputs[name] = shared.share(np.broadcast_to(np.asarray(values, dtype=np.float64), grid_shape))
+
+        outputs = {}
+        shared_outputs = {}
+        for name in variables:
+            if output_directory is not None:
+                filename = os.path.join(output_directory, f'{name}.npy')
+                values = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64,
+                                                   shape=(number_of_days,) + grid_shape)
+                outputs[name] = ('memmap', filename, values.offset, values.shape, values.dtype.str)
+                del values
+            else:
+                (outputs[name], shared_outputs[name]) = shared.empty((number_of_days,) + grid_shape)
+
+        # only the rows of its own block of each stage are pickled with a task
+        tasks = [(row_start, row_stop, inputs, outputs, date_arrays, settings,
+                  {name: stage.select_rows(slice(row_start, row_stop)) for name, stage in stages.items()})
+                 for row_start, row_stop in row_blocks(grid_shape[0], rows_per_block)]
+
+        if number_of_workers == 0:
+            for task in tasks:
+                _run_row_block(task)
+        else:
+            with ProcessPoolExecutor(max_workers=number_of_workers,
+                                     mp_context=multiprocessing.get_context('forkserver')) as executor:
+                # list() re-raises the first exception from any worker
+                list(executor.map(_run_row_block, tasks))
+
+        if output_directory is not None:
+            return {name: np.load(os.path.join(output_directory, f'{name}.npy'), mmap_mode='r')
+                    for name in variables}
+        # hand the output blocks themselves to the caller rather than copying them
+        return {name: shared.detach(block, (number_of_days,) + grid_shape) for name, block in shared_outputs.items()}
+
+    finally:
+        shared.release()
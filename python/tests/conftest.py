@@ -0,0 +1,40 @@
+import pathlib as pl
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the model modules live side by side in python/ and import one another by name
+PYTHON_DIRECTORY = pl.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PYTHON_DIRECTORY))
+
+TEST_DATA_DIRECTORY = PYTHON_DIRECTORY.parent / 'test_data'
+
+from date_measures import date_measures_for_period
+
+
+@pytest.fixture(scope='session')
+def weather():
+    """Two years of synthetic daily weather (degrees Celsius, mm) with cold, snowy winters and dry spells."""
+    measures = date_measures_for_period('2001-01-01', '2002-12-31')
+    rng = np.random.default_rng(2024)
+    seasonal = -12. * np.cos(2. * np.pi * (measures.day_of_year - 15.) / 365.)
+    tmean = 4. + seasonal + rng.normal(0., 3., len(measures))
+    spread = rng.uniform(4., 14., len(measures))
+    tmin = tmean - spread / 2.
+    tmax = tmean + spread / 2.
+    precip = np.where(rng.uniform(size=len(measures)) < 0.35, rng.gamma(0.8, 6., len(measures)), 0.)
+    return measures, tmin, tmax, tmean, precip
+
+
+@pytest.fixture(scope='session')
+def cells():
+    """Latitude (degrees), available water capacity (mm/m) and rooting depth (m) of a few contrasting cells."""
+    return (np.array([43.5, 45.0, 47.2, 60.6]), np.array([300., 150., 80., 120.]), np.array([1.0, 0.5, 2.0, 1.5]))
+
+
+@pytest.fixture(scope='session')
+def tm_df():
+    """The Thornthwaite-Mather soil-moisture retention tables (millimeters)."""
+    return pd.read_csv(TEST_DATA_DIRECTORY / 'Thornthwaite_soil_moisture_retention_tables__millimeters.csv')
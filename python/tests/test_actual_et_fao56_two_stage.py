@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from actual_et_fao56_two_stage import FAO56TwoStage
+from conftest import TEST_DATA_DIRECTORY
+from lookup_tables import CompiledLookupTable
+
+
+def test_fao56_components_sum_to_capped_actual_et():
+    fao56 = FAO56TwoStage((3,), kcb=np.array([0.3, 1.0, 1.1]))
+    aet = fao56.calculate(np.zeros(3), np.full(3, 5.), np.array([0.5, 1.0, 100.]), np.full(3, 150.))
+    assert np.all(aet <= np.array([0.5, 1.0, 100.]))
+    np.testing.assert_allclose(fao56.bare_soil_evaporation + fao56.crop_transpiration, aet)
+
+
+def test_surface_layer_dries_out():
+    fao56 = FAO56TwoStage((), kcb=0.15, kcb_min=0.15, total_evaporable_water_tew=20., readily_evaporable_water_rew=8.)
+    evaporation = []
+    for _ in range(10):
+        fao56.calculate(0., 5., 150., 150.)
+        evaporation.append(float(fao56.bare_soil_evaporation))
+    # stage 1 (energy limited) until REW is gone, then falling with Kr; never more than TEW in total
+    assert evaporation[0] == evaporation[1] > evaporation[-1]
+    assert sum(evaporation) <= 20. + 1e-9
+    assert 0. <= fao56.evaporable_water_storage < 20.
+    # rain refills the surface layer
+    fao56.calculate(30., 5., 150., 150.)
+    assert fao56.bare_soil_evaporation == pytest.approx(evaporation[0])
+
+
+def test_water_stress_reduces_transpiration():
+    fao56 = FAO56TwoStage((2,), kcb=1.0, depletion_fraction_p=0.5)
+    fao56.calculate(np.zeros(2), 5., np.array([150., 30.]), 150.)
+    assert fao56.water_stress_coefficient_ks[0] == 1. and fao56.water_stress_coefficient_ks[1] < 1.
+    assert fao56.crop_transpiration[1] < fao56.crop_transpiration[0] == pytest.approx(5.)
+
+
+def test_from_the_minnesota_irrigation_table():
+    lookup = CompiledLookupTable.from_file(TEST_DATA_DIRECTORY / 'IRR_lookup_MN_v3.txt')
+    lu_grid = np.array([[41, 82], [71, 255]], dtype=np.uint8)
+    hsg_grid = np.array([[1, 2], [3, 1]], dtype=np.uint8)
+    fao56 = FAO56TwoStage.from_lookup_table(lookup, lu_grid, hsg_grid)
+    assert fao56.shape == (2, 2)
+    # the nodata cell gets no parameters
+    assert np.isnan(fao56.kcb_mid[1, 1]) and np.isfinite(fao56.kcb_mid[0]).all()
+    # TEW and REW are per soil group, in inches
+    np.testing.assert_allclose(fao56.total_evaporable_water_tew[0], 25.4 * lookup.gather('tew', lu_grid, hsg_grid)[0])
+    # in the FAO-56 standard climate kcb_max is max(1.2, kcb + 0.05) (equation 72)
+    kcb = np.maximum(lookup.table('kcb_mid'), lookup.table('kcb_end'))[[41, 82, 71]]
+    np.testing.assert_allclose(fao56.kcb_max.ravel()[:3], np.maximum(1.2, kcb + 0.05))
+    # a windy, dry climate raises it
+    windy = FAO56TwoStage.from_lookup_table(lookup, lu_grid, hsg_grid, wind_speed_meters_per_sec=5.,
+                                            relative_humidity_min_pct=25.)
+    assert np.all(windy.kcb_max.ravel()[:3] > fao56.kcb_max.ravel()[:3])
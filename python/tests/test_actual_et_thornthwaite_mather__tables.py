@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from actual_et_thornthwaite_mather__tables import (TMRetentionCurves, TMTableIndex, calc_actual_et__tm_curves,
+                                                  calc_actual_et__tm_tables)
+from swb_cell import SWBCell
+from swb_configuration import SOIL_MOISTURE_CALCULATION_METHODS, normalize_method_name
+from swb_grid import SWBGrid
+
+
+def first_nearest(tm_df, key_column, value_column, value):
+    """The lookup that TMTableIndex replaces, with a stable sort so that ties go to the first row."""
+    table = tm_df[[key_column, value_column]].dropna()
+    return table.iloc[(table[key_column] - value).abs().argsort(kind='stable')[:1]][value_column].values[0]
+
+
+def test_index_finds_the_nearest_row(tm_df):
+    index = TMTableIndex(tm_df)
+    rng = np.random.default_rng(5)
+    soil_storage = np.r_[rng.uniform(0., 310., 300), 168.25, 300., 0.]
+    apwl = np.r_[rng.uniform(0., 1600., 300), np.arange(0.5, 20.), -3.]
+
+    expected = [first_nearest(tm_df, 'sz_300_calc', 'apwl_mm', value) for value in soil_storage]
+    assert np.array_equal(index.apwl_from_soil_storage(soil_storage), expected)
+    expected = [first_nearest(tm_df, 'apwl_mm', 'sz_300_calc', value) for value in apwl]
+    assert np.array_equal(index.soil_storage_from_apwl(apwl), expected)
+
+    # scalar queries return scalars
+    assert np.ndim(index.soil_storage_from_apwl(2.5)) == 0
+    assert index.soil_storage_from_apwl(2.5) == tm_df['sz_300_calc'][2]
+
+
+def test_ties_go_to_the_first_row():
+    tm_df = pd.DataFrame({'apwl_mm': [0., 1., 2., 3., 4., 5.],
+                          'sz_300_calc': [10., 8., 8., 8., 5., 5.]})
+    index = TMTableIndex(tm_df)
+    # repeated keys, approached from above and below
+    assert index.apwl_from_soil_storage(7.) == 1.
+    assert index.apwl_from_soil_storage(8.9) == 1.
+    assert index.apwl_from_soil_storage(4.) == 4.
+    # equally near two rows
+    assert index.apwl_from_soil_storage(9.) == 0.
+    assert index.apwl_from_soil_storage(6.5) == 1.
+    assert index.soil_storage_from_apwl(3.5) == 8.
+
+
+def test_tables_lookup_accepts_the_index_or_the_table(tm_df):
+    index = TMTableIndex(tm_df)
+    for (rainfall, pet, soil_storage) in [(5., 2., 250.), (0., 4., 250.), (0., 6., 41.3)]:
+        assert calc_actual_et__tm_tables(rainfall, 0., pet, 0., soil_storage, index) == \
+            calc_actual_et__tm_tables(rainfall, 0., pet, 0., soil_storage, tm_df)
+
+
+@pytest.mark.parametrize('engine', [SWBCell, SWBGrid])
+def test_engines_build_only_the_structure_the_method_uses(tm_df, engine):
+    built = {method: engine(45., 300., 1., method, thornthwaite_mather_df=tm_df)
+             for method in ('tm_exp', 'tm_eqns', 'tm_table', 'tm_curves')}
+    assert [method for method, swb in built.items() if swb.tm_index is not None] == ['tm_table']
+    assert [method for method, swb in built.items() if swb.tm_curves is not None] == ['tm_curves']
+
+
+@pytest.mark.parametrize('capacity', [25, 50, 75, 100, 300])
+def test_retention_curves_follow_the_table_columns(tm_df, capacity):
+    curves = TMRetentionCurves(tm_df)
+    column = tm_df[f'sz_{capacity}'].dropna()
+    soil_storage = curves.soil_storage_from_apwl(curves.curve_ids(float(capacity)),
+                                                 tm_df['apwl_mm'][column.index].to_numpy())
+    # the tables are rounded to whole millimeters
+    assert np.abs(soil_storage - column.to_numpy()).max() < 1.
+
+
+def test_retention_curves_between_table_columns(tm_df):
+    curves = TMRetentionCurves(tm_df)
+    ids = curves.curve_ids(np.array([100., 150., 300., 150.]))
+    assert ids[1] == ids[3]
+    assert curves.curve_ids(150.) == ids[1]
+    # one curve is computed for each capacity asked for
+    assert sorted(curves.capacities.tolist()) == [100., 150., 300.]
+
+    # the retained fraction at the same normalized APWL lies between the bracketing columns
+    fraction = curves.soil_storage_from_apwl(ids, np.array([100., 150., 300., 150.]) * 0.8) \
+               / np.array([100., 150., 300., 150.])
+    assert min(fraction[0], fraction[2]) < fraction[1] < max(fraction[0], fraction[2])
+
+    apwl = np.linspace(0., 600., 61)
+    soil_storage = curves.soil_storage_from_apwl(ids[1], apwl)
+    assert np.all(np.diff(soil_storage) < 0.)
+    np.testing.assert_allclose(curves.apwl_from_soil_storage(ids[1], soil_storage), apwl, atol=0.01)
+
+
+def test_curves_method_keeps_storage_within_capacity(tm_df):
+    curves = TMRetentionCurves(tm_df)
+    soil_storage_max = np.array([40., 150., 300.])
+    soil_storage = soil_storage_max.copy()
+    for (rainfall, pet) in [(0., 5.)] * 30 + [(400., 1.)]:
+        (p_minus_pet, apwl, aet) = calc_actual_et__tm_curves(rainfall, 0., pet, soil_storage, soil_storage_max,
+                                                              curves)
+        soil_storage = np.minimum(soil_storage + rainfall - aet, soil_storage_max)
+        assert np.all((aet >= 0.) & (aet <= pet + 1e-12))
+        assert np.all((soil_storage > 0.) & (soil_storage <= soil_storage_max))
+    assert np.array_equal(soil_storage, soil_storage_max)
+
+
+def test_configured_thornthwaite_mather_runs_use_the_retention_curves():
+    assert SOIL_MOISTURE_CALCULATION_METHODS[normalize_method_name('Thornthwaite-Mather')] == 'tm_curves'
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from arc_ascii_grid import cached_arc_ascii_grid, read_arc_ascii_grid, smallest_dtype
+
+LAND_USE_GRID = """ncols 4
+nrows 3
+xllcenter 1015.0
+yllcenter 2015.0
+cellsize 30.0
+NODATA_value -9999
+21 21 41 -9999
+81 82 82 11
+-9999 71 71 41
+"""
+
+AWC_GRID = """NCOLS 3
+NROWS 2
+XLLCORNER 0.0
+YLLCORNER 0.0
+CELLSIZE 1000.0
+2.5 1.75 3
+0.125 -9999 4
+"""
+
+
+def write_grid(directory, name, text):
+    filename = directory / name
+    filename.write_text(text)
+    return filename
+
+
+def test_read_arc_ascii_grid(tmp_path):
+    grid = read_arc_ascii_grid(write_grid(tmp_path, 'lu.asc', LAND_USE_GRID))
+    assert grid.shape == (3, 4) and (grid.nrows, grid.ncols) == (3, 4)
+    # centers are converted to the lower-left corner
+    assert (grid.xllcorner, grid.yllcorner, grid.cellsize) == (1000., 2000., 30.)
+    assert grid.values[1].tolist() == [81., 82., 82., 11.]
+    assert grid.nodata_mask.sum() == 2 and grid.nodata_mask[0, 3]
+
+    with pytest.raises(ValueError, match=r'expected 12 values \(3 rows x 4 columns\), found 11'):
+        read_arc_ascii_grid(write_grid(tmp_path, 'short.asc', LAND_USE_GRID.rstrip()[:-3]))
+
+
+def test_smallest_dtype():
+    assert smallest_dtype(np.array([0., 255.])) == np.uint8
+    # with nodata present the largest value of the type is kept free for it
+    assert smallest_dtype(np.array([0., 255., -9999.]), -9999.) == np.uint16
+    assert smallest_dtype(np.array([-1., 100.])) == np.int8
+    assert smallest_dtype(np.array([1.5, 2.])) == np.float32
+
+
+def test_cached_grid_round_trip(tmp_path):
+    filename = write_grid(tmp_path, 'lu.asc', LAND_USE_GRID)
+    cache_directory = tmp_path / 'cache'
+    cached = cached_arc_ascii_grid(filename, cache_directory=cache_directory)
+    assert sorted(path.name for path in cache_directory.iterdir()) == ['lu.asc.json', 'lu.asc.npy']
+
+    parsed = read_arc_ascii_grid(filename)
+    assert isinstance(cached.values, np.memmap) and not cached.values.flags.writeable
+    assert cached.values.dtype == np.uint8 and cached.nodata_value == 255
+    assert np.array_equal(cached.nodata_mask, parsed.nodata_mask)
+    assert np.array_equal(cached.values[~cached.nodata_mask], parsed.values[~parsed.nodata_mask])
+    assert (cached.xllcorner, cached.yllcorner, cached.cellsize) == (1000., 2000., 30.)
+
+
+def test_cache_is_reused_until_the_grid_changes(tmp_path):
+    filename = write_grid(tmp_path, 'awc.asc', AWC_GRID)
+    first = cached_arc_ascii_grid(filename)
+    assert first.values.dtype == np.float32 and first.nodata_value is None
+    npy_path = tmp_path / 'awc.asc.npy'
+    written = npy_path.stat().st_mtime_ns
+
+    assert np.array_equal(cached_arc_ascii_grid(filename).values, first.values)
+    assert npy_path.stat().st_mtime_ns == written
+
+    filename.write_text(AWC_GRID.replace('2.5 1.75 3', '2.5 1.75 9'))
+    os.utime(filename, ns=(written + 10 ** 9, written + 10 ** 9))
+    assert cached_arc_ascii_grid(filename).values[0, 2] == 9.
+
+    # a different requested dtype also rewrites the cache
+    assert cached_arc_ascii_grid(filename, dtype=np.float64).values.dtype == np.float64
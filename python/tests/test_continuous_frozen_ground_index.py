@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from continuous_frozen_ground_index import (CFGI_DECAY_COEFFICIENT_A, ContinuousFrozenGroundIndex,
+                                            update_continuous_frozen_ground_index)
+from swb_configuration import read_swb_configuration
+
+
+def test_update_without_snow():
+    # no snow: the index decays by A and gains the degree-days below freezing
+    assert update_continuous_frozen_ground_index(10., -5., 0.) == pytest.approx(CFGI_DECAY_COEFFICIENT_A * 10. + 5.)
+    # it never falls below zero
+    assert update_continuous_frozen_ground_index(1., 20., 0.) == 0.
+
+
+def test_snow_insulates_the_ground():
+    cfgi = np.zeros(3)
+    update_continuous_frozen_ground_index(cfgi, -10., np.array([0., 10., 100.]), out=cfgi)
+    # 10 mm of snow water equivalent is 10 cm of snow: exp(-0.4 * 0.5 * 10)
+    np.testing.assert_allclose(cfgi, [10., 10. * np.exp(-2.), 10. * np.exp(-20.)])
+
+
+def test_index_state():
+    index = ContinuousFrozenGroundIndex((2,), initial_cfgi=np.array([50., 80.]), lower_limit=55., upper_limit=83.)
+    cfgi = index.cfgi
+    index.update(np.array([-10., -10.]), 0.)
+    # updated in place, so engines can hold on to the array
+    assert index.cfgi is cfgi
+    assert index.is_frozen.tolist() == [True, True]
+    np.testing.assert_allclose(index.probability_of_enhanced_runoff, [(58.5 - 55.) / 28., 1.])
+    with pytest.raises(ValueError, match='must exceed the lower limit'):
+        ContinuousFrozenGroundIndex(lower_limit=83., upper_limit=55.)
+
+
+def test_from_configuration():
+    configuration = read_swb_configuration(TEST_DATA_DIRECTORY / 'swb_control_file_minnesota_prism.ctl')
+    index = ContinuousFrozenGroundIndex.from_configuration(configuration, shape=(2, 3))
+    assert (index.lower_limit, index.upper_limit) == (55., 83.)
+    assert np.array_equal(index.cfgi, np.full((2, 3), 100.))
+    assert np.all(ContinuousFrozenGroundIndex.from_configuration(configuration, (2,), initial_cfgi=0.).cfgi == 0.)
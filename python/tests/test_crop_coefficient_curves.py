@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from crop_coefficient_curves import CALENDAR_YEAR_LENGTHS, KcbCurves, day_of_year_from_mmdd
+from crop_coefficients_fao56_date import calculate_kcb_for_day_of_year
+from date_measures import date_measures_for_period
+from lookup_tables import CompiledLookupTable
+
+
+def curves_table(**columns):
+    """Kcb curves of land uses 1 (planted 4/15, in a single year) and 2 (planted 11/15, crossing 1 January)."""
+    df = pd.DataFrame({'lu_code': [1, 2], 'planting_date': [105., 319.], 'planting_date__mmdd': ['4/15', '11/15'],
+                       'l_ini': [20., 30.], 'l_dev': [30., 60.], 'l_mid': [60., 60.], 'l_late': [30., 40.],
+                       'l_fallow': [1., 1.],
+                       'kcb_min': [0.15, 0.2], 'kcb_ini': [0.3, 0.3], 'kcb_mid': [1.1, 1.0], 'kcb_end': [0.4, 0.5],
+                       **columns})
+    return CompiledLookupTable(df, name='kcb_curves.txt')
+
+
+def test_day_of_year_from_mmdd():
+    dates = ['3/1', None, '12/31', '5/31']
+    assert day_of_year_from_mmdd(dates, 7., 365).tolist() == [60., 7., 365., 151.]
+    assert day_of_year_from_mmdd(dates, 7., 366).tolist() == [61., 7., 366., 152.]
+    # 30-day months; the 31st is taken as the 30th
+    assert day_of_year_from_mmdd(dates, 7., 360).tolist() == [61., 7., 360., 150.]
+    with pytest.raises(ValueError):
+        day_of_year_from_mmdd(['2/30'], 1., 360)
+    with pytest.raises(ValueError, match='years of 364 days are not supported'):
+        day_of_year_from_mmdd(dates, 1., 364)
+
+
+def test_tables_for_every_calendar_year_length():
+    curves = KcbCurves(curves_table())
+    assert sorted(curves.kcb_by_day_of_year) == list(CALENDAR_YEAR_LENGTHS)
+    for number_of_days_in_year, planting_doy in ((360, 105.), (365, 105.), (366, 106.)):
+        expected = calculate_kcb_for_day_of_year(np.arange(1., 367.), planting_doy, 20., 30., 60., 30., 1.,
+                                                 0.15, 0.3, 1.1, 0.4)
+        np.testing.assert_array_equal(curves.kcb_by_day_of_year[number_of_days_in_year][1, 1:], expected)
+
+
+@pytest.mark.parametrize('number_of_days_in_year', CALENDAR_YEAR_LENGTHS)
+def test_season_crossing_the_new_year_continues_in_january(number_of_days_in_year):
+    table = KcbCurves(curves_table()).kcb_by_day_of_year[number_of_days_in_year][2]
+    planting_doy = int(day_of_year_from_mmdd(['11/15'], 1., number_of_days_in_year)[0])
+
+    def day_of_season(days_since_planting):
+        # the day of year, in the year after planting, that falls days_since_planting after the planting day
+        return days_since_planting + planting_doy - number_of_days_in_year
+
+    assert table[planting_doy - 1] == 0.2 and table[planting_doy] == 0.3
+    # development ends 90 days after planting, in the next year
+    assert table[day_of_season(89)] < 1.0 and table[day_of_season(91)] == 1.0
+    # the late season ends 190 days after planting and the fallow day follows; then kcb_min until planting
+    assert table[day_of_season(190)] == table[day_of_season(191)] == 0.5
+    assert np.all(table[day_of_season(192):planting_doy] == 0.2)
+
+
+def test_grid_kcb_follows_the_calendar():
+    curves = KcbCurves(curves_table())
+    grid_kcb = curves.for_grid(np.array([[1, 2], [2, 1]]))
+    for calendar in ('360_day', 'noleap', 'all_leap'):
+        measures = date_measures_for_period('2001-01-01', '2001-12-30', calendar=calendar)
+        for day in range(0, len(measures), 17):
+            (day_of_year, number_of_days_in_year) = (measures.day_of_year[day], measures.number_of_days_in_year[day])
+            kcb = grid_kcb.kcb(day_of_year, number_of_days_in_year)
+            table = curves.kcb_by_day_of_year[number_of_days_in_year]
+            assert kcb.tolist() == [[table[1, day_of_year], table[2, day_of_year]],
+                                    [table[2, day_of_year], table[1, day_of_year]]]
+    with pytest.raises(ValueError, match='years of 364 days are not supported'):
+        grid_kcb.kcb(10, 364)
+
+
+def test_gdd_curves_and_row_blocks():
+    gdd = {'gdd_plant': [np.nan, 100.], 'gdd_ini': [np.nan, 300.], 'gdd_dev': [np.nan, 700.],
+           'gdd_mid': [np.nan, 1300.], 'gdd_late': [np.nan, 1600.], 'gdd_fallow': [np.nan, 1700.]}
+    curves = KcbCurves(curves_table(**gdd))
+    assert curves.uses_gdd[[1, 2]].tolist() == [False, True]
+    grid_kcb = curves.for_grid(np.array([[1, 2], [2, 2], [1, 1]]))
+    with pytest.raises(ValueError, match='growing degree-days are required'):
+        grid_kcb.kcb(200, 365)
+    kcb = grid_kcb.kcb(200, 365, gdd=1000.)
+    assert kcb[0, 1] == kcb[1, 0] == 1.0 and kcb[0, 0] == curves.kcb_by_day_of_year[365][1, 200]
+
+    # the rows of a block get the same Kcb as those rows of the whole grid
+    block = grid_kcb.select_rows(slice(1, 3))
+    gdd_grid = np.array([[0., 500.], [1650., 2000.], [0., 0.]])
+    np.testing.assert_array_equal(block.kcb(200, 365, gdd_grid[1:]), grid_kcb.kcb(200, 365, gdd_grid)[1:])
+
+
+def test_minnesota_curves_peak_in_summer():
+    curves = KcbCurves(CompiledLookupTable.from_file(TEST_DATA_DIRECTORY / 'IRR_lookup_MN_v3.txt'))
+    for number_of_days_in_year in CALENDAR_YEAR_LENGTHS:
+        corn = curves.kcb_by_day_of_year[number_of_days_in_year][82, 1:number_of_days_in_year + 1]
+        assert np.all(np.isfinite(corn))
+        assert 150 < np.argmax(corn) + 1 < 250
+        assert corn[0] == corn[-1] == curves.kcb_by_day_of_year[365][82, 1]
@@ -0,0 +1,75 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from date_measures import (DateMeasures, date_measures_for_period, date_measures_from_dates,
+                           date_measures_from_time_values, normalize_calendar_name)
+
+
+def test_standard_calendar_matches_datetime():
+    measures = date_measures_for_period('1899-12-25', '2101-01-05')
+    assert np.array_equal(date_measures_from_dates(measures.dates).day_of_year, measures.day_of_year)
+    for index in range(0, len(measures), 97):
+        # the calculation SWBCell.update_date_measures makes with datetime each day
+        date = dt.datetime(int(measures.year[index]), int(measures.month[index]), int(measures.day[index]))
+        assert measures.day_of_year[index] == (date - dt.datetime(date.year, 1, 1)).days + 1
+        assert measures.number_of_days_in_year[index] == \
+            (dt.datetime(date.year, 12, 31) - dt.datetime(date.year, 1, 1)).days + 1
+    assert measures.number_of_days_in_year[measures.year == 1900][0] == 365
+    assert measures.number_of_days_in_year[measures.year == 2000][0] == 366
+
+
+def test_standard_calendar_day_of_year():
+    measures = date_measures_for_period('2000-02-27', '2001-03-02')
+    assert len(measures) == 370
+    february_29 = np.flatnonzero((measures.month == 2) & (measures.day == 29))
+    assert measures.day_of_year[february_29].tolist() == [60]
+    assert measures.number_of_days_in_year[0] == 366
+    assert measures.number_of_days_in_year[-1] == 365
+    assert measures.is_jan_1.sum() == 1
+    assert measures.dtindex[0] == '20000227'
+
+
+def test_noleap_calendar_skips_february_29():
+    measures = date_measures_for_period('2000-02-27', '2000-03-02', calendar='365_day')
+    assert measures.calendar == 'noleap'
+    assert list(zip(measures.month, measures.day)) == [(2, 27), (2, 28), (3, 1), (3, 2)]
+    assert measures.day_of_year.tolist() == [58, 59, 60, 61]
+    assert set(measures.number_of_days_in_year) == {365}
+
+
+def test_360_day_calendar_has_30_day_months():
+    measures = date_measures_for_period('2001-01-01', '2002-12-30', calendar='360_day')
+    assert len(measures) == 720
+    assert measures.day.max() == 30
+    assert np.array_equal(measures.day_of_year[:360], np.arange(1, 361))
+    assert measures.is_jan_1.sum() == 2
+    with pytest.raises(ValueError):
+        measures.dates
+
+
+@pytest.mark.parametrize('calendar, expected', [
+    ('noleap', [(2002, 1, 1), (2002, 1, 2), (2002, 1, 3)]),
+    ('360_day', [(2002, 1, 11), (2002, 1, 12), (2002, 1, 13)]),
+    ('standard', [(2001, 12, 31), (2002, 1, 1), (2002, 1, 2)]),
+])
+def test_time_values_follow_the_calendar(calendar, expected):
+    # 2000-01-01 plus 730.5 .. 732.5 days; the time of day is dropped
+    measures = date_measures_from_time_values([730.5, 731.5, 732.5], 'days since 2000-01-01 00:00:00', calendar)
+    assert list(zip(measures.year.tolist(), measures.month.tolist(), measures.day.tolist())) == expected
+
+
+def test_time_values_in_hours():
+    measures = date_measures_from_time_values([0., 23., 24., 36.], 'hours since 1980-02-28 12:00', 'noleap')
+    assert list(zip(measures.month.tolist(), measures.day.tolist())) == [(2, 28), (3, 1), (3, 1), (3, 2)]
+
+
+def test_calendar_names():
+    assert normalize_calendar_name(' Gregorian ') == 'standard'
+    assert normalize_calendar_name('366_day') == 'all_leap'
+    assert DateMeasures([2001], [3], [1], calendar='all_leap').day_of_year.tolist() == [61]
+    with pytest.raises(ValueError, match='unsupported calendar'):
+        normalize_calendar_name('julian')
+    with pytest.raises(ValueError, match='unrecognized CF time units'):
+        date_measures_from_time_values([0.], 'months since 2000-01-01')
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from extraterrestrial_radiation_cache import ExtraterrestrialRadiationCache
+from pet_hargreaves_samani import calculate_et0_hargreaves_samani, calculate_et0_hargreaves_samani_grid
+from swb_cell import SWBCell
+from swb_grid import SWBGrid
+
+
+def direct_radiation(day_of_year, number_of_days_in_year, latitude):
+    # Hargreaves-Samani PET is proportional to Ra, so Ra is recovered from PET with a 1 degree range at 17.8 C
+    return calculate_et0_hargreaves_samani(day_of_year, number_of_days_in_year, latitude, 0., 1., 0.) \
+           / (0.0023 * 17.8)
+
+
+@pytest.mark.parametrize('number_of_days_in_year', [360, 365, 366])
+def test_exact_latitudes_reproduce_the_direct_calculation(number_of_days_in_year):
+    cache = ExtraterrestrialRadiationCache(latitude_resolution=None)
+    latitude = np.array([-33.9, 0., 44.97, 60.57154, 66.5])
+    day_of_year = np.arange(1, number_of_days_in_year + 1)
+    table = cache.extraterrestrial_radiation(day_of_year[:, np.newaxis], number_of_days_in_year, latitude)
+    expected = [[direct_radiation(day, number_of_days_in_year, value) for value in latitude] for day in day_of_year]
+    np.testing.assert_allclose(table, expected, rtol=1e-12)
+
+
+def test_default_bands_are_close_to_the_direct_calculation():
+    cache = ExtraterrestrialRadiationCache()
+    latitude = np.random.default_rng(1).uniform(43., 49.5, 2000)
+    (band_latitudes, band_index) = cache.latitude_bands(latitude)
+    assert band_latitudes.size <= 651
+    assert np.abs(band_latitudes[band_index] - latitude).max() <= 0.005 + 1e-12
+    for day in (1, 80, 172, 355):
+        exact = ExtraterrestrialRadiationCache(None).extraterrestrial_radiation(day, 365, latitude)
+        assert np.abs(cache.extraterrestrial_radiation(day, 365, latitude) - exact).max() < 0.002
+
+
+def test_scalar_lookups():
+    cache = ExtraterrestrialRadiationCache(latitude_resolution=None)
+    for day in (1., 100., 365.):
+        value = cache.extraterrestrial_radiation(day, 365., 60.57154)
+        assert np.ndim(value) == 0
+        assert value == pytest.approx(direct_radiation(day, 365., 60.57154), rel=1e-12)
+    # one column per latitude and year length, reused on later days
+    assert len(cache._columns) == 1
+    cache.extraterrestrial_radiation(np.int64(60), 366, np.float64(60.57154))
+    assert len(cache._columns) == 2
+    cache.clear()
+    assert not cache._columns and not cache._tables
+
+
+def test_time_series_spanning_leap_and_common_years():
+    cache = ExtraterrestrialRadiationCache(latitude_resolution=None)
+    day_of_year = np.array([365, 366, 1, 365])
+    number_of_days_in_year = np.array([366, 366, 365, 365])
+    values = cache.extraterrestrial_radiation(day_of_year, number_of_days_in_year, 45.)
+    expected = [direct_radiation(*day, 45.) for day in zip(day_of_year, number_of_days_in_year)]
+    np.testing.assert_allclose(values, expected, rtol=1e-12)
+
+
+def test_least_recently_used_tables_are_evicted():
+    cache = ExtraterrestrialRadiationCache(max_tables=2)
+    for latitude in (np.array([40.]), np.array([41.]), np.array([40.]), np.array([42.])):
+        cache.extraterrestrial_radiation(10, 365, latitude)
+    assert [np.frombuffer(key[1]).tolist() for key in cache._tables] == [[40.], [42.]]
+
+
+def test_cached_engines():
+    (latitude, awc, rooting_depth) = (np.array([44.123, 47.5]), np.array([150., 200.]), np.array([1., 1.]))
+    grid = SWBGrid(latitude, awc, rooting_depth, radiation_cache=ExtraterrestrialRadiationCache(None))
+    cached = SWBGrid(latitude, awc, rooting_depth, radiation_cache=ExtraterrestrialRadiationCache())
+    cell = SWBCell(latitude[0], awc[0], rooting_depth[0], radiation_cache=ExtraterrestrialRadiationCache())
+    for swb in (grid, cached):
+        swb.init_swb_grid()
+        swb.calc_grid_water_budget(2001, 6, 1, 10., 25., 17.5, 0.)
+    cell.init_swb_cell()
+    cell.calc_cell_water_budget(2001, 6, 1, 10., 25., 17.5, 0.)
+    uncached = calculate_et0_hargreaves_samani_grid(152, 365, latitude, 10., 25., 17.5)
+    # exact latitudes match the uncached calculation; 0.01 degree bands are within 0.002 mm/day of it
+    np.testing.assert_allclose(grid.pet, uncached, rtol=1e-12)
+    assert np.abs(cached.pet - uncached).max() < 0.002
+    assert abs(cell.pet - uncached[0]) < 0.002
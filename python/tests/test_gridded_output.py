@@ -0,0 +1,123 @@
+import json
+import types
+import zlib
+
+import numpy as np
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from date_measures import date_measures_for_period
+from gridded_output import HAVE_NETCDF4, GriddedOutputWriter
+from swb_configuration import read_swb_configuration
+
+SHAPE = (5, 7)
+CHUNK_DAYS = 8
+
+
+def record_small_grid(tmp_path, output_format, calendar='standard'):
+    """Write tmax and soil storage for 20 days of a 5 x 7 grid; return the values and the writer."""
+    date_measures = date_measures_for_period('2001-02-20', '2001-03-11', calendar=calendar)
+    rng = np.random.default_rng(3)
+    values = {'tmax': rng.normal(10., 5., (len(date_measures),) + SHAPE).astype(np.float32),
+              'soil_storage': rng.uniform(0., 300., (len(date_measures),) + SHAPE).astype(np.float32)}
+    values['soil_storage'][:, 0, 0] = np.nan
+
+    with GriddedOutputWriter(tmp_path, ['tmax', 'soil_storage'], SHAPE, date_measures, output_format=output_format,
+                             prefix='test_', chunk_days=CHUNK_DAYS, chunk_cells=(4, 4),
+                             x=np.arange(SHAPE[1]) * 30., y=np.arange(SHAPE[0]) * 30.) as writer:
+        for step in range(len(date_measures)):
+            grid = types.SimpleNamespace(tmax_c=values['tmax'][step], soil_storage=values['soil_storage'][step])
+            writer.record(step, grid)
+    return values, writer
+
+
+def read_zarr_array(directory):
+    """Decode a Zarr version 2 array written with zlib-compressed, '.'-separated chunks."""
+    metadata = json.loads((directory / '.zarray').read_text())
+    (shape, chunks) = (metadata['shape'], metadata['chunks'])
+    counts = [-(-size // chunk) for size, chunk in zip(shape, chunks)]
+    padded = np.full([count * chunk for count, chunk in zip(counts, chunks)], np.nan, dtype=metadata['dtype'])
+    for index in np.ndindex(*counts):
+        data = zlib.decompress((directory / '.'.join(map(str, index))).read_bytes())
+        region = tuple(slice(i * chunk, (i + 1) * chunk) for i, chunk in zip(index, chunks))
+        padded[region] = np.frombuffer(data, dtype=metadata['dtype']).reshape(chunks)
+    attributes = json.loads((directory / '.zattrs').read_text())
+    return padded[tuple(slice(0, size) for size in shape)], attributes
+
+
+@pytest.mark.parametrize('calendar, last_day', [('standard', '2001-03-11'), ('360_day', '2001-03-11')])
+def test_zarr_round_trip(tmp_path, calendar, last_day):
+    (values, writer) = record_small_grid(tmp_path, 'zarr', calendar)
+    number_of_days = len(writer.date_measures)
+    for name, expected in values.items():
+        store = tmp_path / f'test_{name}__2001-02-20_to_{last_day}__5_by_7.zarr'
+        assert json.loads((store / '.zgroup').read_text()) == {'zarr_format': 2}
+        (actual, attributes) = read_zarr_array(store / name)
+        np.testing.assert_array_equal(actual, expected)
+        assert attributes['_ARRAY_DIMENSIONS'] == ['time', 'y', 'x']
+
+        (time, time_attributes) = read_zarr_array(store / 'time')
+        assert np.array_equal(time, np.arange(number_of_days))
+        assert time_attributes['units'] == 'days since 2001-02-20 00:00:00'
+        assert time_attributes['calendar'] == calendar
+        assert np.array_equal(read_zarr_array(store / 'x')[0], np.arange(SHAPE[1]) * 30.)
+    # 360_day February has 30 days
+    assert number_of_days == (20 if calendar == 'standard' else 22)
+
+
+@pytest.mark.skipif(not HAVE_NETCDF4, reason='netCDF4 is not installed')
+@pytest.mark.parametrize('calendar', ['standard', 'noleap'])
+def test_netcdf_round_trip(tmp_path, calendar):
+    import netCDF4
+
+    (values, writer) = record_small_grid(tmp_path, 'netcdf', calendar)
+    for name, expected in values.items():
+        with netCDF4.Dataset(tmp_path / f'test_{name}__2001-02-20_to_2001-03-11__5_by_7.nc') as dataset:
+            variable = dataset[name]
+            variable.set_auto_mask(False)
+            np.testing.assert_array_equal(variable[:], expected)
+            assert variable.chunking() == [CHUNK_DAYS, 4, 4]
+            assert dataset['time'].units == 'days since 2001-02-20 00:00:00'
+            assert dataset['time'].calendar == calendar
+            assert np.array_equal(dataset['y'][:], np.arange(SHAPE[0]) * 30.)
+
+
+def test_days_are_recorded_in_order(tmp_path):
+    date_measures = date_measures_for_period('2001-01-01', '2001-01-10')
+    grid = types.SimpleNamespace(tmax_c=np.zeros(SHAPE))
+    with GriddedOutputWriter(tmp_path, ['tmax'], SHAPE, date_measures, output_format='zarr') as writer:
+        writer.record(0, grid)
+        with pytest.raises(ValueError, match='recorded in order'):
+            writer.record(2, grid)
+    with pytest.raises(ValueError, match='no gridded output'):
+        GriddedOutputWriter(tmp_path, ['tmax', 'recharge'], SHAPE, date_measures, output_format='zarr')
+
+
+def test_writer_errors_are_reported_on_close(tmp_path):
+    date_measures = date_measures_for_period('2001-01-01', '2001-01-10')
+    writer = GriddedOutputWriter(tmp_path, ['tmax'], SHAPE, date_measures, output_format='zarr', chunk_days=4)
+
+    def fail(start_day, block):
+        raise OSError('disk full')
+
+    writer.stores['tmax'].write = fail
+    for step in range(len(date_measures)):
+        writer.record(step, types.SimpleNamespace(tmax_c=np.zeros(SHAPE)))
+    with pytest.raises(RuntimeError, match='gridded output writer failed') as raised:
+        writer.close()
+    assert isinstance(raised.value.__cause__, OSError)
+
+
+def test_from_configuration_follows_the_output_options(tmp_path):
+    configuration = read_swb_configuration(TEST_DATA_DIRECTORY / 'swb_control_file_minnesota_prism.ctl')
+    with GriddedOutputWriter.from_configuration(configuration, tmp_path, calendar='360_day',
+                                                output_format='zarr') as writer:
+        pass
+    assert writer.shape == (86, 77) and writer.date_measures.calendar == '360_day'
+    assert {'snowmelt', 'tmax', 'actual_et', 'gross_precip', 'rainfall'} <= set(writer.variables)
+    # disabled in the control file, an alias of gross_precip, and FAO-56 outputs of a Thornthwaite-Mather run
+    assert not {'soil_storage', 'infiltration', 'gross_precipitation', 'crop_et'} & set(writer.variables)
+    (store,) = tmp_path.glob('snowmelt__1999-01-01_to_*__86_by_77.zarr')
+    (time, attributes) = read_zarr_array(store / 'time')
+    assert attributes['calendar'] == '360_day' and len(time) == len(writer.date_measures)
+    assert np.array_equal(read_zarr_array(store / 'x')[0], configuration.grid.x)
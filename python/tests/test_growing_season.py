@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from growing_season import GrowingSeason, season_day
+from runoff_curve_number import CurveNumberRunoff
+from swb_cell import SWBCell
+from swb_grid import SWBGrid
+
+
+def test_season_days():
+    assert season_day('133') == 133 and season_day(' 05/13 ') == 133
+    assert season_day('12/31') == 365
+    with pytest.raises(ValueError, match='between 1 and 366'):
+        GrowingSeason(0, 200)
+
+
+def test_season_contains_both_days_and_wraps_over_the_new_year():
+    season = GrowingSeason('133', '268', True)
+    assert [season.contains(day) for day in (132, 133, 268, 269)] == [False, True, True, False]
+    southern = GrowingSeason('10/01', '03/31')
+    assert [southern.contains(day) for day in (1, 90, 91, 273, 274, 366)] == [True, True, False, False, True, True]
+
+
+def test_engines_set_is_growing_season_each_day(weather, cells):
+    (measures, tmin, tmax, tmean, precip) = weather
+    (latitude, awc, rooting_depth) = cells
+    season = GrowingSeason(133, 268)
+    grid = SWBGrid(latitude, awc, rooting_depth, runoff=CurveNumberRunoff(np.full(len(latitude), 75.)),
+                   growing_season=season)
+    grid.init_swb_grid()
+    cell = SWBCell(latitude[0], awc[0], rooting_depth[0], runoff=CurveNumberRunoff(75.), growing_season=season)
+    cell.init_swb_cell()
+    for day in range(len(measures)):
+        date = (int(measures.year[day]), int(measures.month[day]), int(measures.day[day]))
+        grid.calc_grid_water_budget(*date, tmin[day], tmax[day], tmean[day], precip[day])
+        cell.calc_cell_water_budget(*date, tmin[day], tmax[day], tmean[day], precip[day])
+        expected = 133 <= measures.day_of_year[day] <= 268
+        assert grid.is_growing_season == cell.is_growing_season == expected
+        assert grid.runoff[0] == pytest.approx(cell.runoff, abs=1e-10)
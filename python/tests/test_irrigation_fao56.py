@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from actual_et_fao56_two_stage import adjust_depletion_fraction_p
+from date_measures import date_measures_for_period
+from irrigation_fao56 import FAO56Irrigation, application_scheme_code
+from lookup_tables import CompiledLookupTable
+
+SOIL_STORAGE_MAX = 100.
+
+
+def test_irrigates_the_deficit_once_depletion_passes_raw():
+    irrigation = FAO56Irrigation((4,), management_allowed_depletion=0.5, application_efficiency=0.8,
+                                 fraction_from_groundwater=0.25)
+    pet = 5.
+    raw = adjust_depletion_fraction_p(0.5, pet) * SOIL_STORAGE_MAX
+    soil_storage = SOIL_STORAGE_MAX - np.array([0., raw - 1., raw + 1., 90.])
+    applied = irrigation.calculate(180, 365, pet, soil_storage, SOIL_STORAGE_MAX)
+    np.testing.assert_allclose(applied, [0., 0., (raw + 1.) / 0.8, 90. / 0.8])
+    np.testing.assert_allclose(irrigation.irrigation_from_groundwater, applied * 0.25)
+    np.testing.assert_allclose(irrigation.irrigation_from_surface_water, applied * 0.75)
+
+
+def test_no_irrigation_out_of_season_or_outside_the_mask():
+    irrigation = FAO56Irrigation((3,), irrigation_start_doy=121, irrigation_end_doy=np.array([273., 273., 150.]),
+                                 irrigation_length=np.array([9999., 9999., 9999.]),
+                                 irrigation_mask=np.array([1., 0., 1.]))
+    soil_storage = np.full(3, 10.)
+    assert np.array_equal(irrigation.calculate(100, 365, 4., soil_storage, SOIL_STORAGE_MAX), [0., 0., 0.])
+    assert np.array_equal(irrigation.calculate(200, 365, 4., soil_storage, SOIL_STORAGE_MAX), [90., 0., 0.])
+    assert np.array_equal(irrigation.calculate(140, 365, 4., soil_storage, SOIL_STORAGE_MAX), [90., 0., 90.])
+
+
+def test_irrigation_length_shortens_the_season():
+    irrigation = FAO56Irrigation((), irrigation_start_doy=121, irrigation_end_doy=273, irrigation_length=30)
+    assert irrigation.calculate(150, 365, 4., 10., SOIL_STORAGE_MAX) == 90.
+    assert irrigation.calculate(151, 365, 4., 10., SOIL_STORAGE_MAX) == 0.
+
+
+def test_constant_amount_scheme():
+    irrigation = FAO56Irrigation((2,), application_scheme=application_scheme_code('Constant-Amount'),
+                                 application_amount=25., application_efficiency=0.5)
+    applied = irrigation.calculate(180, 365, 4., np.array([95., 20.]), SOIL_STORAGE_MAX)
+    assert np.array_equal(applied, [0., 50.])
+    with pytest.raises(ValueError, match='unknown irrigation application scheme'):
+        application_scheme_code('flood')
+
+
+def test_from_lookup_table():
+    lookup = CompiledLookupTable(pd.DataFrame({'lu_code': [1, 2],
+                                               'mad': [0.5, 0.5],
+                                               'irrigation_start': ['05/01', '01/01'],
+                                               'irrigation_end': ['09/30', '12/31'],
+                                               'application_scheme': ['field_capacity', 'none'],
+                                               'application_amount': [1., 1.]}))
+    lu_grid = np.array([1, 2, 255, 1], dtype=np.uint8)
+    irrigation = FAO56Irrigation.from_lookup_table(lookup, lu_grid, irrigation_mask=np.array([1., 1., 1., 0.]))
+    assert irrigation.irrigation_start_doy[365][0] == 121
+    assert irrigation.irrigation_start_doy[366][0] == 122
+    assert irrigation.is_irrigable.tolist() == [True, False, False, False]
+    assert irrigation.calculate(200, 365, 4., np.full(4, 10.), SOIL_STORAGE_MAX).tolist() == [90., 0., 0., 0.]
+    assert irrigation.calculate(100, 365, 4., np.full(4, 10.), SOIL_STORAGE_MAX).tolist() == [0., 0., 0., 0.]
+
+
+def test_irrigation_season_in_every_calendar():
+    lookup = CompiledLookupTable(pd.DataFrame({'lu_code': [1], 'irrigation_start': ['05/01'],
+                                               'irrigation_end': ['08/31'],
+                                               'application_scheme': ['field_capacity']}))
+    irrigation = FAO56Irrigation.from_lookup_table(lookup, np.array([1, 1], dtype=np.uint8))
+    for calendar, (start, end) in (('360_day', (121, 240)), ('noleap', (121, 243)), ('all_leap', (122, 244))):
+        measures = date_measures_for_period('2001-01-01', '2001-12-30', calendar=calendar)
+        irrigated = [irrigation.calculate(day_of_year, number_of_days_in_year, 4., np.full(2, 10.), SOIL_STORAGE_MAX)[0]
+                     > 0. for day_of_year, number_of_days_in_year in zip(measures.day_of_year,
+                                                                            measures.number_of_days_in_year)]
+        assert np.flatnonzero(irrigated).tolist() == list(range(start - 1, end)), calendar
+
+    # a season given only for 365- and 366-day years cannot be used in a 360-day year
+    irrigation = FAO56Irrigation((), irrigation_start_doy={365: 121, 366: 122}, irrigation_end_doy={365: 243, 366: 244})
+    with pytest.raises(ValueError, match='no irrigation season is defined for years of 360 days'):
+        irrigation.calculate(150, 360, 4., 10., SOIL_STORAGE_MAX)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from lookup_tables import CompiledLookupTable, data_cells, nodata_mask, read_lookup_table
+
+
+@pytest.fixture
+def lookup():
+    df = pd.DataFrame({'lu_code': [1, 5, 21],
+                       'description': ['water', 'forest', 'corn'],
+                       'cn_1': [100., 30., 67.], 'cn_2': [100., 55., 78.], 'cn_3': [100., 70., 85.],
+                       'cn_4': [100., 77., 89.],
+                       'max_net_infil_1': [0., 2., 2.],
+                       'rooting_depth': [0., 2.5, 1.2]})
+    return CompiledLookupTable(df, name='LU_lookup.txt')
+
+
+def test_gather_by_land_use_and_soil_group(lookup):
+    lu_grid = np.array([[1, 5], [21, 21]], dtype=np.uint8)
+    hsg_grid = np.array([[1, 2], [3, 4]], dtype=np.uint8)
+    assert lookup.is_soil_group_parameter('cn')
+    assert np.array_equal(lookup.gather('cn', lu_grid, hsg_grid), [[100., 55.], [85., 89.]])
+    assert np.array_equal(lookup.gather('rooting_depth', lu_grid), [[0., 2.5], [1.2, 1.2]])
+    # a single numbered column is still a (one soil group) parameter
+    assert lookup.number_of_soil_groups['max_net_infil'] == 1
+
+
+def test_missing_land_use_code(lookup):
+    with pytest.raises(ValueError, match=r'land-use codes \[7, 300\] .* missing from LU_lookup.txt'):
+        lookup.validate(np.array([1, 7, 300, 5]))
+
+
+def test_unsupported_soil_group(lookup):
+    lu_grid = np.array([1, 5, 21], dtype=np.uint8)
+    lookup.validate(lu_grid, np.array([1, 2, 4], dtype=np.uint8), parameters=['cn'])
+    with pytest.raises(ValueError, match=r"soil groups \[5\] .* no 'cn' column"):
+        lookup.validate(lu_grid, np.array([1, 5, 4], dtype=np.uint8), parameters=['cn'])
+    # soil groups are only checked for the parameters asked for
+    lookup.validate(lu_grid, np.array([1, 5, 4], dtype=np.uint8), parameters=['rooting_depth'])
+
+
+def test_nodata_cells_are_skipped(lookup):
+    lu_grid = np.array([1, 5, 255, 21], dtype=np.uint8)
+    hsg_grid = np.array([1, 255, 2, 3], dtype=np.uint8)
+    assert np.array_equal(nodata_mask(np.array([0.5, np.nan])), [False, True])
+    assert np.array_equal(nodata_mask(np.array([1, -9999]), -9999), [False, True])
+    assert np.array_equal(data_cells(lu_grid, hsg_grid), [True, False, False, True])
+
+    parameters = lookup.assign(['cn', 'rooting_depth', 'description'], lu_grid, hsg_grid)
+    assert np.array_equal(parameters['cn'], [100., np.nan, np.nan, 85.], equal_nan=True)
+    assert np.array_equal(parameters['rooting_depth'], [0., np.nan, np.nan, 1.2], equal_nan=True)
+    assert parameters['description'].tolist() == ['water', None, None, 'corn']
+
+
+def test_explicit_active_cells(lookup):
+    lu_grid = np.array([1, 7, 21])
+    hsg_grid = np.array([1, 1, 2])
+    with pytest.raises(ValueError):
+        lookup.assign(['cn'], lu_grid, hsg_grid)
+    parameters = lookup.assign(['cn'], lu_grid, hsg_grid, active=lu_grid != 7)
+    assert np.array_equal(parameters['cn'], [100., np.nan, 78.], equal_nan=True)
+
+
+def test_bad_tables():
+    with pytest.raises(ValueError, match='more than once'):
+        CompiledLookupTable(pd.DataFrame({'lu_code': [1, 1], 'cn_1': [50., 60.]}))
+    with pytest.raises(ValueError, match='non-negative integers'):
+        CompiledLookupTable(pd.DataFrame({'lu_code': [1.5], 'cn_1': [50.]}))
+    with pytest.raises(KeyError, match='no parameter'):
+        CompiledLookupTable(pd.DataFrame({'lu_code': [1], 'cn_1': [50.]})).table('rew')
+
+
+def test_gather_matches_the_minnesota_table_row_by_row():
+    filename = TEST_DATA_DIRECTORY / 'LU_lookup_MN_v3.txt'
+    lookup = CompiledLookupTable.from_file(filename)
+    df = read_lookup_table(filename).set_index('lu_code')
+    assert lookup.number_of_soil_groups == {'cn': 7, 'max_net_infil': 7, 'rz': 7}
+
+    rng = np.random.default_rng(1)
+    lu_grid = rng.choice(df.index.to_numpy(), (20, 30)).astype(np.uint8)
+    hsg_grid = rng.integers(1, 8, (20, 30)).astype(np.uint8)
+    expected = [df.at[code, f'cn_{group}'] for code, group in zip(lu_grid.ravel(), hsg_grid.ravel())]
+    assert np.array_equal(lookup.gather('cn', lu_grid, hsg_grid).ravel(), expected)
+    assert np.array_equal(lookup.gather('growing_season_interception_n', lu_grid),
+                          df['growing_season_interception_n'].to_numpy()[np.searchsorted(df.index, lu_grid)])
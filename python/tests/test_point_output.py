@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from date_measures import date_measures_for_period
+from point_output import DUMP_VARIABLE_COLUMNS, PointOutputRecorder
+from regrid import ProjectGrid
+from swb_configuration import DumpLocation, read_swb_configuration
+from swb_grid import SWBGrid
+
+PROJECT_GRID = ProjectGrid(5, 4, 0., 0., 100.)
+
+
+def test_points_match_the_grid_cells(weather):
+    (measures, tmin, tmax, tmean, precip) = weather
+    locations = [DumpLocation(column=1, row=1, id='corner'), DumpLocation(x=250., y=150., id='well 7'),
+                 DumpLocation(column=5, row=4)]
+    recorder = PointOutputRecorder(locations, PROJECT_GRID.shape, measures, project_grid=PROJECT_GRID)
+    # (x, y) = (250, 150) is in column 3, row 3 (rows count from the north)
+    assert recorder.rows.tolist() == [0, 2, 3] and recorder.columns.tolist() == [0, 2, 4]
+
+    rng = np.random.default_rng(9)
+    grid = SWBGrid(np.linspace(44., 47., 4)[:, np.newaxis] * np.ones((1, 5)), rng.uniform(50., 300., (4, 5)), 1.0)
+    grid.init_swb_grid()
+    soil_storage = np.empty((len(measures),) + PROJECT_GRID.shape)
+    for day in range(len(measures)):
+        date = (int(measures.year[day]), int(measures.month[day]), int(measures.day[day]))
+        grid.calc_grid_water_budget(*date, tmin[day], tmax[day], tmean[day], precip[day])
+        recorder.record(day, grid)
+        soil_storage[day] = grid.soil_storage
+
+    column = recorder.variables.index('soil_storage')
+    assert np.array_equal(recorder.values[1, :, column], soil_storage[:, 2, 2])
+    assert np.array_equal(recorder.values[2, :, column], soil_storage[:, 3, 4])
+    # the air temperatures are not grid state; optional stages the grid does not run are NaN
+    assert np.array_equal(recorder.values[0, :, recorder.variables.index('tmax')], tmax)
+    assert np.isnan(recorder.values[:, :, recorder.variables.index('crop_et')]).all()
+
+
+def test_csv_files(tmp_path):
+    measures = date_measures_for_period('2001-02-27', '2001-03-02', calendar='360_day')
+    locations = [DumpLocation(x=250., y=150., id='well 7'), DumpLocation(column=2, row=1)]
+    recorder = PointOutputRecorder(locations, PROJECT_GRID.shape, measures, project_grid=PROJECT_GRID,
+                                   variables=['rainfall', 'soil_storage'])
+    recorder.values[...] = np.arange(recorder.values.size).reshape(recorder.values.shape)
+    filenames = recorder.write_csv(tmp_path)
+    assert [filename.name for filename in filenames] == [
+        'SWB2_variable_values__well 7__col_3__row_3__x_250__y_150.csv',
+        'SWB2_variable_values__col_2__row_1__x_150__y_350.csv']
+
+    df = pd.read_csv(filenames[1])
+    assert df.columns.tolist() == ['date', 'year', 'month', 'day', 'rainfall', 'soil_storage']
+    assert df['date'].tolist() == ['2001-02-27', '2001-02-28', '2001-02-29', '2001-02-30', '2001-03-01',
+                                   '2001-03-02']
+    assert np.array_equal(df[['rainfall', 'soil_storage']].to_numpy(), recorder.values[1])
+
+
+def test_bad_locations():
+    measures = date_measures_for_period('2001-01-01', '2001-01-05')
+    with pytest.raises(ValueError, match='outside the 4 by 5 grid'):
+        PointOutputRecorder([DumpLocation(column=6, row=1)], (4, 5), measures)
+    with pytest.raises(ValueError, match='a project grid is needed'):
+        PointOutputRecorder([DumpLocation(x=1., y=1.)], (4, 5), measures)
+    with pytest.raises(ValueError, match='no point output is available'):
+        PointOutputRecorder([], (4, 5), measures, variables=['recharge'])
+
+
+def test_from_configuration():
+    configuration = read_swb_configuration(TEST_DATA_DIRECTORY / 'swb_control_file_minnesota_prism.ctl')
+    recorder = PointOutputRecorder.from_configuration(configuration)
+    assert recorder.values.shape == (1, 2557, len(DUMP_VARIABLE_COLUMNS))
+    assert recorder.filename(0).startswith('SWB2_variable_values__US-Ro6__col_')
+    assert recorder.filename(0).endswith('__x_232693__y_2415326.csv')
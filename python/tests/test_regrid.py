@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from regrid import ProjectGrid, RegridIndex, build_regrid_index, cached_regrid_index
+
+# a 4 x 3 project grid of 10 m cells over x 0..30, y 0..40
+PROJECT_GRID = ProjectGrid(3, 4, 0., 0., 10.)
+
+
+def weather_grid(x, y):
+    """A weather grid whose value at each cell center is 1000 * x + y, so resampled values can be checked."""
+    return 1000. * np.asarray(x)[np.newaxis, :] + np.asarray(y)[:, np.newaxis]
+
+
+def test_project_grid_cell_centers():
+    assert PROJECT_GRID.shape == (4, 3)
+    assert PROJECT_GRID.x.tolist() == [5., 15., 25.]
+    assert PROJECT_GRID.y.tolist() == [35., 25., 15., 5.]
+    (row, column) = PROJECT_GRID.cell_index([1., 29.], [39., 0.5])
+    assert row.tolist() == [0, 3] and column.tolist() == [0, 2]
+    with pytest.raises(ValueError, match='outside the project grid'):
+        PROJECT_GRID.cell_index(31., 5.)
+
+
+@pytest.mark.parametrize('x_step, y_step', [(1, 1), (-1, 1), (1, -1), (-1, -1)])
+def test_nearest_does_not_depend_on_axis_direction(x_step, y_step):
+    # 5 m weather cells, one of every two lying on a project cell center
+    (x, y) = (np.arange(0., 32., 5.)[::x_step], np.arange(0., 42., 5.)[::y_step])
+    index = build_regrid_index(PROJECT_GRID, x, y)
+    (project_x, project_y) = np.meshgrid(PROJECT_GRID.x, PROJECT_GRID.y)
+    assert np.array_equal(index.apply(weather_grid(x, y)), 1000. * project_x + project_y)
+    assert (index.weather_x_descending, index.weather_y_descending) == (x_step < 0, y_step < 0)
+
+
+def test_bilinear_interpolates_a_plane_exactly():
+    (x, y) = (np.arange(-20., 60., 20.), np.arange(60., -20., -20.))
+    index = build_regrid_index(PROJECT_GRID, x, y, method='bilinear')
+    (project_x, project_y) = np.meshgrid(PROJECT_GRID.x, PROJECT_GRID.y)
+    np.testing.assert_allclose(index.apply(weather_grid(x, y)), 1000. * project_x + project_y)
+    np.testing.assert_allclose(index.weights.sum(axis=0), 1.)
+
+
+def test_cells_outside_the_weather_grid_are_nan():
+    (x, y) = (np.array([5., 15.]), np.array([35., 25., 15., 5.]))
+    resampled = build_regrid_index(PROJECT_GRID, x, y).apply(weather_grid(x, y))
+    assert np.isnan(resampled[:, 2]).all() and np.isfinite(resampled[:, :2]).all()
+    with pytest.raises(ValueError, match=r'this index expects \(4, 2\)'):
+        build_regrid_index(PROJECT_GRID, x, y).apply(np.zeros((2, 4)))
+
+
+@pytest.mark.parametrize('method', ['nearest', 'bilinear'])
+def test_cached_index_round_trip(tmp_path, method):
+    (x, y) = (np.arange(0., 32., 5.), np.arange(40., -2., -5.))
+    index = cached_regrid_index(PROJECT_GRID, x, y, method=method, cache_directory=tmp_path)
+    (cached,) = tmp_path.glob(f'regrid_index__{method}__*.npz')
+    # saved through a temporary file that is renamed into place
+    assert not list(tmp_path.glob('*.tmp'))
+
+    loaded = cached_regrid_index(PROJECT_GRID, x, y, method=method, cache_directory=tmp_path)
+    assert isinstance(loaded, RegridIndex) and loaded.method == method
+    assert loaded.weather_shape == index.weather_shape and loaded.weather_y_descending
+    assert np.array_equal(loaded.apply(weather_grid(x, y)), index.apply(weather_grid(x, y)))
+
+    # a different weather grid gets its own cache file
+    cached_regrid_index(PROJECT_GRID, x + 1., y, method=method, cache_directory=tmp_path)
+    assert len(list(tmp_path.glob('*.npz'))) == 2
@@ -0,0 +1,72 @@
+import inspect
+
+import numpy as np
+import pytest
+
+from continuous_frozen_ground_index import ContinuousFrozenGroundIndex
+from runoff_curve_number import (CFGI_LIMITS, MM_PER_INCH, CurveNumberRunoff, InflowRingBuffer, adjust_curve_number,
+                                 calculate_cn_alternative_S_0_05, calculate_cn_arc2_to_arc3,
+                                 calculate_cn_runoff, calculate_cn_S_inches, calculate_probability_of_enhanced_runoff)
+
+
+def test_every_default_cfgi_limit_is_cfgi_limits():
+    for function, (lower, upper) in ((calculate_probability_of_enhanced_runoff, ('cfgi_ll', 'cfgi_ul')),
+                                     (adjust_curve_number, ('cfgi_ll', 'cfgi_ul')),
+                                     (CurveNumberRunoff, ('cfgi_ll', 'cfgi_ul')),
+                                     (ContinuousFrozenGroundIndex, ('lower_limit', 'upper_limit'))):
+        parameters = inspect.signature(function).parameters
+        assert (parameters[lower].default, parameters[upper].default) == CFGI_LIMITS, function.__name__
+
+
+def test_probability_of_enhanced_runoff():
+    (lower, upper) = CFGI_LIMITS
+    assert calculate_probability_of_enhanced_runoff(lower) == 0.
+    assert calculate_probability_of_enhanced_runoff(upper + 10.) == 1.
+    assert calculate_probability_of_enhanced_runoff((lower + upper) / 2.) == pytest.approx(0.5)
+
+
+def test_frozen_ground_blends_toward_arc3():
+    (lower, upper) = CFGI_LIMITS
+    curve_number = np.array([60., 60., 60.])
+    adjusted = adjust_curve_number(curve_number, 1.0, cfgi=np.array([0., (lower + upper) / 2., upper]))
+    arc3 = calculate_cn_arc2_to_arc3(60.)
+    np.testing.assert_allclose(adjusted, [60., (60. + arc3) / 2., arc3])
+
+
+def test_runoff_equation():
+    # Ia = 0.2: 3 inches on a curve number 80 cell (S = 2.5 inches) gives (3 - 0.5)^2 / (3 + 2) = 1.25 inches
+    assert calculate_cn_S_inches(80.) == pytest.approx(2.5)
+    assert calculate_cn_runoff(3., 2.5, 0.2) == pytest.approx(1.25)
+    assert calculate_cn_runoff(0.4, 2.5, 0.2) == 0.
+    # no curve number, no runoff
+    assert calculate_cn_runoff(np.array([3., 3.]), np.array([2.5, np.nan]), 0.2).tolist() == [1.25, 0.]
+
+
+def test_inflow_ring_buffer_keeps_the_last_days():
+    window = InflowRingBuffer((2,), number_of_days=3)
+    for day in range(1, 6):
+        window.push(np.array([day, 10. * day]))
+    assert window.total.tolist() == [12., 120.]
+    window.reset(1.)
+    assert window.total.tolist() == [3., 3.]
+
+
+def test_curve_number_runoff_follows_the_antecedent_condition():
+    runoff = CurveNumberRunoff(np.array([75., 75.]))
+    storage_S = MM_PER_INCH * calculate_cn_alternative_S_0_05(calculate_cn_S_inches(np.array([75., 75.])))
+    # no antecedent inflow: dry (ARC I), so less runoff than ARC II
+    dry = runoff.calculate(np.array([50., 50.]))
+    assert np.all(dry < calculate_cn_runoff(50., storage_S, 0.05))
+    for _ in range(4):
+        runoff.calculate(np.array([20., 0.]))
+    # over the last five days, 130 mm (5.1 inches) is wet; 50 mm (2.0 inches) is average in the growing season
+    runoff_arc2 = calculate_cn_runoff(50., storage_S[0], 0.05)
+    wet = runoff.calculate(np.array([50., 50.]), is_growing_season=True)
+    assert wet[0] > runoff_arc2
+    assert wet[1] == pytest.approx(runoff_arc2)
+
+
+def test_frozen_ground_increases_runoff():
+    runoff = CurveNumberRunoff(np.array([70., 70.]))
+    frozen = runoff.calculate(np.array([30., 30.]), cfgi=np.array([0., CFGI_LIMITS[1]]))
+    assert frozen[1] > frozen[0]
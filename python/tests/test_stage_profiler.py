@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+from stage_profiler import NULL_PROFILER, NullProfiler, StageProfiler
+from swb_grid import SWBGrid
+
+
+def test_laps_and_stages_accumulate():
+    profiler = StageProfiler()
+    for _ in range(3):
+        profiler.start()
+        profiler.lap('reference_et', 'pet', 10)
+        profiler.lap('snowmelt', 'snow', 10)
+        profiler.lap('partition_precip', 'snow', 10)
+    with profiler.stage('record_output', 'output', 4):
+        pass
+    results = profiler.to_dict()
+    assert list(results) == ['reference_et', 'snowmelt', 'partition_precip', 'record_output']
+    assert results['reference_et']['calls'] == 3 and results['reference_et']['cells'] == 30
+    assert results['record_output']['module'] == 'output' and results['record_output']['cells'] == 4
+    assert results['snowmelt']['seconds_per_call'] == pytest.approx(results['snowmelt']['seconds'] / 3)
+    # trace events are kept only when asked for
+    assert profiler.trace_events == []
+    with pytest.raises(ValueError, match='trace=True'):
+        profiler.write_chrome_trace('unused.json')
+
+
+def test_stage_is_timed_when_the_block_raises():
+    profiler = StageProfiler()
+    with pytest.raises(RuntimeError):
+        with profiler.stage('record_output', 'output'):
+            raise RuntimeError
+    assert profiler.to_dict()['record_output']['calls'] == 1
+
+
+def test_dataframes_by_stage_and_module():
+    profiler = StageProfiler()
+    profiler.stages = {'snowmelt': ['snow', 2, 3_000, 20], 'partition_precip': ['snow', 2, 1_000, 20],
+                       'reference_et': ['pet', 2, 6_000, 0]}
+    by_stage = profiler.to_dataframe()
+    assert by_stage.index.tolist() == ['reference_et', 'snowmelt', 'partition_precip']
+    assert by_stage['fraction_of_time'].tolist() == pytest.approx([0.6, 0.3, 0.1])
+    assert np.isnan(by_stage.loc['reference_et', 'ns_per_cell'])
+    by_module = profiler.to_dataframe(by='module')
+    assert by_module.index.tolist() == ['pet', 'snow']
+    assert by_module.loc['snow', 'calls'] == 4 and by_module.loc['snow', 'ns_per_cell'] == pytest.approx(100.)
+    with pytest.raises(ValueError, match="by must be 'stage' or 'module'"):
+        profiler.to_dataframe(by='cell')
+
+
+def test_chrome_trace(tmp_path):
+    profiler = StageProfiler(trace=True, max_trace_events=3)
+    profiler.start()
+    for stage in ('weather_inputs', 'reference_et', 'runoff', 'soil_storage'):
+        profiler.lap(stage, 'module', 5)
+    # the fourth call is counted but not traced
+    assert len(profiler.trace_events) == 3 and profiler.to_dict()['soil_storage']['calls'] == 1
+    filename = tmp_path / 'trace.json'
+    profiler.write_chrome_trace(filename)
+    events = json.loads(filename.read_text())['traceEvents']
+    assert [event['name'] for event in events] == ['weather_inputs', 'reference_et', 'runoff']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0. and event['args'] == {'cells': 5} for event in events)
+    assert events[0]['ts'] <= events[1]['ts'] <= events[2]['ts']
+
+    profiler.reset()
+    assert profiler.stages == {} and profiler.trace_events == []
+
+
+def test_grid_marks_every_stage(weather, cells):
+    (measures, tmin, tmax, tmean, precip) = weather
+    (latitude, awc, rooting_depth) = cells
+    profiler = StageProfiler()
+    grid = SWBGrid(latitude, awc, rooting_depth, profiler=profiler)
+    grid.init_swb_grid()
+    for day in range(30):
+        date = (int(measures.year[day]), int(measures.month[day]), int(measures.day[day]))
+        grid.calc_grid_water_budget(*date, tmin[day], tmax[day], tmean[day], precip[day])
+    results = profiler.to_dict()
+    for stage in ('weather_inputs', 'reference_et', 'partition_precip', 'snowmelt', 'runoff', 'irrigation',
+                  'growing_degree_days', 'actual_et', 'soil_storage', 'net_infiltration'):
+        assert results[stage]['calls'] == 30 and results[stage]['cells'] == 30 * len(latitude)
+    assert results['actual_et']['module'] == 'actual_et/tm_exp'
+    # engines without a profiler use the shared null profiler
+    assert isinstance(SWBGrid(latitude, awc, rooting_depth).profiler, NullProfiler)
+    assert SWBGrid(latitude, awc, rooting_depth).profiler is NULL_PROFILER
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from control_file import get_argument, get_text, has_keyword, read_control_file
+from swb_configuration import read_swb_configuration
+
+MINNESOTA_PRISM = TEST_DATA_DIRECTORY / 'swb_control_file_minnesota_prism.ctl'
+GRIDMET = TEST_DATA_DIRECTORY / 'swb_control_file_gridmet.ctl'
+
+
+def test_read_control_file():
+    directives = read_control_file(MINNESOTA_PRISM)
+    assert directives['GRID'] == [['77', '86', '-125045.0', '2246285.0', '8000.0']]
+    # comment lines ('#', '-') are skipped; repeated keywords keep every occurrence
+    assert not any(keyword.startswith(('#', '-')) for keyword in directives)
+    assert len(directives['OUTPUT']) == 4
+    assert get_argument(directives, 'soil_moisture_method') == 'THORNTHWAITE-MATHER'
+    assert get_argument(directives, 'GROWING_SEASON', index=2) == 'TRUE'
+    assert get_argument(directives, 'FOG_METHOD', index=1, default='none') == 'none'
+    assert get_text(directives, 'BASE_PROJECTION_DEFINITION').startswith('+proj=aea +lat_1=29.5')
+    assert has_keyword(directives, 'dump_variables') and not has_keyword(directives, 'PRECIPITATION')
+
+
+def test_minnesota_prism_configuration():
+    configuration = read_swb_configuration(MINNESOTA_PRISM)
+    assert configuration.grid.shape == (86, 77) and configuration.grid.cellsize == 8000.
+    assert configuration.method('soil_moisture') == 'THORNTHWAITE_MATHER'
+    assert configuration.calculation_method == 'tm_curves'
+    assert configuration.method('GROWING_DEGREE_DAY') == 'MODIFIED_GROWING_DEGREE_DAY'
+    assert configuration.method('DIRECT_RECHARGE') == 'NONE'
+    assert (configuration.lower_limit_cfgi, configuration.upper_limit_cfgi) == (55., 83.)
+    assert configuration.growing_season == ('133', '268', True)
+    assert (configuration.start_date, configuration.end_date) == (pd.Timestamp('1999-01-01'),
+                                                                  pd.Timestamp('2005-12-31'))
+    assert len(configuration.date_measures()) == 2557
+
+    initial_cfgi = configuration.inputs['INITIAL_CONTINUOUS_FROZEN_GROUND_INDEX']
+    assert initial_cfgi.is_constant and initial_cfgi.load() == 100.
+    assert np.array_equal(initial_cfgi.load((2, 3)), np.full((2, 3), 100.))
+    land_use = configuration.inputs['LAND_USE']
+    assert land_use.source_type == 'ARC_GRID' and not land_use.is_loaded
+    assert land_use.filename == TEST_DATA_DIRECTORY / 'NLCD1992__1000m.asc'
+    assert land_use.projection_definition.startswith('+proj=aea')
+
+    assert configuration.required_inputs() == ['INITIAL_PERCENT_SOIL_MOISTURE', 'INITIAL_SNOW_COVER_STORAGE',
+                                               'LAND_USE', 'HYDROLOGIC_SOILS_GROUP',
+                                               'INITIAL_CONTINUOUS_FROZEN_GROUND_INDEX',
+                                               'AVAILABLE_WATER_CONTENT']
+
+    assert configuration.output.is_enabled('snowmelt') and configuration.output.is_enabled('RUNOFF_OUTSIDE')
+    assert not configuration.output.is_enabled('soil_storage')
+    # outputs the control file does not mention are enabled, as in SWB2
+    assert configuration.output.is_enabled('rainfall')
+
+    (location,) = configuration.dump_variables
+    assert location.by_coordinates and (location.x, location.y, location.id) == (232693., 2415326., 'US-Ro6')
+
+    lookup = configuration.compiled_lookup_table('land_use')
+    assert configuration.compiled_lookup_table('LAND_USE') is lookup
+    assert 'cn' in lookup.parameters and 21 in lookup.codes
+
+
+def test_gridmet_configuration():
+    configuration = read_swb_configuration(GRIDMET, weather_data_directory='weather')
+    assert configuration.calculation_method == 'fao56_two_stage'
+    assert configuration.method('IRRIGATION') == 'FAO56'
+    precipitation = configuration.inputs['PRECIPITATION']
+    assert precipitation.source_type == 'NETCDF'
+    assert str(precipitation.filename) == 'weather/gridmet_pr_2000_mn__14-day.nc'
+    assert precipitation.projection_definition == '+proj=lonlat +ellps=WGS84 +datum=WGS84 +no_defs'
+    assert configuration.parameters['PRECIPITATION_NETCDF_Z_VAR'] == ['precipitation_amount']
+    assert 'TMAX_UNITS_KELVIN' in configuration.parameters
+    assert {'PRECIPITATION', 'TMIN', 'TMAX', 'IRRIGATION_MASK'} <= set(configuration.required_inputs())
+    with pytest.raises(ValueError, match='NETCDF weather input'):
+        precipitation.load()
+
+
+def test_dump_locations_and_unsupported_methods(tmp_path):
+    control_file = tmp_path / 'run.ctl'
+    control_file.write_text('SOIL_MOISTURE_METHOD FAO-56 # trailing comment\n'
+                            'DUMP_VARIABLES 12 34\n'
+                            'DUMP_VARIABLES COORDINATES 1.5 2.5 ID Station 7\n'
+                            'OUTPUT_DISABLE rainfall\n')
+    configuration = read_swb_configuration(control_file)
+    assert configuration.grid is None
+    assert [(location.column, location.row, location.id) for location in configuration.dump_variables[:1]] == \
+        [(12, 34, None)]
+    assert configuration.dump_variables[1].id == 'Station 7'
+    assert configuration.output.disabled == ['rainfall']
+    with pytest.raises(ValueError, match='SOIL_MOISTURE_METHOD FAO_56 is not supported'):
+        configuration.calculation_method
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from actual_et_fao56_two_stage import FAO56TwoStage
+from actual_et_thornthwaite_mather import calc_actual_et, calc_actual_et_grid
+from actual_et_thornthwaite_mather__tables import calc_actual_et__tm_eqns, calc_actual_et__tm_eqns_grid
+from partition_daily_precipitation import partition_daily_precip, partition_daily_precip_grid
+from potential_snowmelt import calculate_potential_snowmelt, calculate_potential_snowmelt_grid
+from runoff_curve_number import CurveNumberRunoff
+from swb_cell import SWBCell
+from swb_grid import SWBGrid
+
+COMPARED_VARIABLES = ('rainfall', 'snowfall', 'snowmelt', 'snow_storage', 'pet', 'runoff', 'aet', 'soil_storage',
+                      'net_infiltration', 'gdd')
+
+
+def run_grid_and_cells(weather, cells, calculation_method, **options):
+    (measures, tmin, tmax, tmean, precip) = weather
+    (latitude, awc, rooting_depth) = cells
+    grid_options = {name: make(len(latitude)) for name, make in options.items()}
+    grid = SWBGrid(latitude, awc, rooting_depth, calculation_method, **grid_options)
+    grid.init_swb_grid()
+    swb_cells = []
+    for index in range(len(latitude)):
+        cell = SWBCell(latitude[index], awc[index], rooting_depth[index], calculation_method,
+                       **{name: make(None, index) for name, make in options.items()})
+        cell.init_swb_cell()
+        swb_cells.append(cell)
+
+    largest_difference = 0.
+    for day in range(len(measures)):
+        date = (int(measures.year[day]), int(measures.month[day]), int(measures.day[day]))
+        grid.calc_grid_water_budget(*date, tmin[day], tmax[day], tmean[day], precip[day])
+        for index, cell in enumerate(swb_cells):
+            cell.calc_cell_water_budget(*date, tmin[day], tmax[day], tmean[day], precip[day])
+            for name in COMPARED_VARIABLES:
+                largest_difference = max(largest_difference, abs(getattr(grid, name)[index] - getattr(cell, name)))
+    return largest_difference
+
+
+def test_grid_helpers_match_scalar_helpers():
+    rng = np.random.default_rng(11)
+    (tmean, spread, precip) = (rng.normal(0., 6., 200), rng.uniform(2., 15., 200), rng.gamma(0.8, 6., 200))
+    (tmin, tmax) = (tmean - spread / 2., tmean + spread / 2.)
+    (pet, soil_storage) = (rng.uniform(0., 6., 200), rng.uniform(1., 300., 200))
+
+    grid = np.stack(partition_daily_precip_grid(precip, tmin, tmax, tmean))
+    cells = np.array([partition_daily_precip(*values) for values in zip(precip, tmin, tmax, tmean)]).T
+    assert np.array_equal(grid, cells)
+
+    grid = calculate_potential_snowmelt_grid(tmean, tmax)
+    assert np.array_equal(grid, [calculate_potential_snowmelt(*values) for values in zip(tmean, tmax)])
+
+    grid = np.stack(calc_actual_et_grid(precip, 0., pet, soil_storage, 300.))
+    cells = np.array([calc_actual_et(p, 0., e, s, 300.) for p, e, s in zip(precip, pet, soil_storage)]).T
+    assert np.array_equal(grid, cells)
+
+    grid = np.stack(calc_actual_et__tm_eqns_grid(precip, 0., pet, 0., soil_storage))
+    cells = np.array([calc_actual_et__tm_eqns(p, 0., e, 0., s) for p, e, s in zip(precip, pet, soil_storage)]).T
+    np.testing.assert_allclose(grid, cells, rtol=0., atol=1e-10)
+
+
+@pytest.mark.parametrize('calculation_method, tolerance', [('tm_exp', 0.), ('tm_eqns', 1e-10)])
+def test_grid_matches_cells(weather, cells, calculation_method, tolerance):
+    assert run_grid_and_cells(weather, cells, calculation_method) <= tolerance
+
+
+@pytest.mark.parametrize('calculation_method', ['tm_table', 'tm_curves'])
+def test_grid_matches_cells_with_tm_tables(weather, cells, tm_df, calculation_method):
+    def table(shape, index=None):
+        return tm_df
+
+    assert run_grid_and_cells(weather, cells, calculation_method, thornthwaite_mather_df=table) <= 1e-10
+
+
+def test_grid_matches_cells_with_runoff_and_fao56(weather, cells):
+    curve_numbers = np.array([60., 75., 85., 98.])
+    kcb = np.array([0.3, 0.8, 1.0, 1.15])
+
+    def runoff(shape, index=None):
+        return CurveNumberRunoff(curve_numbers if index is None else curve_numbers[index])
+
+    def fao56(shape, index=None):
+        return FAO56TwoStage((shape,), kcb=kcb) if index is None else FAO56TwoStage((), kcb=kcb[index])
+
+    assert run_grid_and_cells(weather, cells, 'fao56_two_stage', runoff=runoff, fao56_two_stage=fao56) <= 1e-10
+
+
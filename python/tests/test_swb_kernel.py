@@ -0,0 +1,70 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import swb_kernel
+from swb_cell import SWBCell
+from swb_kernel import HAVE_NUMBA, run_water_budget
+
+requires_numba = pytest.mark.skipif(not HAVE_NUMBA, reason='numba is not installed')
+
+
+def weather_columns(weather, number_of_cells):
+    (measures, tmin, tmax, tmean, precip) = weather
+    return [np.repeat(values[:, np.newaxis], number_of_cells, axis=1) for values in (tmin, tmax, tmean, precip)]
+
+
+@requires_numba
+@pytest.mark.parametrize('method', ['tm_exp', 'tm_eqns'])
+def test_numba_kernel_matches_python_backend(weather, cells, method):
+    (latitude, awc, rooting_depth) = cells
+    columns = weather_columns(weather, len(latitude))
+    compiled = run_water_budget(weather[0], *columns, latitude, awc * rooting_depth, method=method, backend='numba')
+    python = run_water_budget(weather[0], *columns, latitude, awc * rooting_depth, method=method, backend='python')
+    for name in compiled:
+        np.testing.assert_allclose(compiled[name], python[name], rtol=0., atol=1e-10, err_msg=name)
+
+
+@requires_numba
+@pytest.mark.parametrize('method', ['tm_exp', 'tm_eqns'])
+def test_numba_kernel_matches_cells(weather, cells, method):
+    (measures, tmin, tmax, tmean, precip) = weather
+    (latitude, awc, rooting_depth) = cells
+    compiled = run_water_budget(measures, *weather_columns(weather, len(latitude)), latitude, awc * rooting_depth,
+                                method=method, backend='numba')
+    for index in range(len(latitude)):
+        cell = SWBCell(latitude[index], awc[index], rooting_depth[index], method)
+        cell.init_swb_cell()
+        for day in range(len(measures)):
+            cell.calc_cell_water_budget(int(measures.year[day]), int(measures.month[day]), int(measures.day[day]),
+                                        tmin[day], tmax[day], tmean[day], precip[day])
+            for name in ('snow_storage', 'pet', 'aet', 'soil_storage', 'net_infiltration', 'gdd'):
+                assert compiled[name][day, index] == pytest.approx(getattr(cell, name), rel=0., abs=1e-10)
+
+
+def test_methods_outside_the_kernel_run_on_swbgrid_with_a_warning(weather, cells, tm_df):
+    (latitude, awc, rooting_depth) = cells
+    columns = weather_columns(weather, len(latitude))
+    with pytest.warns(RuntimeWarning, match="does not implement 'tm_curves'" if HAVE_NUMBA else 'numba is not'):
+        curves = run_water_budget(weather[0], *columns, latitude, awc * rooting_depth, method='tm_curves',
+                                  thornthwaite_mather_df=tm_df)
+    python = run_water_budget(weather[0], *columns, latitude, awc * rooting_depth, method='tm_curves',
+                              backend='python', thornthwaite_mather_df=tm_df)
+    assert np.array_equal(curves['aet'], python['aet'])
+    if HAVE_NUMBA:
+        with pytest.raises(ValueError, match="use backend='python'"):
+            run_water_budget(weather[0], *columns, latitude, awc * rooting_depth, method='tm_table',
+                             backend='numba', thornthwaite_mather_df=tm_df)
+    with pytest.raises(ValueError, match='method must be one of'):
+        run_water_budget(weather[0], *columns, latitude, awc * rooting_depth, method='fao56_two_stage')
+
+
+def test_auto_backend_warns_without_numba(weather, monkeypatch):
+    (measures, tmin, tmax, tmean, precip) = weather
+    monkeypatch.setattr(swb_kernel, 'HAVE_NUMBA', False)
+    with pytest.warns(RuntimeWarning, match='numba is not installed'):
+        run_water_budget(measures, tmin, tmax, tmean, precip, 45., 150.)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        run_water_budget(measures, tmin, tmax, tmean, precip, 45., 150., backend='python')
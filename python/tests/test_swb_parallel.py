@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from actual_et_fao56_two_stage import FAO56TwoStage
+from conftest import TEST_DATA_DIRECTORY
+from continuous_frozen_ground_index import ContinuousFrozenGroundIndex
+from crop_coefficient_curves import KcbCurves
+from growing_season import GrowingSeason
+from irrigation_fao56 import FAO56Irrigation
+from lookup_tables import CompiledLookupTable, read_lookup_table
+from runoff_curve_number import CurveNumberRunoff
+from swb_grid import SWBGrid
+from swb_parallel import SHARDED_OUTPUT_VARIABLES, run_sharded
+
+SHAPE = (7, 5)
+
+
+@pytest.fixture(scope='module')
+def gridded_weather(weather):
+    (measures, tmin, tmax, tmean, precip) = weather
+    shape = (len(measures),) + SHAPE
+    rng = np.random.default_rng(7)
+    noise = rng.normal(0., 2., shape)
+    (tmin, tmax, tmean) = [values[:, np.newaxis, np.newaxis] + noise for values in (tmin, tmax, tmean)]
+    precip = precip[:, np.newaxis, np.newaxis] * rng.uniform(0.5, 1.5, shape)
+    latitude = np.linspace(43., 49., SHAPE[0])[:, np.newaxis] * np.ones((1, SHAPE[1]))
+    awc = rng.uniform(50., 300., SHAPE)
+    return measures, tmin, tmax, tmean, precip, latitude, awc
+
+
+def test_sharded_results_do_not_depend_on_worker_count(gridded_weather):
+    in_process = run_sharded(*gridded_weather, 1.0, number_of_workers=0, rows_per_block=2)
+    pooled = run_sharded(*gridded_weather, 1.0, number_of_workers=3, rows_per_block=2)
+    assert set(in_process) == set(pooled)
+    for name in in_process:
+        np.testing.assert_array_equal(in_process[name], pooled[name], err_msg=name)
+
+
+def make_stages():
+    """Runoff, CFGI, FAO-56, Kcb-curve and irrigation stages for SHAPE, from the Minnesota lookup tables."""
+    land_use = CompiledLookupTable.from_file(TEST_DATA_DIRECTORY / 'LU_lookup_MN_v3.txt')
+    # the Minnesota table irrigates nothing; irrigate the cultivated crops (82) to field capacity
+    df = read_lookup_table(TEST_DATA_DIRECTORY / 'IRR_lookup_MN_v3.txt')
+    df.loc[df['lu_code'] == 82, 'application_scheme'] = 'field_capacity'
+    irrigation_table = CompiledLookupTable(df, name='IRR_lookup_MN_v3.txt')
+    rng = np.random.default_rng(5)
+    lu_grid = rng.choice([21, 41, 71, 81, 82], SHAPE)
+    hsg_grid = rng.integers(1, 5, SHAPE)
+    return {'runoff': CurveNumberRunoff(land_use.gather('cn', lu_grid, hsg_grid)),
+            'frozen_ground_index': ContinuousFrozenGroundIndex(SHAPE),
+            'fao56_two_stage': FAO56TwoStage.from_lookup_table(irrigation_table, lu_grid, hsg_grid),
+            'crop_coefficients': KcbCurves(irrigation_table).for_grid(lu_grid),
+            'irrigation': FAO56Irrigation.from_lookup_table(irrigation_table, lu_grid)}
+
+
+def test_sharded_stages_match_a_serial_grid(gridded_weather):
+    (measures, tmin, tmax, tmean, precip, latitude, awc) = gridded_weather
+    growing_season = GrowingSeason(133, 268)
+    variables = SHARDED_OUTPUT_VARIABLES + ['runoff', 'irrigation']
+
+    grid = SWBGrid(latitude, awc, 1.0, 'fao56_two_stage', growing_season=growing_season, **make_stages())
+    grid.init_swb_grid()
+    serial = {name: np.empty((len(measures),) + SHAPE) for name in variables}
+    for day in range(len(measures)):
+        grid.set_date_measures(float(measures.day_of_year[day]), float(measures.number_of_days_in_year[day]))
+        grid.calc_daily_water_budget(tmin[day], tmax[day], tmean[day], precip[day],
+                                     reset_gdd=bool(measures.is_jan_1[day]))
+        for name in variables:
+            serial[name][day] = getattr(grid, name)
+    assert serial['runoff'].sum() > 0. and serial['irrigation'].sum() > 0.
+
+    stages = make_stages()
+    for number_of_workers in (0, 2):
+        sharded = run_sharded(measures, tmin, tmax, tmean, precip, latitude, awc, 1.0, 'fao56_two_stage',
+                              variables=variables, number_of_workers=number_of_workers, rows_per_block=3,
+                              growing_season=growing_season, **stages)
+        for name in variables:
+            np.testing.assert_array_equal(sharded[name], serial[name], err_msg=name)
+    # the stages passed in are copied into the blocks, not advanced
+    assert np.all(stages['frozen_ground_index'].cfgi == 0.)
+
+
+def test_stage_shapes_must_match_the_grid(gridded_weather):
+    with pytest.raises(ValueError, match=r'runoff has shape \(7, 4\)'):
+        run_sharded(*gridded_weather, 1.0, number_of_workers=0, runoff=CurveNumberRunoff(np.full((7, 4), 70.)))
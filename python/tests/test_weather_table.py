@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import TEST_DATA_DIRECTORY
+from weather_table import cached_weather_table, read_weather_table_text
+
+TABLE = """date        prcp    tmax    tmin
+2001-01-01  0.10    41.0    23.0
+2001-01-02  0.00    50.0    32.0
+2001-01-03  1.00    59.0    41.0
+2001-01-05  0.50    68.0    50.0
+"""
+
+
+def write_table(path, text=TABLE):
+    path.write_text(text)
+    return path
+
+
+def test_read_converts_to_mm_and_celsius(tmp_path):
+    table = read_weather_table_text(write_table(tmp_path / 'station.txt'))
+    np.testing.assert_allclose(table.precip_mm, [2.54, 0., 25.4, 12.7])
+    np.testing.assert_allclose(table.tmin_c, [-5., 0., 5., 10.])
+    np.testing.assert_allclose(table.tmean_c, [0., 5., 10., 15.])
+    celsius = read_weather_table_text(tmp_path / 'station.txt', precip_mm_per_unit=1., temperature_units='celsius')
+    assert celsius.tmax_c.tolist() == [41., 50., 59., 68.] and celsius.precip_mm[0] == 0.1
+
+
+def test_bad_tables(tmp_path):
+    with pytest.raises(ValueError, match='no tmin column'):
+        read_weather_table_text(write_table(tmp_path / 'a.txt', TABLE.replace('tmin', 'low')))
+    with pytest.raises(ValueError, match='increasing order'):
+        read_weather_table_text(write_table(tmp_path / 'b.txt', TABLE.replace('2001-01-05', '2001-01-02')))
+    with pytest.raises(ValueError, match='temperature_units'):
+        read_weather_table_text(tmp_path / 'b.txt', temperature_units='kelvin')
+
+
+def test_select_and_windows(tmp_path):
+    table = read_weather_table_text(write_table(tmp_path / 'station.txt'))
+    selected = table.select('2001-01-02', '2001-01-04')
+    assert selected.dates.astype(str).tolist() == ['2001-01-02', '2001-01-03']
+    assert np.shares_memory(selected.precip_mm, table.precip_mm)
+    assert [len(window) for window in table.windows(3)] == [3, 1]
+    with pytest.raises(ValueError, match='at least one day'):
+        next(table.windows(0))
+    df = table.to_dataframe()
+    assert df.columns.tolist() == ['date', 'gross_precip', 'tmin', 'tmax', 'tmean']
+
+
+def test_cache_matches_the_text_and_is_reused(tmp_path):
+    filename = write_table(tmp_path / 'station.txt')
+    table = cached_weather_table(filename)
+    (npy_path,) = tmp_path.glob('station.txt.*.npy')
+    assert isinstance(table.precip_mm, np.memmap)
+    text = read_weather_table_text(filename)
+    assert np.array_equal(table.dates, text.dates) and np.array_equal(table.tmax_c, text.tmax_c)
+
+    # a second open memory-maps the same file; a touched but unchanged table keeps its hash
+    modified = npy_path.stat().st_mtime_ns
+    os.utime(filename, ns=(0, 0))
+    cached_weather_table(filename)
+    assert list(tmp_path.glob('*.npy')) == [npy_path] and npy_path.stat().st_mtime_ns == modified
+
+
+def test_superseded_cache_is_deleted(tmp_path):
+    filename = write_table(tmp_path / 'station.txt')
+    cache_directory = tmp_path / 'cache'
+    cached_weather_table(filename, cache_directory=cache_directory)
+    (first,) = cache_directory.glob('*.npy')
+
+    write_table(filename, TABLE.replace('0.50', '0.75'))
+    table = cached_weather_table(filename, cache_directory=cache_directory)
+    (second,) = cache_directory.glob('*.npy')
+    assert second != first and table.precip_mm[-1] == pytest.approx(19.05)
+    metadata = json.loads((cache_directory / 'station.txt.weather.json').read_text())
+    assert metadata['cache'] == second.name
+
+    # so is the cache of another unit conversion
+    cached_weather_table(filename, precip_mm_per_unit=1., cache_directory=cache_directory)
+    assert len(list(cache_directory.glob('*.npy'))) == 1 and not second.exists()
+    assert not list(tmp_path.glob('*.npy'))
+
+
+def test_station_tables(tmp_path):
+    kenai = cached_weather_table(
+        TEST_DATA_DIRECTORY / 'daily_weather_data__Kenai_Apt_thru_2014_w_Soldotna_thru_2023_corrected_date.txt',
+        cache_directory=tmp_path)
+    assert str(kenai.dates[0]) == '1944-01-01' and len(kenai) == 29129
+    # the PRISM table has padded column names, in a different order
+    prism = read_weather_table_text(
+        TEST_DATA_DIRECTORY / 'Minnesota_PRISM_daily_weather__US-Ro6__col_358__row_519__x_232693__y_2415326.tsv')
+    assert prism.tmax_c[0] == pytest.approx((10.0291996002 - 32.) / 1.8)
+    assert prism.tmin_c[0] == pytest.approx((-3.64180111885 - 32.) / 1.8)
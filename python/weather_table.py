@@ -0,0 +1,222 @@
+"""
+Tabular daily weather (PRECIPITATION_METHOD TABULAR, WEATHER_DATA_LOOKUP_TABLE).
+
+Station weather tables are whitespace-delimited text with a date column and precipitation, maximum and minimum
+air temperature columns, in any order, e.g.
+
+    date        prcp    tmin    tmax            (Kenai Airport)
+    date        prcp     tmax    tmin           (PRISM cell; note the padded column names)
+
+SWB2 reads them in inches and degrees Fahrenheit. Parsing the text is slow compared with a model run, so tables
+are normally opened with cached_weather_table, which parses a table once, converts it to mm and degrees Celsius
+and saves it as a binary .npy file beside the table (or in cache_directory). The file is named by a hash of
+the table's contents and the unit conversion, so edited tables are parsed again, and later runs memory-map it
+instead of parsing. The contents are hashed only when the table's size or modification time differs from
+those recorded, with the hash, in <name>.weather.json. The JSON also names the current cache file, and the
+superseded cache is deleted when a new one is written:
+
+    table = cached_weather_table('daily_weather_data__Kenai_Apt_thru_2014_w_Soldotna_thru_2023_corrected_date.txt')
+    df = table.select('1980-01-01', '1989-12-31').to_dataframe()    # for run_timeseries
+    for window in table.windows(365):
+        ...
+"""
+
+import hashlib
+import json
+import os
+import pathlib as pl
+
+import numpy as np
+import pandas as pd
+
+from date_measures import date_measures_from_dates
+
+
+# column names accepted for each quantity (compared in lower case, with surrounding blanks removed)
+WEATHER_TABLE_COLUMN_NAMES = {
+    'date':     ('date',),
+    'prcp':     ('prcp', 'precip', 'precipitation', 'gross_precip', 'ppt'),
+    'tmax':     ('tmax', 'tmax_f', 'tmax_c'),
+    'tmin':     ('tmin', 'tmin_f', 'tmin_c'),
+}
+
+TEMPERATURE_UNITS = ('fahrenheit', 'celsius')
+
+# rows of the cached array: days since 1970-01-01, then the converted weather columns
+CACHE_ROWS = ('day_number', 'precip_mm', 'tmin_c', 'tmax_c')
+
+
+class WeatherTable:
+    """
+    Daily weather of one station, as contiguous float64 columns in mm and degrees Celsius.
+
+    dates       datetime64[D] array of the dates (consecutive or not).
+    precip_mm   Gross precipitation (mm).
+    tmin_c      Minimum and maximum daily air temperature (degrees Celsius).
+    tmax_c
+    """
+
+    def __init__(self, dates, precip_mm, tmin_c, tmax_c):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.precip_mm = precip_mm
+        self.tmin_c = tmin_c
+        self.tmax_c = tmax_c
+
+    def __len__(self):
+        return self.dates.size
+
+    @property
+    def tmean_c(self):
+        return (self.tmin_c + self.tmax_c) / 2.
+
+    @property
+    def date_measures(self):
+        return date_measures_from_dates(self.dates)
+
+    def _slice(self, start, stop):
+        return WeatherTable(self.dates[start:stop], self.precip_mm[start:stop], self.tmin_c[start:stop],
+                            self.tmax_c[start:stop])
+
+    def select(self, start_date=None, end_date=None):
+        """Rows from start_date through end_date, inclusive, as a WeatherTable of views (no copy)."""
+        start = 0 if start_date is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date), 'D'))
+        stop = len(self) if end_date is None else \
+            np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end_date), 'D'), side='right')
+        return self._slice(start, stop)
+
+    def windows(self, number_of_days, start_date=None, end_date=None):
+        """Yield successive WeatherTables of number_of_days rows (the last may be shorter), without copying."""
+        if number_of_days < 1:
+            raise ValueError(f"windows must hold at least one day, not {number_of_days}")
+        table = self.select(start_date, end_date)
+        for start in range(0, len(table), number_of_days):
+            yield table._slice(start, start + number_of_days)
+
+    def to_dataframe(self):
+        """Dataframe with date, gross_precip, tmin, tmax and tmean columns, the defaults of run_timeseries."""
+        return pd.DataFrame({'date': self.dates.astype('datetime64[ns]'), 'gross_precip': self.precip_mm,
+                             'tmin': self.tmin_c, 'tmax': self.tmax_c, 'tmean': self.tmean_c})
+
+
+def _find_columns(columns, filename):
+    normalized = [str(column).strip().lower() for column in columns]
+    found = {}
+    for quantity, names in WEATHER_TABLE_COLUMN_NAMES.items():
+        matches = [column for column, name in zip(columns, normalized) if name in names]
+        if not matches:
+            raise ValueError(f"{filename}: no {quantity} column (expected one of {names}); found {list(columns)}")
+        found[quantity] = matches[0]
+    return found
+
+
+def read_weather_table_text(filename, precip_mm_per_unit=25.4, temperature_units='fahrenheit'):
+    """
+    Parse a whitespace-delimited weather table and return a WeatherTable in mm and degrees Celsius.
+
+    precip_mm_per_unit      mm per unit of the precipitation column (25.4 for inches, 1 for mm).
+    temperature_units       'fahrenheit' or 'celsius'.
+    """
+    if temperature_units not in TEMPERATURE_UNITS:
+        raise ValueError(f"temperature_units must be one of {TEMPERATURE_UNITS}, not '{temperature_units}'")
+    df = pd.read_csv(filename, sep=r'\s+')
+    columns = _find_columns(df.columns, filename)
+    dates = pd.to_datetime(df[columns['date']]).to_numpy().astype('datetime64[D]')
+    if np.any(np.diff(dates) <= np.timedelta64(0, 'D')):
+        raise ValueError(f"{filename}: dates must be in increasing order, without repeats")
+
+    def temperature(column):
+        values = df[columns[column]].to_numpy(dtype=np.float64)
+        return (values - 32.) / 1.8 if temperature_units == 'fahrenheit' else values.copy()
+
+    return WeatherTable(dates, df[columns['prcp']].to_numpy(dtype=np.float64) * precip_mm_per_unit,
+                        temperature('tmin'), temperature('tmax'))
+
+
+def _source_signature(filename):
+    status = os.stat(filename)
+    return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+
+def _metadata_path(filename, cache_directory):
+    directory = pl.Path(cache_directory) if cache_directory is not None else filename.parent
+    return directory / f'{filename.name}.weather.json'
+
+
+def _read_metadata(json_path):
+    if not json_path.exists():
+        return {}
+    with open(json_path) as f:
+        return json.load(f)
+
+
+def _write_metadata(json_path, metadata):
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_json = json_path.with_name(f'{json_path.name}.{os.getpid()}.tmp')
+    with open(temporary_json, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(temporary_json, json_path)
+
+
+def weather_table_contents_hash(filename, cache_directory=None):
+    """
+    SHA-256 of the table's contents. The hash is kept in <name>.weather.json (in cache_directory, or beside
+    the table) with the table's size and modification time, and the file is read again only when they change.
+    """
+    filename = pl.Path(filename)
+    json_path = _metadata_path(filename, cache_directory)
+    signature = _source_signature(filename)
+    metadata = _read_metadata(json_path)
+    if 'sha256' in metadata and all(metadata.get(key) == value for key, value in signature.items()):
+        return metadata['sha256']
+
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    # keep the name of the current cache file, so cached_weather_table can delete it once it is superseded
+    _write_metadata(json_path, dict(metadata, **signature, sha256=digest.hexdigest()))
+    return digest.hexdigest()
+
+
+def weather_table_cache_key(filename, precip_mm_per_unit=25.4, temperature_units='fahrenheit', cache_directory=None):
+    """Hash of the table's contents (see weather_table_contents_hash) and of the unit conversion."""
+    digest = hashlib.sha256(weather_table_contents_hash(filename, cache_directory).encode())
+    digest.update(f'\0{precip_mm_per_unit!r}\0{temperature_units}'.encode())
+    return digest.hexdigest()
+
+
+def cached_weather_table(filename, precip_mm_per_unit=25.4, temperature_units='fahrenheit', cache_directory=None):
+    """
+    Return the WeatherTable of a weather table file, with columns that are rows of a read-only np.memmap of
+    <name>.<hash>.npy (in cache_directory, or beside the table). The cache is written on first use, and the
+    cache it replaces (the one named in <name>.weather.json) is deleted; see weather_table_cache_key for what
+    the hash covers.
+    """
+    filename = pl.Path(filename)
+    key = weather_table_cache_key(filename, precip_mm_per_unit, temperature_units, cache_directory)
+    directory = pl.Path(cache_directory) if cache_directory is not None else filename.parent
+    npy_path = directory / f'{filename.name}.{key[:16]}.npy'
+
+    if not npy_path.exists():
+        table = read_weather_table_text(filename, precip_mm_per_unit, temperature_units)
+        columns = np.stack([table.dates.astype(np.int64).astype(np.float64), table.precip_mm, table.tmin_c,
+                            table.tmax_c])
+        directory.mkdir(parents=True, exist_ok=True)
+        # write to a temporary name and rename, so concurrent readers never see a partial cache
+        temporary_npy = npy_path.with_name(f'{npy_path.name}.{os.getpid()}.tmp')
+        with open(temporary_npy, 'wb') as f:
+            np.save(f, columns)
+        os.replace(temporary_npy, npy_path)
+
+        json_path = _metadata_path(filename, cache_directory)
+        metadata = _read_metadata(json_path)
+        superseded = metadata.get('cache')
+        if superseded is not None and superseded != npy_path.name:
+            (directory / superseded).unlink(missing_ok=True)
+        _write_metadata(json_path, dict(metadata, cache=npy_path.name))
+
+    columns = np.load(npy_path, mmap_mode='r')
+    if columns.shape[0] != len(CACHE_ROWS):
+        raise ValueError(f"{npy_path} is not a weather table cache")
+    return WeatherTable(np.asarray(columns[0]).astype(np.int64).astype('datetime64[D]'), columns[1], columns[2],
+                        columns[3])